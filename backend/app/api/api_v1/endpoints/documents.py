@@ -1,17 +1,60 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
+import re
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import SessionLocal, get_db
 from app.api.deps import get_current_user
-from app.schemas.document import Document, DocumentUpdate, DocumentUploadResponse, DocumentSearchRequest, DocumentSearchResult
+from app.schemas.document import (
+    Document, DocumentListItem, DocumentUpdate, DocumentUploadResponse, DocumentSearchRequest, DocumentSearchResult,
+    DocumentBulkUploadResponse, DocumentBatchStatus, DocumentChunk
+)
 from app.services.document_service import DocumentService
+from app.utils.file_storage import FileTooLargeError
 from app.models.user import User
 
 router = APIRouter()
 
+# 正文流式响应每次从数据库读取的字符数与每次发送的字节数
+_CONTENT_READ_CHARS = 1024 * 1024
+_CONTENT_STREAM_BLOCK_SIZE = 64 * 1024
+_BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节范围，返回 [start, end) ；无Range头、格式不支持或多范围时返回None（返回完整内容）
+
+    范围无法满足时抛出 ValueError。
+    """
+    if not range_header:
+        return None
+    match = _BYTE_RANGE_RE.match(range_header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else size
+    else:
+        # 后缀范围：最后N个字节
+        start, end = max(0, size - int(match.group(2))), size
+    end = min(end, size)
+    if start >= size or start >= end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _iter_content(document_id: int, start: int, end: int):
+    """分块读取正文；响应在请求的数据库会话关闭后才发送，这里使用独立会话"""
+    db = SessionLocal()
+    try:
+        yield from DocumentService(db).iter_document_content(
+            document_id, start, end, _CONTENT_READ_CHARS, _CONTENT_STREAM_BLOCK_SIZE
+        )
+    finally:
+        db.close()
+
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     title: str = Form(None),
     current_user: User = Depends(get_current_user),
@@ -27,9 +70,6 @@ async def upload_document(
             title=title
         )
         
-        # 在后台处理文档
-        background_tasks.add_task(document_service.process_document, document.id)
-        
         return DocumentUploadResponse(
             message="Document uploaded successfully",
             document_id=document.id,
@@ -37,6 +77,11 @@ async def upload_document(
             status=document.status
         )
         
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -48,14 +93,87 @@ async def upload_document(
             detail=f"Failed to upload document: {str(e)}"
         )
 
-@router.get("/", response_model=List[Document])
+@router.post("/bulk", response_model=DocumentBulkUploadResponse)
+async def bulk_upload_documents(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """批量上传多个文件或zip/tar归档"""
+    document_service = DocumentService(db)
+
+    try:
+        batch_id, documents, skipped = await document_service.bulk_upload(
+            files=files,
+            user_id=current_user.id
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload documents: {str(e)}"
+        )
+
+    return DocumentBulkUploadResponse(
+        message="Documents uploaded successfully",
+        batch_id=batch_id,
+        document_count=len(documents),
+        document_ids=[document.id for document in documents],
+        skipped=skipped
+    )
+
+@router.get("/batches/{batch_id}", response_model=DocumentBatchStatus)
+async def get_batch_status(
+    batch_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取批量上传批次的处理进度"""
+    document_service = DocumentService(db)
+    batch_status = document_service.get_batch_status(
+        batch_id,
+        user_id=None if current_user.is_superuser else current_user.id
+    )
+
+    if not batch_status:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found"
+        )
+    return batch_status
+
+@router.post("/batches/{batch_id}/vectorize")
+async def vectorize_batch(
+    batch_id: str,
+    full: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """重新向量化批次中的全部文档（多个文档的文本块合并编码，full=true 时全量重建）"""
+    document_service = DocumentService(db)
+    batch_status = document_service.get_batch_status(
+        batch_id,
+        user_id=None if current_user.is_superuser else current_user.id
+    )
+
+    if not batch_status:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found"
+        )
+
+    # 提交后台重新向量化任务
+    document_service.enqueue_batch_vectorization(batch_id, incremental=not full)
+
+    return {"message": "Batch vectorization started"}
+
+@router.get("/", response_model=List[DocumentListItem])
 async def get_documents(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取当前用户的文档列表"""
+    """获取当前用户的文档列表（不含正文与摘要）"""
     document_service = DocumentService(db)
     documents = document_service.get_documents_by_user(
         user_id=current_user.id,
@@ -72,7 +190,7 @@ async def get_document(
 ):
     """获取指定文档"""
     document_service = DocumentService(db)
-    document = document_service.get_document(document_id)
+    document = document_service.get_document(document_id, with_content=False)
     
     if not document:
         raise HTTPException(
@@ -89,6 +207,92 @@ async def get_document(
     
     return document
 
+@router.get("/{document_id}/content")
+async def get_document_content(
+    document_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """以UTF-8纯文本流式返回文档正文，支持单个字节范围请求
+
+    正文按范围从数据库分块读取，不会整篇加载到内存。
+    """
+    document_service = DocumentService(db)
+    result = document_service.get_document_content_size(document_id)
+
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    owner_id, size = result
+    # 检查权限
+    if owner_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    if size is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document content not available"
+        )
+
+    try:
+        byte_range = _parse_byte_range(range_header, size)
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    start, end = byte_range or (0, size)
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start)}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return StreamingResponse(
+        _iter_content(document_id, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
+@router.get("/{document_id}/chunks/{chunk_id}", response_model=List[DocumentChunk])
+async def get_document_chunk(
+    document_id: int,
+    chunk_id: int,
+    window: int = Query(0, ge=0, le=10),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取检索命中的文本块及其前后 window 个相邻块（含字符与页码位置）"""
+    document_service = DocumentService(db)
+    metadata = document_service.get_documents_metadata([document_id]).get(document_id)
+
+    if not metadata:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    # 检查权限
+    if metadata.owner_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    chunks = document_service.get_chunk_context(document_id, chunk_id, window)
+    if chunks is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chunk not found"
+        )
+    return chunks
+
 @router.put("/{document_id}", response_model=Document)
 async def update_document(
     document_id: int,
@@ -98,7 +302,7 @@ async def update_document(
 ):
     """更新文档"""
     document_service = DocumentService(db)
-    document = document_service.get_document(document_id)
+    document = document_service.get_document(document_id, with_content=False)
     
     if not document:
         raise HTTPException(
@@ -151,7 +355,6 @@ async def delete_document(
 @router.post("/{document_id}/reprocess")
 async def reprocess_document(
     document_id: int,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -172,11 +375,42 @@ async def reprocess_document(
             detail="Not enough permissions"
         )
     
-    # 在后台重新处理文档
-    background_tasks.add_task(document_service.process_document, document.id)
+    # 提交后台重新处理任务（重新提取，不复用其他文档的结果）
+    document_service.enqueue_processing(document.id, reuse_existing=False)
     
     return {"message": "Document reprocessing started"}
 
+@router.get("/{document_id}/job")
+async def get_document_job(
+    document_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取文档处理任务状态"""
+    document_service = DocumentService(db)
+    document = document_service.get_document(document_id)
+
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    # 检查权限
+    if document.owner_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    job = document_service.get_processing_job(document_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
 @router.post("/search", response_model=List[DocumentSearchResult])
 async def search_documents(
     search_request: DocumentSearchRequest,
@@ -187,7 +421,7 @@ async def search_documents(
     document_service = DocumentService(db)
 
     try:
-        results = document_service.search_documents(search_request, current_user.id)
+        results = await document_service.search_documents_async(search_request, current_user.id)
         return results
     except Exception as e:
         raise HTTPException(
@@ -198,11 +432,11 @@ async def search_documents(
 @router.post("/{document_id}/vectorize")
 async def vectorize_document(
     document_id: int,
-    background_tasks: BackgroundTasks,
+    full: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """重新向量化文档"""
+    """重新向量化文档（默认只重新编码变化的文本块，full=true 时全量重建）"""
     document_service = DocumentService(db)
     document = document_service.get_document(document_id)
 
@@ -219,7 +453,7 @@ async def vectorize_document(
             detail="Not enough permissions"
         )
 
-    # 在后台重新向量化文档
-    background_tasks.add_task(document_service.reprocess_document_vectors, document.id)
+    # 提交后台重新向量化任务
+    document_service.enqueue_vectorization(document.id, incremental=not full)
 
     return {"message": "Document vectorization started"}
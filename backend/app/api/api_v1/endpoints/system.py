@@ -0,0 +1,55 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.api.deps import get_current_active_superuser
+from app.services.embedding_service import embedding_service
+from app.services.embedding_batcher import query_batcher
+from app.services.inference_executor import inference_executor
+from app.services.extraction_cache import extraction_cache
+from app.services.job_queue import job_queue
+from app.services.vector_service import milvus_service
+from app.services.document_cache import document_metadata_cache
+from app.models.user import User
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_system_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取推理与缓存统计信息（仅超级用户）"""
+    return {
+        "embedding_cache": embedding_service.get_cache_stats(),
+        "rerank_cache": embedding_service.get_rerank_cache_stats(),
+        "query_batcher": query_batcher.get_stats(),
+        "inference_executor": inference_executor.get_stats(),
+        "job_queue": job_queue.get_stats(),
+        "milvus_collection": milvus_service.get_load_state(),
+        "milvus_write_buffer": milvus_service.write_buffer.get_stats() if milvus_service.write_buffer is not None else None,
+        "document_cache": document_metadata_cache.get_stats() if document_metadata_cache is not None else None
+    }
+
+@router.get("/extraction-cache")
+async def get_extraction_cache_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取提取文本缓存的大小与命中统计（仅超级用户）"""
+    if extraction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **extraction_cache.get_stats()}
+
+@router.delete("/extraction-cache")
+async def evict_extraction_cache(
+    content_hash: Optional[str] = None,
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """删除指定文件哈希的缓存条目，不指定时清空缓存（仅超级用户）"""
+    if extraction_cache is None:
+        return {"enabled": False, "removed": 0}
+    try:
+        removed = extraction_cache.evict(content_hash)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return {"enabled": True, "removed": removed}
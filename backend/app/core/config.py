@@ -17,6 +17,16 @@ class Settings(BaseSettings):
     MILVUS_HOST: str = "localhost"
     MILVUS_PORT: int = 19530
     MILVUS_COLLECTION_NAME: str = "documents"
+    MILVUS_NUM_PARTITIONS: int = 64  # 按 owner_id 分区键划分的分区数
+    MILVUS_LOAD_ON_STARTUP: bool = True  # 启动时加载集合，加载完成前就绪检查返回503
+    MILVUS_IDLE_RELEASE_SECONDS: int = 0  # 集合空闲超过该时间后释放查询节点内存，0表示不释放
+    MILVUS_POOL_SIZE: int = 4  # 连接池中的连接数（每个连接一条gRPC通道）
+    MILVUS_SEARCH_TIMEOUT_SECONDS: float = 10.0  # 检索与查询的截止时间（含重试）
+    MILVUS_WRITE_TIMEOUT_SECONDS: float = 60.0  # 写入、删除与落盘的截止时间
+    MILVUS_LOAD_TIMEOUT_SECONDS: float = 600.0  # 加载集合的截止时间
+    MILVUS_MAX_RETRIES: int = 2  # 可重试错误的最大重试次数（插入不重试）
+    MILVUS_RETRY_BACKOFF_SECONDS: float = 0.2
+    MILVUS_UNHEALTHY_COOLDOWN_SECONDS: float = 10.0  # 连接出错后暂停使用的时间，之后重新连接
     
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379"
@@ -34,8 +44,81 @@ class Settings(BaseSettings):
     # AI模型配置
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # torch, onnx 或 onnx-int8
+    ONNX_MODEL_DIR: str = "./onnx_models"
+    EMBEDDING_PARITY_CHECK: bool = True
+    EMBEDDING_PARITY_THRESHOLD: float = 0.99
+    EMBEDDING_BATCH_SIZE: int = 64  # 单批最多文本数
+    EMBEDDING_TOKEN_BUDGET: int = 8192  # 单批 批大小×最长序列 的token上限
+    RERANK_ENABLED: bool = True
+    RERANK_TOP_N: int = 20  # 只对前N个向量检索候选重排序
+    RERANK_BATCH_SIZE: int = 8
+    RERANK_TIMEOUT_MS: float = 300.0  # 单次请求的重排序延迟预算
+    RERANK_CACHE_ENABLED: bool = True
+    RERANK_CACHE_MAX_ENTRIES: int = 50000
+    RERANK_CACHE_TTL_SECONDS: int = 3600
+    SIMILARITY_MAX_MEMORY_MB: int = 256  # 批量相似度分块计算的内存上限
     CHUNK_SIZE: int = 512
     CHUNK_OVERLAP: int = 50
+    CHUNK_STRATEGY: str = "token"  # token：按分词器token数分块；char：按字符数分块
+    CHUNK_MAX_TOKENS: int = 0  # 0表示使用模型最大序列长度（扣除特殊token）
+    CHUNK_OVERLAP_TOKENS: int = 32
+
+    # 嵌入缓存配置
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_MEMORY_MB: int = 64
+    EMBEDDING_CACHE_DIR: str = ""  # 为空时只使用内存缓存
+    EMBEDDING_STORAGE_DTYPE: str = "float32"  # 缓存存储与跨进程传输精度：float32 或 float16
+
+    # 查询微批处理配置
+    QUERY_BATCHING_ENABLED: bool = True
+    QUERY_BATCH_MAX_SIZE: int = 32
+    QUERY_BATCH_WAIT_MS: float = 3.0
+
+    # 推理执行器配置
+    INFERENCE_EXECUTOR: str = "thread"  # thread 或 process
+    INFERENCE_WORKERS: int = 4
+    INFERENCE_MAX_PENDING: int = 64
+
+    # 流式入库流水线配置
+    INGEST_EMBED_BATCH_SIZE: int = 64  # 每次编码的文本块数
+    INGEST_INSERT_BATCH_SIZE: int = 512  # 每次写入Milvus的向量数
+    INGEST_QUEUE_SIZE: int = 4  # 阶段间队列长度（批次数）
+
+    # Milvus写缓冲配置：跨文档合并插入与删除
+    MILVUS_WRITE_BUFFER_ENABLED: bool = True
+    MILVUS_WRITE_BUFFER_MAX_ROWS: int = 2048  # 累计行数达到该值时发送
+    MILVUS_WRITE_BUFFER_MAX_DELAY_SECONDS: float = 2.0  # 最早的写入超过该时间时发送
+    MILVUS_WRITE_BUFFER_MAX_PENDING_ROWS: int = 16384  # 发送失败时最多保留的行数，超过后拒绝新的插入
+
+    # PDF并行提取配置
+    PDF_EXTRACT_WORKERS: int = 4  # 小于等于1时不使用进程池
+    PDF_PARALLEL_MIN_PAGES: int = 64  # 达到该页数才并行提取
+    PDF_PAGES_PER_TASK: int = 0  # 每个进程池任务提取的页数，0表示按进程数自动划分
+
+    # 提取文本缓存配置
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_DIR: str = "./extraction_cache"
+    EXTRACTION_CACHE_MAX_MB: int = 1024
+
+    # 文档元数据缓存配置（检索结果组装使用）
+    DOCUMENT_CACHE_ENABLED: bool = True
+    DOCUMENT_CACHE_MAX_ENTRIES: int = 10000
+    DOCUMENT_CACHE_TTL_SECONDS: int = 300
+
+    # 文档处理任务队列配置
+    JOB_QUEUE_BACKEND: str = "auto"  # redis、sqlite，或 auto（Redis不可用时使用SQLite）
+    JOB_QUEUE_SQLITE_PATH: str = "./jobs.db"
+    JOB_WORKERS: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0
+    JOB_LEASE_SECONDS: float = 300.0
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+
+    # 批量上传配置
+    BULK_MAX_FILES: int = 5000  # 单次批量上传最多导入的文件数
+    BULK_ARCHIVE_MAX_SIZE: int = 1024 * 1024 * 1024  # 归档文件大小上限（1GB）
+    BULK_COMMIT_BATCH_SIZE: int = 200  # 每个数据库事务创建的文档数
     
     # CORS配置
     CORS_ORIGINS: str = "http://localhost:5173,http://127.0.0.1:5173,http://localhost:5174,http://127.0.0.1:5174"
@@ -6,11 +6,17 @@ from pathlib import Path
 
 from app.core.config import settings
 from app.api.api_v1.api import api_router
-from app.core.database import engine
+from app.core.database import engine, add_missing_columns
 from app.models import Base
+from app.services.inference_executor import inference_executor
+from app.services.job_queue import job_queue
+from app.services.vector_service import milvus_service
+from app.services import document_service  # 注册文档处理任务
+from app.utils.file_processor import shutdown_pdf_executor
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -39,6 +45,21 @@ app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads"
 # 包含API路由
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("startup")
+async def startup_event():
+    """启动文档处理工作线程，在后台加载向量集合"""
+    job_queue.start()
+    milvus_service.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止文档处理工作线程，发送Milvus写缓冲，关闭推理执行器与PDF提取进程池"""
+    job_queue.stop(timeout=5)
+    milvus_service.drain_writes()
+    milvus_service.stop()
+    inference_executor.shutdown(wait=False)
+    shutdown_pdf_executor(wait=False)
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -53,6 +74,15 @@ async def health_check():
     """接口测试"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查：向量集合启动加载完成前或Milvus连接全部不可用时返回503"""
+    if not milvus_service.is_ready():
+        raise HTTPException(status_code=503, detail="Vector collection is loading")
+    if not milvus_service.pool.is_healthy():
+        raise HTTPException(status_code=503, detail="No healthy Milvus connection")
+    return {"status": "ready", "vector_collection": milvus_service.get_load_state()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,6 +1,8 @@
 from app.core.database import Base
 from .user import User
 from .document import Document
+from .file_blob import FileBlob
+from .document_chunk import DocumentChunk
 from .chat import Chat, Message
 
-__all__ = ["Base", "User", "Document", "Chat", "Message"]
+__all__ = ["Base", "User", "Document", "FileBlob", "DocumentChunk", "Chat", "Message"]
@@ -14,6 +14,9 @@ class Document(Base):
     file_size = Column(BigInteger)  # 文件大小（字节）
     file_type = Column(String(50))  # 文件类型
     mime_type = Column(String(100))
+    content_hash = Column(String(64), index=True)  # 文件内容SHA-256
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), index=True)  # 共享的文件内容
+    batch_id = Column(String(36), index=True)  # 批量上传批次ID
     
     # 文档内容
     content = Column(Text)  # 提取的文本内容
@@ -41,6 +44,7 @@ class Document(Base):
     
     # 关系
     owner = relationship("User", back_populates="documents")
+    blob = relationship("FileBlob", back_populates="documents")
     
     def __repr__(self):
         return f"<Document(id={self.id}, title='{self.title}', status='{self.status}')>"
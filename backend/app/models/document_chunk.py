@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, LargeBinary, UniqueConstraint
+from app.core.database import Base
+
+class DocumentChunk(Base):
+    """文档文本块（压缩存储），向量库中只保存ID与向量"""
+    __tablename__ = "document_chunks"
+    __table_args__ = (UniqueConstraint("document_id", "chunk_id", name="uq_document_chunks_document_chunk"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_id = Column(Integer, nullable=False)  # 与Milvus中的 chunk_id 一致
+    ordinal = Column(Integer, nullable=False)  # 文本块在文档中的顺序（增量更新后与 chunk_id 不一定相同）
+    
+    # 在全文中的位置（迁移回填时可能未知）
+    char_start = Column(Integer)
+    char_end = Column(Integer)
+    page_start = Column(Integer)  # 起始页/段（从1开始）
+    page_end = Column(Integer)
+    
+    token_count = Column(Integer)
+    content_hash = Column(String(64), nullable=False)  # 文本SHA-256，与Milvus中的 chunk_hash 一致
+    compression = Column(String(10), nullable=False)  # zstd 或 zlib
+    content = Column(LargeBinary, nullable=False)  # 压缩后的文本
+    
+    def __repr__(self):
+        return f"<DocumentChunk(document_id={self.document_id}, chunk_id={self.chunk_id}, ordinal={self.ordinal})>"
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+
+class FileBlob(Base):
+    """按内容寻址的上传文件，多个文档可以引用同一文件"""
+    __tablename__ = "file_blobs"
+    __table_args__ = (UniqueConstraint("sha256", "file_type", name="uq_file_blobs_sha256_type"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False, index=True)  # 文件内容SHA-256
+    file_type = Column(String(50), nullable=False)  # 文件类型（决定提取方式）
+    file_path = Column(String(500), nullable=False)
+    file_size = Column(BigInteger)  # 文件大小（字节）
+    ref_count = Column(Integer, default=0, nullable=False)  # 引用该文件的文档数
+    
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # 关系
+    documents = relationship("Document", back_populates="blob")
+    
+    def __repr__(self):
+        return f"<FileBlob(id={self.id}, sha256='{self.sha256}', ref_count={self.ref_count})>"
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -17,21 +17,20 @@ class DocumentUpdate(BaseModel):
     tags: Optional[str] = None
     summary: Optional[str] = None
 
-class DocumentInDB(DocumentBase):
-    """数据库中的文档模式"""
+class DocumentListItem(DocumentBase):
+    """文档列表项（不含正文与摘要，正文通过 /documents/{id}/content 获取）"""
     id: int
     filename: str
     file_path: str
     file_size: Optional[int] = None
     file_type: Optional[str] = None
     mime_type: Optional[str] = None
-    content: Optional[str] = None
-    summary: Optional[str] = None
     status: str
     error_message: Optional[str] = None
     is_vectorized: bool
     vector_count: int
-    metadata: Optional[str] = None
+    # 模型中的列名为 doc_metadata（metadata 是SQLAlchemy保留属性）
+    metadata: Optional[str] = Field(None, validation_alias="doc_metadata")
     owner_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -40,9 +39,14 @@ class DocumentInDB(DocumentBase):
     class Config:
         from_attributes = True
 
-class Document(DocumentInDB):
-    """文档响应模式"""
-    pass
+class DocumentInDB(DocumentListItem):
+    """数据库中的文档模式"""
+    content: Optional[str] = None
+    summary: Optional[str] = None
+
+class Document(DocumentListItem):
+    """文档响应模式（不含正文，正文通过 /documents/{id}/content 获取）"""
+    summary: Optional[str] = None
 
 class DocumentUploadResponse(BaseModel):
     """文档上传响应"""
@@ -51,11 +55,46 @@ class DocumentUploadResponse(BaseModel):
     filename: str
     status: str
 
+class DocumentBulkSkipped(BaseModel):
+    """批量上传中跳过的文件"""
+    filename: str
+    reason: str
+
+class DocumentBulkUploadResponse(BaseModel):
+    """批量上传响应"""
+    message: str
+    batch_id: str
+    document_count: int
+    document_ids: List[int]
+    skipped: List[DocumentBulkSkipped] = []
+
+class DocumentBatchStatus(BaseModel):
+    """批量上传批次的处理进度"""
+    batch_id: str
+    total: int
+    pending: int
+    processing: int
+    completed: int
+    failed: int
+    job: Optional[dict] = None
+
+class DocumentChunk(BaseModel):
+    """文档文本块（用于引用定位与相邻块扩展）"""
+    chunk_id: int
+    ordinal: int
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    token_count: Optional[int] = None
+    content: str
+
 class DocumentSearchRequest(BaseModel):
     """文档搜索请求"""
     query: str
     limit: int = 10
     threshold: float = 0.7
+    rerank: Optional[bool] = None  # 为空时使用 RERANK_ENABLED 配置
 
 class DocumentSearchResult(BaseModel):
     """文档搜索结果"""
@@ -64,3 +103,4 @@ class DocumentSearchResult(BaseModel):
     content: str
     score: float
     metadata: Optional[dict] = None
+    rerank_completed: Optional[bool] = None  # 未进行重排序时为空
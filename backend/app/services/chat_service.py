@@ -292,7 +292,7 @@ class ChatService:
                 threshold=0.6
             )
 
-            search_results = document_service.search_documents(search_request, user_id)
+            search_results = await document_service.search_documents_async(search_request, user_id)
 
             # 提取文档内容
             relevant_docs = []
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class DocumentMetadata:
+    """检索结果组装所需的文档元数据（不含正文）"""
+    id: int
+    title: str
+    owner_id: int
+
+
+class DocumentMetadataCache:
+    """文档元数据的进程内缓存
+
+    支持TTL过期与LRU淘汰，文档更新或删除时按ID失效。
+    多个工作进程各自持有一份缓存，其他进程中的修改最多在TTL后可见。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[DocumentMetadata, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def get_many(self, document_ids: Iterable[int]) -> Tuple[Dict[int, DocumentMetadata], List[int]]:
+        """批量查询，返回 (命中的元数据, 未命中的ID)"""
+        now = time.monotonic()
+        found: Dict[int, DocumentMetadata] = {}
+        missing: List[int] = []
+        with self._lock:
+            for document_id in document_ids:
+                entry = self._entries.get(document_id)
+                if entry is not None and entry[1] < now:
+                    del self._entries[document_id]
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    missing.append(document_id)
+                else:
+                    self._entries.move_to_end(document_id)
+                    self.hits += 1
+                    found[document_id] = entry[0]
+        return found, missing
+
+    def put_many(self, items: Iterable[DocumentMetadata]):
+        """批量写入"""
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for item in items:
+                self._entries.pop(item.id, None)
+                self._entries[item.id] = (item, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, document_id: int):
+        """失效指定文档"""
+        with self._lock:
+            if self._entries.pop(document_id, None) is not None:
+                self.invalidated += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """获取缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _create_document_cache() -> Optional[DocumentMetadataCache]:
+    if not settings.DOCUMENT_CACHE_ENABLED:
+        return None
+    return DocumentMetadataCache(
+        max_entries=settings.DOCUMENT_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.DOCUMENT_CACHE_TTL_SECONDS
+    )
+
+
+# 全局文档元数据缓存实例（未启用时为None）
+document_metadata_cache = _create_document_cache()
@@ -1,19 +1,95 @@
 import os
 import uuid
 import logging
-from typing import Optional, List
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Iterable, Iterator, Set, Tuple
 from pathlib import Path
-from sqlalchemy.orm import Session
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import LargeBinary, cast, func
+from sqlalchemy.orm import Session, defer
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 from app.models.document import Document
+from app.models.file_blob import FileBlob
+from app.models.document_chunk import DocumentChunk
 from app.schemas.document import DocumentUpdate, DocumentSearchRequest, DocumentSearchResult
 from app.core.config import settings
+from app.core.database import SessionLocal
 from app.utils.file_processor import FileProcessor
-from app.services.vector_service import milvus_service
+from app.utils.compression import compress_text, decompress_text
+from app.utils.text_chunker import ChunkSpan
+from app.utils.file_storage import (
+    FileTooLargeError, StoredFile, is_archive, iter_archive_entries, save_stream, save_upload_file
+)
+from app.services.vector_service import milvus_service, chunk_hash
 from app.services.embedding_service import embedding_service
+from app.services.embedding_batcher import encode_query_async
+from app.services.ingest_pipeline import IngestPipeline
+from app.services.extraction_cache import extraction_cache
+from app.services.job_queue import job_queue, QUEUED, RETRYING, RUNNING
+from app.services.document_cache import DocumentMetadata, document_metadata_cache
 
 logger = logging.getLogger(__name__)
 
+# 提取文本在内存中暂存的上限，超过后转存到临时文件
+_CONTENT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+# 任务队列中的任务类型
+PROCESS_DOCUMENT_JOB = "process_document"
+VECTORIZE_DOCUMENT_JOB = "vectorize_document"
+PROCESS_BATCH_JOB = "process_batch"
+VECTORIZE_BATCH_JOB = "vectorize_batch"
+
+
+def document_job_key(document_id: int) -> str:
+    """同一文档的处理与重新向量化任务共用一个键，不会并发执行"""
+    return f"document:{document_id}"
+
+
+def batch_job_key(batch_id: str) -> str:
+    """同一批次的处理与重新向量化任务共用一个键，不会并发执行"""
+    return f"batch:{batch_id}"
+
+
+@dataclass
+class _VectorUpdate:
+    """文档向量更新计划：需要编码写入的新文本块与需要删除的旧向量"""
+    spans: List[ChunkSpan]
+    chunk_ids: List[int]  # 每个文本块的编号
+    new_chunks: List[str]  # 需要编码的块，编号从 first_new_chunk_id 开始连续分配
+    first_new_chunk_id: int
+    removed_ids: List[int] = field(default_factory=list)  # 需要删除的旧向量主键
+    full: bool = False  # 全量重建：写入前删除文档的全部旧向量，页码未知
+
+
+def _chunk_mapping(document_id: int, chunk_id: int, ordinal: int, span: ChunkSpan,
+                   with_pages: bool = True) -> dict:
+    """文本块表的一行（文本压缩存储）"""
+    content, compression = compress_text(span.text)
+    return {
+        "document_id": document_id,
+        "chunk_id": chunk_id,
+        "ordinal": ordinal,
+        "char_start": span.char_start,
+        "char_end": span.char_end,
+        "page_start": span.page_start if with_pages else None,
+        "page_end": span.page_end if with_pages else None,
+        "token_count": span.token_count,
+        "content_hash": chunk_hash(span.text),
+        "compression": compression,
+        "content": content,
+    }
+
+
+def _blob_path(sha256: str, file_type: str) -> Path:
+    """内容寻址的文件存放路径"""
+    return Path(settings.UPLOAD_DIR) / "blobs" / sha256[:2] / f"{sha256}.{file_type}"
+
 class DocumentService:
     """文档服务类"""
     
@@ -21,14 +97,18 @@ class DocumentService:
         self.db = db
         self.file_processor = FileProcessor()
     
-    def get_document(self, document_id: int) -> Optional[Document]:
-        """根据ID获取文档"""
-        return self.db.query(Document).filter(Document.id == document_id).first()
+    def get_document(self, document_id: int, with_content: bool = True) -> Optional[Document]:
+        """根据ID获取文档；with_content=False 时不加载正文"""
+        query = self.db.query(Document)
+        if not with_content:
+            query = query.options(defer(Document.content))
+        return query.filter(Document.id == document_id).first()
     
     def get_documents_by_user(self, user_id: int, skip: int = 0, limit: int = 100) -> List[Document]:
-        """获取用户的文档列表"""
+        """获取用户的文档列表（延迟加载正文与摘要）"""
         return (
             self.db.query(Document)
+            .options(defer(Document.content), defer(Document.summary))
             .filter(Document.owner_id == user_id)
             .offset(skip)
             .limit(limit)
@@ -36,8 +116,59 @@ class DocumentService:
         )
     
     def get_documents(self, skip: int = 0, limit: int = 100) -> List[Document]:
-        """获取所有文档列表"""
-        return self.db.query(Document).offset(skip).limit(limit).all()
+        """获取所有文档列表（延迟加载正文与摘要）"""
+        return (
+            self.db.query(Document)
+            .options(defer(Document.content), defer(Document.summary))
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+
+    def _byte_length(self, expression):
+        """文本的UTF-8字节数（SQLite没有 octet_length，转换为BLOB后取长度）"""
+        if self.db.get_bind().dialect.name == "sqlite":
+            return func.length(cast(expression, LargeBinary))
+        return func.octet_length(expression)
+
+    def get_document_content_size(self, document_id: int) -> Optional[Tuple[int, Optional[int]]]:
+        """只查询文档的所有者与正文的UTF-8字节数（不加载正文），文档不存在时返回None"""
+        row = (
+            self.db.query(Document.owner_id, self._byte_length(Document.content).label("size"))
+            .filter(Document.id == document_id)
+            .first()
+        )
+        return (row.owner_id, row.size) if row else None
+
+    def iter_document_content(self, document_id: int, start: int, end: int,
+                              read_chars: int, block_size: int) -> Iterator[bytes]:
+        """按字节范围 [start, end) 返回正文的UTF-8编码，每段不超过 block_size 字节
+
+        每次用 substr 从数据库读取 read_chars 个字符，整篇正文不会加载到内存；
+        PostgreSQL每次 substr 都要解压整个TOAST值，read_chars 应远大于 block_size 以减少查询次数。
+        范围起点之前的部分只查询字节数，不读取文本。
+        """
+        offset = 0  # 当前读取段起点的字节偏移
+        position = 1  # 当前读取段起点的字符位置（SQL从1开始计数）
+        while offset < end:
+            piece = func.substr(Document.content, position, read_chars)
+            if offset < start:
+                size = self.db.query(self._byte_length(piece)).filter(Document.id == document_id).scalar()
+                if not size:
+                    return
+                if offset + size <= start:
+                    offset += size
+                    position += read_chars
+                    continue
+            text = self.db.query(piece).filter(Document.id == document_id).scalar()
+            if not text:
+                return
+            data = text.encode("utf-8")
+            view = memoryview(data)
+            for block_start in range(max(0, start - offset), min(len(data), end - offset), block_size):
+                yield bytes(view[block_start:min(block_start + block_size, len(data), end - offset)])
+            offset += len(data)
+            position += read_chars
     
     async def upload_document(
         self, 
@@ -52,20 +183,27 @@ class DocumentService:
             raise ValueError(f"File type {file_extension} not allowed")
         
         # 生成唯一文件名
-        unique_filename = f"{uuid.uuid4()}_{file.filename}"
-        file_path = Path(settings.UPLOAD_DIR) / unique_filename
+        unique_filename = f"{uuid.uuid4()}_{Path(file.filename).name}"
         
-        # 保存文件
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # 流式保存文件，超过大小限制时抛出 FileTooLargeError
+        stored = await save_upload_file(
+            file,
+            directory=settings.UPLOAD_DIR,
+            filename=unique_filename,
+            max_size=settings.MAX_FILE_SIZE
+        )
+        
+        # 内容相同的文件只保存一份
+        blob = self._acquire_blob(stored, file_extension)
         
         # 创建文档记录
         document = Document(
             title=title or file.filename,
             filename=file.filename,
-            file_path=str(file_path),
-            file_size=len(content),
+            file_path=blob.file_path,
+            file_size=stored.size,
+            content_hash=stored.sha256,
+            blob_id=blob.id,
             file_type=file_extension,
             mime_type=file.content_type,
             owner_id=user_id,
@@ -76,16 +214,554 @@ class DocumentService:
         self.db.commit()
         self.db.refresh(document)
 
-        # 自动开始处理文档
-        try:
-            self.process_document(document.id)
-        except Exception as e:
-            print(f"自动处理文档失败: {e}")
+        # 提交后台处理任务，上传请求不等待处理完成
+        self.enqueue_processing(document.id)
 
         return document
+
+    async def bulk_upload(self, files: List[UploadFile], user_id: int) -> Tuple[str, List[Document], List[dict]]:
+        """批量上传多个文件或zip/tar归档
+
+        文件逐个流式保存，文档记录按 BULK_COMMIT_BATCH_SIZE 分批提交，
+        全部文档作为一个批次提交给后台处理。每次提交后即提交（或更新）批次任务，
+        上传中途失败时已提交的文档也会被处理。返回 (批次ID, 文档列表, 跳过的文件)。
+        """
+        batch_id = uuid.uuid4().hex
+        documents: List[Document] = []
+        skipped: List[dict] = []
+
+        def add_document(stored: StoredFile, filename: str, title: str, mime_type: Optional[str]):
+            file_extension = Path(filename).suffix.lower().lstrip('.')
+            blob = self._acquire_blob(stored, file_extension)
+            document = Document(
+                title=title,
+                filename=filename,
+                file_path=blob.file_path,
+                file_size=stored.size,
+                content_hash=stored.sha256,
+                blob_id=blob.id,
+                batch_id=batch_id,
+                file_type=file_extension,
+                mime_type=mime_type,
+                owner_id=user_id,
+                status="pending"
+            )
+            self.db.add(document)
+            documents.append(document)
+            if len(documents) % settings.BULK_COMMIT_BATCH_SIZE == 0:
+                self.db.commit()
+                self.enqueue_batch_processing(batch_id)
+
+        for file in files:
+            if is_archive(file.filename):
+                try:
+                    archive = await save_upload_file(
+                        file,
+                        directory=settings.UPLOAD_DIR,
+                        filename=f".{uuid.uuid4().hex}.archive",
+                        max_size=settings.BULK_ARCHIVE_MAX_SIZE
+                    )
+                except FileTooLargeError as e:
+                    skipped.append({"filename": file.filename, "reason": str(e)})
+                    continue
+                try:
+                    remaining = settings.BULK_MAX_FILES - len(documents)
+                    entries = await run_in_threadpool(self._store_archive_entries, archive.path, remaining, skipped)
+                finally:
+                    os.remove(archive.path)
+                for entry_name, stored in entries:
+                    add_document(stored, Path(entry_name).name, entry_name, None)
+                continue
+
+            filename = Path(file.filename).name
+            reason = self._bulk_skip_reason(filename, len(documents))
+            if reason:
+                skipped.append({"filename": file.filename, "reason": reason})
+                continue
+            try:
+                stored = await save_upload_file(
+                    file,
+                    directory=settings.UPLOAD_DIR,
+                    filename=f"{uuid.uuid4()}_{filename}",
+                    max_size=settings.MAX_FILE_SIZE
+                )
+            except FileTooLargeError as e:
+                skipped.append({"filename": file.filename, "reason": str(e)})
+                continue
+            add_document(stored, filename, filename, file.content_type)
+
+        self.db.commit()
+        if documents:
+            self.enqueue_batch_processing(batch_id)
+        logger.info(f"Bulk upload {batch_id}: {len(documents)} documents, {len(skipped)} skipped")
+        return batch_id, documents, skipped
+
+    @staticmethod
+    def _bulk_skip_reason(filename: str, accepted: int) -> Optional[str]:
+        """批量上传中跳过文件的原因，可以导入时返回None"""
+        if accepted >= settings.BULK_MAX_FILES:
+            return f"Too many files (limit {settings.BULK_MAX_FILES})"
+        if not filename or filename.startswith('.'):
+            return "Hidden file"
+        file_extension = Path(filename).suffix.lower().lstrip('.')
+        if file_extension not in settings.allowed_extensions_list:
+            return f"File type {file_extension} not allowed"
+        return None
+
+    def _store_archive_entries(self, archive_path: Path, remaining: int, skipped: List[dict]) -> List[Tuple[str, StoredFile]]:
+        """流式保存归档中的文件（在线程池中运行，不访问数据库会话）"""
+        entries: List[Tuple[str, StoredFile]] = []
+        try:
+            for entry_name, open_entry in iter_archive_entries(archive_path):
+                filename = Path(entry_name).name
+                reason = self._bulk_skip_reason(filename, settings.BULK_MAX_FILES - remaining + len(entries))
+                if reason is None and "__MACOSX" in Path(entry_name).parts:
+                    reason = "Hidden file"
+                if reason:
+                    skipped.append({"filename": entry_name, "reason": reason})
+                    continue
+                try:
+                    with open_entry() as stream:
+                        stored = save_stream(
+                            stream,
+                            directory=settings.UPLOAD_DIR,
+                            filename=f"{uuid.uuid4()}_{filename}",
+                            max_size=settings.MAX_FILE_SIZE
+                        )
+                except FileTooLargeError as e:
+                    skipped.append({"filename": entry_name, "reason": str(e)})
+                    continue
+                entries.append((entry_name, stored))
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            skipped.append({"filename": archive_path.name, "reason": f"Invalid archive: {e}"})
+        return entries
+
+    def enqueue_batch_processing(self, batch_id: str) -> bool:
+        """提交批次处理任务"""
+        return job_queue.enqueue(batch_job_key(batch_id), PROCESS_BATCH_JOB, {"batch_id": batch_id})
+
+    def get_batch_status(self, batch_id: str, user_id: Optional[int] = None) -> Optional[dict]:
+        """获取批次中各状态的文档数与批次任务状态"""
+        query = self.db.query(Document.status, func.count(Document.id)).filter(Document.batch_id == batch_id)
+        if user_id is not None:
+            query = query.filter(Document.owner_id == user_id)
+        counts = dict(query.group_by(Document.status).all())
+        if not counts:
+            return None
+        return {
+            "batch_id": batch_id,
+            "total": sum(counts.values()),
+            "pending": counts.get("pending", 0),
+            "processing": counts.get("processing", 0),
+            "completed": counts.get("completed", 0),
+            "failed": counts.get("failed", 0),
+            "job": job_queue.get_job(batch_job_key(batch_id))
+        }
+
+    def process_batch(self, batch_id: str) -> int:
+        """处理批次中尚未完成的文档，返回处理成功的文档数
+
+        先逐个提取并分块，再把多个文档的文本块合并编码（小文档也能填满编码批次），
+        向量由写缓冲跨文档合并，全部写入后统一flush Milvus，成功后才把这些文档标记为完成；
+        flush失败时抛出异常，文档保持处理中状态，由任务队列重试批次。
+        """
+        document_ids = [
+            document_id for (document_id,) in
+            self.db.query(Document.id)
+            .filter(Document.batch_id == batch_id, Document.status.in_(["pending", "processing"]))
+            .order_by(Document.id)
+            .all()
+        ]
+        processed_ids = [
+            document_id for document_id in document_ids
+            if self.process_document(document_id, flush=False, vectorize=False, defer_completion=True)
+        ]
+        failed_ids = self._vectorize_chunked_documents(processed_ids)
+        processed_ids = [document_id for document_id in processed_ids if document_id not in failed_ids]
+        if not milvus_service.flush():
+            raise RuntimeError(f"Failed to flush vectors of batch {batch_id} to Milvus")
+        for start in range(0, len(processed_ids), settings.BULK_COMMIT_BATCH_SIZE):
+            self.db.query(Document).filter(
+                Document.id.in_(processed_ids[start:start + settings.BULK_COMMIT_BATCH_SIZE])
+            ).update({
+                Document.status: "completed",
+                Document.is_vectorized: Document.vector_count > 0
+            }, synchronize_session=False)
+        self.db.commit()
+        logger.info(f"Processed {len(processed_ids)}/{len(document_ids)} documents of batch {batch_id}")
+        return len(processed_ids)
+
+    def _vectorize_chunked_documents(self, document_ids: List[int]) -> Set[int]:
+        """为已分块、尚无向量的文档编码并写入向量，返回写入失败的文档ID
+
+        文本块按文档顺序从文本块表分窗读取，凑满 INGEST_INSERT_BATCH_SIZE 个后跨文档合并编码；
+        大文档拆到多个组中，内存占用与文档大小无关。复用了其他文档向量的文档已有向量数，直接跳过。
+        """
+        group_size = settings.INGEST_INSERT_BATCH_SIZE
+        group: List[Tuple[int, Optional[int], List[int], List[str]]] = []
+        vector_counts: Dict[int, int] = {}
+        failed_ids: Set[int] = set()
+
+        def write_group():
+            embeddings = embedding_service.encode_document_batches([texts for _, _, _, texts in group])
+            for (document_id, owner_id, chunk_ids, texts), vectors in zip(group, embeddings):
+                if document_id in failed_ids:
+                    continue
+                if milvus_service.insert_vectors(
+                    document_id=document_id,
+                    chunks=texts,
+                    embeddings=vectors,
+                    metadata=[f"doc_{document_id}_chunk_{chunk_id}" for chunk_id in chunk_ids],
+                    chunk_ids=chunk_ids,
+                    flush=False,
+                    owner_id=owner_id
+                ):
+                    vector_counts[document_id] = vector_counts.get(document_id, 0) + len(texts)
+                else:
+                    failed_ids.add(document_id)
+            group.clear()
+
+        pending = 0
+        for document_id in document_ids:
+            row = self.db.query(Document.owner_id, Document.vector_count).filter(Document.id == document_id).first()
+            if row is None or row.vector_count:
+                continue
+            last_chunk_id = -1
+            while True:
+                rows = (
+                    self.db.query(DocumentChunk.chunk_id, DocumentChunk.compression, DocumentChunk.content)
+                    .filter(DocumentChunk.document_id == document_id, DocumentChunk.chunk_id > last_chunk_id)
+                    .order_by(DocumentChunk.chunk_id)
+                    .limit(group_size - pending)
+                    .all()
+                )
+                if not rows:
+                    break
+                group.append((document_id, row.owner_id, [chunk.chunk_id for chunk in rows],
+                              [decompress_text(chunk.content, chunk.compression) for chunk in rows]))
+                pending += len(rows)
+                last_chunk_id = rows[-1].chunk_id
+                if pending >= group_size:
+                    write_group()
+                    pending = 0
+        if group:
+            write_group()
+
+        self.db.bulk_update_mappings(Document, [
+            {"id": document_id, "vector_count": count}
+            for document_id, count in vector_counts.items() if document_id not in failed_ids
+        ])
+        for document_id in failed_ids:
+            self._fail_processing(self.get_document(document_id), "Failed to insert vectors into Milvus")
+        self.db.commit()
+        return failed_ids
+
+    def enqueue_batch_vectorization(self, batch_id: str, incremental: bool = True) -> bool:
+        """提交批次重新向量化任务；批次处理任务仍在排队时不提交（处理时会向量化）"""
+        job = job_queue.get_job(batch_job_key(batch_id))
+        if job is not None and job["kind"] == PROCESS_BATCH_JOB and job["status"] in (QUEUED, RETRYING):
+            return False
+        return job_queue.enqueue(
+            batch_job_key(batch_id),
+            VECTORIZE_BATCH_JOB,
+            {"batch_id": batch_id, "incremental": incremental}
+        )
+
+    def reprocess_batch_vectors(self, batch_id: str, incremental: bool = True) -> int:
+        """重新向量化批次中已处理完成的文档，返回成功的文档数
+
+        各文档待编码的文本块（增量时只含新增或变化的块）跨文档合并后统一编码，小文档也能填满编码批次；
+        需要全量重建且文本块超过一组的文档单独走流式重新向量化。有单独任务排队或执行中的文档由该任务处理。
+        """
+        document_ids = [
+            document_id for (document_id,) in
+            self.db.query(Document.id)
+            .filter(Document.batch_id == batch_id, Document.status == "completed", Document.content.isnot(None))
+            .order_by(Document.id)
+            .all()
+        ]
+        group: List[Tuple[Document, _VectorUpdate]] = []
+        pending = 0
+        succeeded = 0
+        for document_id in document_ids:
+            job = job_queue.get_job(document_job_key(document_id))
+            if job is not None and job["status"] in (QUEUED, RUNNING, RETRYING):
+                continue
+            document = self.get_document(document_id)
+            if document is None or not document.content:
+                continue
+            embedding_service.invalidate_document_rerank_scores(document_id)
+            update = None
+            if incremental and document.is_vectorized:
+                update = self._plan_incremental_update(document)
+            if update is None:
+                update = self._plan_full_update(document)
+                if len(update.new_chunks) > settings.INGEST_INSERT_BATCH_SIZE:
+                    succeeded += self.reprocess_document_vectors(document_id, incremental=False)
+                    continue
+            group.append((document, update))
+            pending += len(update.new_chunks)
+            if pending >= settings.INGEST_INSERT_BATCH_SIZE:
+                succeeded += self._write_vector_updates(group)
+                group, pending = [], 0
+        if group:
+            succeeded += self._write_vector_updates(group)
+        logger.info(f"Reprocessed vectors of {succeeded}/{len(document_ids)} documents of batch {batch_id}")
+        return succeeded
+
+    def _write_vector_updates(self, group: List[Tuple[Document, _VectorUpdate]]) -> int:
+        """跨文档合并编码一组文档的新文本块并按文档写入，返回成功的文档数"""
+        embeddings = embedding_service.encode_document_batches([update.new_chunks for _, update in group])
+        succeeded = 0
+        for (document, update), vectors in zip(group, embeddings):
+            if self._apply_vector_update(document, update, vectors):
+                document.is_vectorized = document.vector_count > 0
+                succeeded += 1
+            else:
+                logger.error(f"Failed to reprocess document vectors {document.id}")
+                if update.full:
+                    # 旧向量已删除
+                    document.is_vectorized = False
+                    document.vector_count = 0
+        self._ensure_vectors_written()
+        self.db.commit()
+        return succeeded
+
+    def enqueue_processing(self, document_id: int, reuse_existing: bool = True) -> bool:
+        """提交文档处理任务（同一文档只保留一个排队中的任务）"""
+        return job_queue.enqueue(
+            document_job_key(document_id),
+            PROCESS_DOCUMENT_JOB,
+            {"document_id": document_id, "reuse_existing": reuse_existing}
+        )
+
+    def enqueue_vectorization(self, document_id: int, incremental: bool = True) -> bool:
+        """提交文档重新向量化任务；已有排队中的处理任务时不提交（处理时会重新向量化）"""
+        job = job_queue.get_job(document_job_key(document_id))
+        if job is not None and job["kind"] == PROCESS_DOCUMENT_JOB and job["status"] in (QUEUED, RETRYING):
+            return False
+        return job_queue.enqueue(
+            document_job_key(document_id),
+            VECTORIZE_DOCUMENT_JOB,
+            {"document_id": document_id, "incremental": incremental}
+        )
+
+    def get_processing_job(self, document_id: int) -> Optional[dict]:
+        """获取文档处理任务状态"""
+        return job_queue.get_job(document_job_key(document_id))
     
-    def process_document(self, document_id: int) -> bool:
-        """处理文档（提取文本内容并向量化）"""
+    def _acquire_blob(self, stored: StoredFile, file_type: str) -> FileBlob:
+        """获取内容相同的共享文件并增加引用计数，不存在时把新文件移入内容寻址目录"""
+        blob_path = _blob_path(stored.sha256, file_type)
+        blob = (
+            self.db.query(FileBlob)
+            .filter(FileBlob.sha256 == stored.sha256, FileBlob.file_type == file_type)
+            .first()
+        )
+        if blob is None:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(stored.path, blob_path)
+            blob = FileBlob(
+                sha256=stored.sha256,
+                file_type=file_type,
+                file_path=str(blob_path),
+                file_size=stored.size,
+                ref_count=0
+            )
+            try:
+                # 使用保存点，冲突时不影响同一事务中尚未提交的其他记录
+                with self.db.begin_nested():
+                    self.db.add(blob)
+            except IntegrityError:
+                # 并发上传了相同内容的文件
+                blob = (
+                    self.db.query(FileBlob)
+                    .filter(FileBlob.sha256 == stored.sha256, FileBlob.file_type == file_type)
+                    .one()
+                )
+        elif os.path.exists(blob.file_path):
+            os.remove(stored.path)
+        else:
+            os.replace(stored.path, blob.file_path)
+
+        blob.ref_count = FileBlob.ref_count + 1
+        self.db.flush()
+        self.db.refresh(blob)
+        return blob
+
+    def _release_blob(self, document: Document) -> Optional[str]:
+        """减少共享文件的引用计数，返回需要删除的文件路径（最后一个引用时）"""
+        if document.blob_id is None:
+            return document.file_path
+
+        blob = document.blob
+        blob.ref_count = FileBlob.ref_count - 1
+        self.db.flush()
+        self.db.refresh(blob)
+        if blob.ref_count > 0:
+            return None
+        self.db.delete(blob)
+        return blob.file_path
+
+    def _find_processed_sibling(self, document: Document) -> Optional[Document]:
+        """查找引用同一文件且已完成向量化的其他文档"""
+        if document.blob_id is None:
+            return None
+        return (
+            self.db.query(Document)
+            .filter(
+                Document.blob_id == document.blob_id,
+                Document.id != document.id,
+                Document.status == "completed",
+                Document.is_vectorized == True,
+                Document.vector_count > 0
+            )
+            .order_by(Document.id)
+            .first()
+        )
+
+    def _reuse_processed_sibling(self, document: Document, sibling: Document, flush: bool = False) -> bool:
+        """复用内容相同文档的提取文本、文本块与向量，跳过提取与编码"""
+        chunk_texts = self._copy_chunks(sibling.id, document.id)
+        copied = milvus_service.copy_document_vectors(sibling.id, document.id, sibling.vector_count, flush=flush,
+                                                      owner_id=document.owner_id, chunk_texts=chunk_texts)
+        if copied != sibling.vector_count:
+            if copied > 0:
+                milvus_service.delete_document_vectors(document.id)
+            self._delete_chunks(document.id)
+            logger.warning(f"Failed to reuse vectors of document {sibling.id} for document {document.id}")
+            return False
+
+        document.content = sibling.content
+        document.status = "completed"
+        document.is_vectorized = True
+        document.vector_count = copied
+        logger.info(f"Reused extracted text and {copied} vectors of document {sibling.id} for document {document.id}")
+        return True
+
+    def _chunk_writer(self, document_id: int, with_pages: bool = True):
+        """返回流水线使用的文本块写入函数：每批写入文本块表并提交"""
+        def write(first_chunk_id: int, spans: List[ChunkSpan]):
+            self.db.bulk_insert_mappings(DocumentChunk, [
+                _chunk_mapping(document_id, first_chunk_id + i, first_chunk_id + i, span, with_pages)
+                for i, span in enumerate(spans)
+            ])
+            self.db.commit()
+        return write
+
+    def _delete_chunks(self, document_id: int):
+        """删除文档的全部文本块"""
+        self.db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).delete(synchronize_session=False)
+
+    def _copy_chunks(self, source_document_id: int, target_document_id: int) -> Optional[Dict[int, str]]:
+        """复制文本块；向量集合不保存文本时返回 chunk_id -> 文本，供复制向量使用"""
+        rows = self.db.query(DocumentChunk).filter(DocumentChunk.document_id == source_document_id).all()
+        self.db.bulk_insert_mappings(DocumentChunk, [
+            {
+                "document_id": target_document_id,
+                "chunk_id": row.chunk_id,
+                "ordinal": row.ordinal,
+                "char_start": row.char_start,
+                "char_end": row.char_end,
+                "page_start": row.page_start,
+                "page_end": row.page_end,
+                "token_count": row.token_count,
+                "content_hash": row.content_hash,
+                "compression": row.compression,
+                "content": row.content,
+            }
+            for row in rows
+        ])
+        if milvus_service.has_field("content"):
+            return None
+        return {row.chunk_id: decompress_text(row.content, row.compression) for row in rows}
+
+    def _attach_chunk_contents(self, similar_chunks: List[dict]) -> List[dict]:
+        """为不含文本的检索命中从文本块表补全内容，一次查询；找不到文本的命中被丢弃"""
+        wanted = {(chunk["document_id"], chunk["chunk_id"]) for chunk in similar_chunks if chunk.get("content") is None}
+        if not wanted:
+            return similar_chunks
+
+        rows = (
+            self.db.query(DocumentChunk.document_id, DocumentChunk.chunk_id,
+                          DocumentChunk.compression, DocumentChunk.content)
+            .filter(
+                DocumentChunk.document_id.in_({document_id for document_id, _ in wanted}),
+                DocumentChunk.chunk_id.in_({chunk_id for _, chunk_id in wanted})
+            )
+            .all()
+        )
+        texts = {
+            (row.document_id, row.chunk_id): decompress_text(row.content, row.compression)
+            for row in rows if (row.document_id, row.chunk_id) in wanted
+        }
+
+        attached = []
+        for chunk in similar_chunks:
+            if chunk.get("content") is None:
+                chunk["content"] = texts.get((chunk["document_id"], chunk["chunk_id"]))
+                if chunk["content"] is None:
+                    continue
+            attached.append(chunk)
+        return attached
+
+    def get_chunk_context(self, document_id: int, chunk_id: int, window: int = 1) -> Optional[List[dict]]:
+        """获取文本块及其前后 window 个相邻块（按文档中的顺序），文本块不存在时返回None"""
+        chunk = (
+            self.db.query(DocumentChunk.ordinal)
+            .filter(DocumentChunk.document_id == document_id, DocumentChunk.chunk_id == chunk_id)
+            .first()
+        )
+        if chunk is None:
+            return None
+
+        rows = (
+            self.db.query(DocumentChunk)
+            .filter(
+                DocumentChunk.document_id == document_id,
+                DocumentChunk.ordinal.between(chunk.ordinal - window, chunk.ordinal + window)
+            )
+            .order_by(DocumentChunk.ordinal)
+            .all()
+        )
+        return [
+            {
+                "chunk_id": row.chunk_id,
+                "ordinal": row.ordinal,
+                "char_start": row.char_start,
+                "char_end": row.char_end,
+                "page_start": row.page_start,
+                "page_end": row.page_end,
+                "token_count": row.token_count,
+                "content": decompress_text(row.content, row.compression),
+            }
+            for row in rows
+        ]
+
+    def _extract_segments(self, document: Document) -> Iterable[str]:
+        """逐页/逐段提取文档文本，命中提取缓存时直接读取缓存"""
+        if extraction_cache is None or not document.content_hash:
+            return self.file_processor.iter_pages(document.file_path)
+
+        file_type = Path(document.file_path).suffix.lower().lstrip('.')
+        key = extraction_cache.make_key(document.content_hash, file_type)
+        segments = extraction_cache.iter_segments(key)
+        if segments is not None:
+            logger.info(f"Using cached extracted text for document {document.id}")
+            return segments
+        return extraction_cache.record(key, self.file_processor.iter_pages(document.file_path))
+
+    def process_document(self, document_id: int, reuse_existing: bool = True, flush: bool = False,
+                         vectorize: bool = True, defer_completion: bool = False) -> bool:
+        """处理文档（提取文本内容并向量化）
+
+        提取、分块、编码与写入Milvus以流水线方式进行，内存占用与文档大小无关；
+        提取出的全文先写入临时文件，最后一次性保存到数据库。
+        reuse_existing=True 时，若已有内容相同的文档处理完成，直接复用其文本与向量。
+        默认不flush Milvus，写入由写缓冲跨文档合并；flush=True 时处理完立即落盘。
+        vectorize=False 时只提取并分块，由调用方（批次处理）跨文档合并编码。
+        defer_completion=True 时（批次处理）不等待写缓冲发送，文档保持处理中状态，由调用方落盘后标记完成。
+        """
         document = self.get_document(document_id)
         if not document:
             return False
@@ -95,36 +771,94 @@ class DocumentService:
             document.status = "processing"
             self.db.commit()
 
-            # 提取文本内容
-            content = self.file_processor.extract_text(document.file_path)
+            # 重新处理时先删除旧的向量与文本块，避免重复
+            if document.is_vectorized or document.vector_count:
+                milvus_service.delete_document_vectors(document_id)
+            self._delete_chunks(document_id)
+            embedding_service.invalidate_document_rerank_scores(document_id)
 
-            # 更新文档内容
-            document.content = content
+            if reuse_existing:
+                sibling = self._find_processed_sibling(document)
+                if sibling is not None and self._reuse_processed_sibling(document, sibling, flush):
+                    self._complete_processing(document, defer_completion)
+                    return True
 
-            # 向量化处理
-            success = self._vectorize_document(document, content)
+            with tempfile.SpooledTemporaryFile(max_size=_CONTENT_SPOOL_MAX_SIZE, mode="w+", encoding="utf-8") as text_sink:
+                result = IngestPipeline(
+                    document_id,
+                    vectorize=vectorize,
+                    flush=flush,
+                    owner_id=document.owner_id,
+                    chunk_sink=self._chunk_writer(document_id)
+                ).run(
+                    self._extract_segments(document),
+                    text_sink=text_sink
+                )
+                text_sink.seek(0)
+                # 更新文档内容
+                content = text_sink.read()
+                document.content = content.strip()
 
-            if success:
-                document.status = "completed"
-                document.is_vectorized = True
+            # 文本块偏移基于未去除首尾空白的全文，与保存的内容对齐
+            leading = len(content) - len(content.lstrip())
+            if leading:
+                self.db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).update({
+                    DocumentChunk.char_start: DocumentChunk.char_start - leading,
+                    DocumentChunk.char_end: DocumentChunk.char_end - leading
+                }, synchronize_session=False)
+
+            if vectorize and not result.vectorized and result.chunk_count:
+                # 编码或写入Milvus失败：标记为失败，由任务队列重试
+                raise RuntimeError(f"Vectorization failed: {result.vector_error}")
+
+            document.status = "completed"
+            document.is_vectorized = result.vectorized
+            document.vector_count = result.vector_count
+            if result.vectorized:
+                logger.info(f"Successfully vectorized document {document_id} with {result.vector_count} chunks")
+            elif not vectorize:
+                logger.info(f"Extracted {result.chunk_count} chunks of document {document_id}")
             else:
-                document.status = "completed"  # 文本提取成功，但向量化失败
-                document.is_vectorized = False
-                logger.warning(f"Document {document_id} processed but vectorization failed")
+                # 文档没有可向量化的文本，重试也不会成功
+                logger.warning(f"Document {document_id} processed but has no text to vectorize")
 
-            self.db.commit()
+            self._complete_processing(document, defer_completion)
             return True
 
         except Exception as e:
-            document.status = "failed"
-            document.error_message = str(e)
+            self.db.rollback()
+            self._fail_processing(document, str(e))
             self.db.commit()
-            logger.error(f"Failed to process document {document_id}: {e}")
             return False
+
+    def _fail_processing(self, document: Document, error: str):
+        """把文档标记为处理失败（由调用方提交）"""
+        # 丢弃写缓冲中尚未发送的向量，重试时不会重复写入
+        milvus_service.delete_document_vectors(document.id)
+        self._delete_chunks(document.id)
+        document.status = "failed"
+        document.error_message = error
+        logger.error(f"Failed to process document {document.id}: {error}")
     
+    def _complete_processing(self, document: Document, defer_completion: bool):
+        """提交处理结果；defer_completion=True 时文档保持处理中、未向量化状态（只保存向量数）"""
+        if defer_completion:
+            document.status = "processing"
+            document.is_vectorized = False
+        else:
+            self._ensure_vectors_written()
+        self.db.commit()
+
+    @staticmethod
+    def _ensure_vectors_written():
+        """标记文档已向量化前把写缓冲中的向量发送到Milvus（缓冲只在内存中，进程重启会丢失），
+        发送失败时抛出异常，文档不会被标记为完成，任务稍后重试"""
+        if not milvus_service.drain_writes():
+            raise RuntimeError("Failed to write buffered vectors to Milvus")
+
     def update_document(self, document_id: int, document_update: DocumentUpdate) -> Optional[Document]:
-        """更新文档"""
-        document = self.get_document(document_id)
+        """更新文档（不加载正文）"""
+        document = self.get_document(document_id, with_content=False)
         if not document:
             return None
         
@@ -134,6 +868,8 @@ class DocumentService:
         
         self.db.commit()
         self.db.refresh(document)
+        if document_metadata_cache is not None:
+            document_metadata_cache.invalidate(document_id)
         return document
     
     def delete_document(self, document_id: int) -> bool:
@@ -142,62 +878,46 @@ class DocumentService:
         if not document:
             return False
         
-        # 删除文件
-        try:
-            if os.path.exists(document.file_path):
-                os.remove(document.file_path)
-        except Exception:
-            pass  # 忽略文件删除错误
-        
         # 删除向量数据
         try:
             milvus_service.delete_document_vectors(document_id)
         except Exception as e:
             logger.warning(f"Failed to delete vectors for document {document_id}: {e}")
+        embedding_service.invalidate_document_rerank_scores(document_id)
 
-        # 删除数据库记录
+        # 删除数据库记录，共享文件只在最后一个引用删除时移除
+        orphan_path = self._release_blob(document)
+        self._delete_chunks(document_id)
         self.db.delete(document)
         self.db.commit()
+        if document_metadata_cache is not None:
+            document_metadata_cache.invalidate(document_id)
+
+        # 删除文件
+        try:
+            if orphan_path and os.path.exists(orphan_path):
+                os.remove(orphan_path)
+        except Exception:
+            pass  # 忽略文件删除错误
         return True
 
     def _vectorize_document(self, document: Document, content: str) -> bool:
         """将文档内容向量化并存储到Milvus"""
         try:
-            # 确保Milvus集合存在
-            dimension = embedding_service.get_embedding_dimension()
-            if not milvus_service.create_collection(dimension):
-                logger.error("Failed to create Milvus collection")
-                return False
-
-            # 文本分块
-            chunks = embedding_service.chunk_text(content)
-            if not chunks:
-                logger.warning(f"No chunks generated for document {document.id}")
+            # 全文作为一段分块，页码未知
+            self._delete_chunks(document.id)
+            result = IngestPipeline(
+                document.id,
+                owner_id=document.owner_id,
+                chunk_sink=self._chunk_writer(document.id, with_pages=False)
+            ).run([content])
+            if not result.vectorized:
+                logger.error(f"Failed to vectorize document {document.id}: {result.vector_error}")
                 return False
+            document.vector_count = result.vector_count
 
-            # 生成嵌入向量
-            embeddings = embedding_service.encode_documents(chunks)
-            if not embeddings:
-                logger.error(f"Failed to generate embeddings for document {document.id}")
-                return False
-
-            # 准备元数据
-            metadata = [f"doc_{document.id}_chunk_{i}" for i in range(len(chunks))]
-
-            # 存储到Milvus
-            success = milvus_service.insert_vectors(
-                document_id=document.id,
-                chunks=chunks,
-                embeddings=embeddings,
-                metadata=metadata
-            )
-
-            if success:
-                # 更新向量数量
-                document.vector_count = len(chunks)
-                logger.info(f"Successfully vectorized document {document.id} with {len(chunks)} chunks")
-
-            return success
+            logger.info(f"Successfully vectorized document {document.id} with {result.vector_count} chunks")
+            return True
 
         except Exception as e:
             logger.error(f"Failed to vectorize document {document.id}: {e}")
@@ -209,65 +929,174 @@ class DocumentService:
             # 生成查询向量
             query_embedding = embedding_service.encode_query(search_request.query)
 
-            # 在Milvus中搜索
+            # 在Milvus中搜索（按所有者过滤）
             similar_chunks = milvus_service.search_similar(
                 query_embedding=query_embedding,
                 limit=search_request.limit * 2,  # 获取更多结果用于重排序
-                score_threshold=search_request.threshold
+                score_threshold=search_request.threshold,
+                owner_id=user_id
+            )
+            documents = self._resolve_documents(similar_chunks, user_id)
+            similar_chunks = self._attach_chunk_contents(
+                [chunk for chunk in similar_chunks if chunk["document_id"] in documents]
             )
 
-            if not similar_chunks:
-                return []
-
-            # 按文档ID分组
-            doc_chunks = {}
-            for chunk in similar_chunks:
-                doc_id = chunk["document_id"]
-                if doc_id not in doc_chunks:
-                    doc_chunks[doc_id] = []
-                doc_chunks[doc_id].append(chunk)
-
-            # 构建搜索结果
-            results = []
-            for doc_id, chunks in doc_chunks.items():
-                # 获取文档信息
-                document = self.get_document(doc_id)
-                if not document:
-                    continue
-
-                # 检查权限
-                if user_id and document.owner_id != user_id:
-                    continue
+            # 重排序
+            rerank_outcome = None
+            if self._rerank_enabled(search_request) and similar_chunks:
+                rerank_outcome = embedding_service.rerank_with_budget(
+                    search_request.query,
+                    [chunk["content"] for chunk in similar_chunks],
+                    [chunk["document_id"] for chunk in similar_chunks]
+                )
+            return self._build_search_results(similar_chunks, documents, search_request, rerank_outcome)
 
-                # 合并相关文本块
-                combined_content = "\n\n".join([chunk["content"] for chunk in chunks])
-                avg_score = sum([chunk["score"] for chunk in chunks]) / len(chunks)
+        except Exception as e:
+            logger.error(f"Failed to search documents: {e}")
+            return []
 
-                results.append(DocumentSearchResult(
-                    document_id=doc_id,
-                    title=document.title,
-                    content=combined_content[:500] + "..." if len(combined_content) > 500 else combined_content,
-                    score=avg_score,
-                    metadata={"chunk_count": len(chunks)}
-                ))
+    async def search_documents_async(self, search_request: DocumentSearchRequest, user_id: int = None) -> List[DocumentSearchResult]:
+        """搜索文档（异步版本，模型推理与向量检索在推理执行器中运行）"""
+        try:
+            query_embedding = await encode_query_async(search_request.query)
 
-            # 按分数排序
-            results.sort(key=lambda x: x.score, reverse=True)
+            similar_chunks = await milvus_service.asearch_similar(
+                query_embedding=query_embedding,
+                limit=search_request.limit * 2,
+                score_threshold=search_request.threshold,
+                owner_id=user_id
+            )
+            documents = self._resolve_documents(similar_chunks, user_id)
+            similar_chunks = self._attach_chunk_contents(
+                [chunk for chunk in similar_chunks if chunk["document_id"] in documents]
+            )
 
-            # 限制结果数量
-            return results[:search_request.limit]
+            rerank_outcome = None
+            if self._rerank_enabled(search_request) and similar_chunks:
+                rerank_outcome = await embedding_service.arerank_with_budget(
+                    search_request.query,
+                    [chunk["content"] for chunk in similar_chunks],
+                    [chunk["document_id"] for chunk in similar_chunks]
+                )
+            return self._build_search_results(similar_chunks, documents, search_request, rerank_outcome)
 
         except Exception as e:
             logger.error(f"Failed to search documents: {e}")
             return []
 
-    def reprocess_document_vectors(self, document_id: int) -> bool:
-        """重新处理文档向量"""
+    @staticmethod
+    def _rerank_enabled(search_request: DocumentSearchRequest) -> bool:
+        """请求未指定时使用全局配置"""
+        if search_request.rerank is not None:
+            return search_request.rerank
+        return settings.RERANK_ENABLED
+
+    def get_documents_metadata(self, document_ids: Iterable[int]) -> Dict[int, DocumentMetadata]:
+        """批量获取文档元数据：先查缓存，未命中的用一次IN查询只加载所需列"""
+        document_ids = list(dict.fromkeys(document_ids))
+        if document_metadata_cache is not None:
+            found, missing = document_metadata_cache.get_many(document_ids)
+        else:
+            found, missing = {}, document_ids
+
+        if missing:
+            rows = (
+                self.db.query(Document.id, Document.title, Document.owner_id)
+                .filter(Document.id.in_(missing))
+                .all()
+            )
+            loaded = [DocumentMetadata(id=row.id, title=row.title, owner_id=row.owner_id) for row in rows]
+            if document_metadata_cache is not None:
+                document_metadata_cache.put_many(loaded)
+            found.update((item.id, item) for item in loaded)
+        return found
+
+    def _resolve_documents(self, similar_chunks: List[dict], user_id: int = None) -> Dict[int, DocumentMetadata]:
+        """获取命中文本块所属的文档，并过滤掉无权访问的文档"""
+        documents = self.get_documents_metadata(chunk["document_id"] for chunk in similar_chunks)
+        # 检查权限（旧版本集合没有 owner_id 字段，检索时无法按所有者过滤）
+        return {
+            doc_id: document for doc_id, document in documents.items()
+            if not user_id or document.owner_id == user_id
+        }
+
+    def _build_search_results(self,
+                              similar_chunks: List[dict],
+                              documents: Dict[int, DocumentMetadata],
+                              search_request: DocumentSearchRequest,
+                              rerank_outcome: Optional[dict] = None) -> List[DocumentSearchResult]:
+        """按文档聚合命中的文本块并组装搜索结果"""
+        if not similar_chunks:
+            return []
+
+        if rerank_outcome is not None:
+            # 已打分的候选按重排序分数降序，未打分的保持向量检索顺序排在其后
+            for chunk, rerank_score in zip(similar_chunks, rerank_outcome["scores"]):
+                chunk["rerank_score"] = rerank_score
+            scored = [chunk for chunk in similar_chunks if chunk["rerank_score"] is not None]
+            unscored = [chunk for chunk in similar_chunks if chunk["rerank_score"] is None]
+            scored.sort(key=lambda chunk: chunk["rerank_score"], reverse=True)
+            similar_chunks = scored + unscored
+
+        # 按文档ID分组
+        doc_chunks = {}
+        for chunk in similar_chunks:
+            doc_id = chunk["document_id"]
+            if doc_id not in doc_chunks:
+                doc_chunks[doc_id] = []
+            doc_chunks[doc_id].append(chunk)
+
+        # 构建搜索结果
+        results = []
+        for doc_id, chunks in doc_chunks.items():
+            document = documents[doc_id]
+
+            # 合并相关文本块
+            combined_content = "\n\n".join([chunk["content"] for chunk in chunks])
+            avg_score = sum([chunk["score"] for chunk in chunks]) / len(chunks)
+
+            metadata = {"chunk_count": len(chunks)}
+            if rerank_outcome is not None:
+                rerank_scores = [chunk["rerank_score"] for chunk in chunks if chunk["rerank_score"] is not None]
+                metadata["rerank_score"] = max(rerank_scores) if rerank_scores else None
+
+            results.append(DocumentSearchResult(
+                document_id=doc_id,
+                title=document.title,
+                content=combined_content[:500] + "..." if len(combined_content) > 500 else combined_content,
+                score=avg_score,
+                metadata=metadata,
+                rerank_completed=rerank_outcome["completed"] if rerank_outcome is not None else None
+            ))
+
+        # 未重排序时按分数排序；重排序后文档顺序由其最佳文本块的位置决定
+        if rerank_outcome is None:
+            results.sort(key=lambda x: x.score, reverse=True)
+
+        # 限制结果数量
+        return results[:search_request.limit]
+
+    def reprocess_document_vectors(self, document_id: int, incremental: bool = True) -> bool:
+        """重新处理文档向量
+
+        incremental=True 时比较新旧文本块哈希，只编码并插入新增或变化的块、只删除已移除的块；
+        集合不支持文本块哈希时回退到全量重新向量化。
+        """
         try:
             document = self.get_document(document_id)
             if not document or not document.content:
                 return False
 
+            embedding_service.invalidate_document_rerank_scores(document_id)
+
+            if incremental and document.is_vectorized:
+                success = self._update_vectors_incrementally(document)
+                if success is not None:
+                    if success:
+                        self._ensure_vectors_written()
+                        self.db.commit()
+                    return success
+
             # 删除旧的向量
             milvus_service.delete_document_vectors(document_id)
 
@@ -275,6 +1104,7 @@ class DocumentService:
             success = self._vectorize_document(document, document.content)
 
             if success:
+                self._ensure_vectors_written()
                 document.is_vectorized = True
                 self.db.commit()
                 logger.info(f"Successfully reprocessed vectors for document {document_id}")
@@ -284,3 +1114,159 @@ class DocumentService:
         except Exception as e:
             logger.error(f"Failed to reprocess document vectors {document_id}: {e}")
             return False
+
+    def _update_vectors_incrementally(self, document: Document) -> Optional[bool]:
+        """按文本块哈希增量更新文档向量，无法增量更新时返回None"""
+        update = self._plan_incremental_update(document)
+        if update is None:
+            return None
+        embeddings = embedding_service.encode_documents(update.new_chunks) if update.new_chunks else None
+        return self._apply_vector_update(document, update, embeddings)
+
+    def _plan_incremental_update(self, document: Document) -> Optional[_VectorUpdate]:
+        """比较新旧文本块哈希，只编码新增或变化的块、只删除已移除的块；无法增量更新时返回None"""
+        existing = milvus_service.get_document_chunks(document.id)
+        if existing is None:
+            return None
+        spans = embedding_service.chunk_text_spans(document.content)
+        chunks = [span.text for span in spans]
+        if not chunks:
+            return None
+
+        # 相同内容的块可能出现多次，按哈希逐个匹配
+        unmatched: Dict[str, List[dict]] = {}
+        for row in existing:
+            unmatched.setdefault(row["chunk_hash"], []).append(row)
+        chunk_ids: List[Optional[int]] = []
+        new_chunks = []
+        for chunk in chunks:
+            rows = unmatched.get(chunk_hash(chunk))
+            if rows:
+                chunk_ids.append(rows.pop()["chunk_id"])
+            else:
+                chunk_ids.append(None)
+                new_chunks.append(chunk)
+        removed_ids = [row["id"] for rows in unmatched.values() for row in rows]
+
+        # 新块编号接在已有编号之后，保留的块沿用原编号
+        next_chunk_id = max((row["chunk_id"] for row in existing), default=-1) + 1
+        new_ids = iter(range(next_chunk_id, next_chunk_id + len(new_chunks)))
+        chunk_ids = [chunk_id if chunk_id is not None else next(new_ids) for chunk_id in chunk_ids]
+        return _VectorUpdate(spans, chunk_ids, new_chunks, next_chunk_id, removed_ids)
+
+    @staticmethod
+    def _plan_full_update(document: Document) -> _VectorUpdate:
+        """全量重建：重新分块并编码全部文本块"""
+        spans = embedding_service.chunk_text_spans(document.content)
+        return _VectorUpdate(spans, list(range(len(spans))), [span.text for span in spans], 0, full=True)
+
+    def _apply_vector_update(self, document: Document, update: _VectorUpdate,
+                             embeddings: Optional[np.ndarray]) -> bool:
+        """按更新计划写入新向量、删除旧向量并重写文本块表"""
+        if update.full:
+            milvus_service.delete_document_vectors(document.id)
+        if update.new_chunks and not milvus_service.insert_vectors(
+            document_id=document.id,
+            chunks=update.new_chunks,
+            embeddings=embeddings,
+            metadata=[f"doc_{document.id}_chunk_{update.first_new_chunk_id + i}" for i in range(len(update.new_chunks))],
+            chunk_id_offset=update.first_new_chunk_id,
+            flush=False,
+            owner_id=document.owner_id
+        ):
+            return False
+        if update.removed_ids and not milvus_service.delete_vectors_by_ids(update.removed_ids, flush=False):
+            return False
+        self._rewrite_chunks(document.id, update.spans, update.chunk_ids, with_pages=not update.full)
+
+        document.vector_count = len(update.spans)
+        logger.info(
+            f"Updated vectors for document {document.id}: {len(update.new_chunks)} embedded, "
+            f"{len(update.removed_ids)} deleted, {len(update.spans) - len(update.new_chunks)} reused"
+        )
+        return True
+
+    def _rewrite_chunks(self, document_id: int, spans: List[ChunkSpan], chunk_ids: List[int],
+                        with_pages: bool = True):
+        """更新向量后重写文本块表，增量更新时保留的块沿用原页码（全文重新分块时页码未知）"""
+        pages = {}
+        if with_pages:
+            pages = {
+                row.chunk_id: (row.page_start, row.page_end)
+                for row in self.db.query(DocumentChunk.chunk_id, DocumentChunk.page_start, DocumentChunk.page_end)
+                .filter(DocumentChunk.document_id == document_id)
+            }
+        self._delete_chunks(document_id)
+        for span, chunk_id in zip(spans, chunk_ids):
+            span.page_start, span.page_end = pages.get(chunk_id, (None, None))
+        self.db.bulk_insert_mappings(DocumentChunk, [
+            _chunk_mapping(document_id, chunk_id, ordinal, span)
+            for ordinal, (span, chunk_id) in enumerate(zip(spans, chunk_ids))
+        ])
+
+def _run_process_document_job(payload: dict):
+    """任务队列处理函数：处理文档，失败时抛出异常以便重试"""
+    db = SessionLocal()
+    try:
+        document_service = DocumentService(db)
+        document_id = payload["document_id"]
+        if document_service.process_document(document_id, payload.get("reuse_existing", True)):
+            return
+        document = document_service.get_document(document_id)
+        if document is not None:
+            raise RuntimeError(document.error_message or f"Failed to process document {document_id}")
+    finally:
+        db.close()
+
+
+def _run_vectorize_document_job(payload: dict):
+    """任务队列处理函数：重新向量化文档；文档尚未处理完成时（排队中的处理任务被替换）改为完整处理，文档已删除时跳过"""
+    db = SessionLocal()
+    try:
+        document_id = payload["document_id"]
+        document_service = DocumentService(db)
+        document = document_service.get_document(document_id)
+        if document is None:
+            # 文档已删除，重试也不会成功
+            logger.info(f"Document {document_id} no longer exists, skipping vectorization")
+            return
+        if document.status == "completed":
+            if document_service.reprocess_document_vectors(document_id, payload.get("incremental", True)):
+                return
+            db.expire_all()
+            if document_service.get_document(document_id) is None:
+                logger.info(f"Document {document_id} was deleted during vectorization")
+                return
+            raise RuntimeError(f"Failed to vectorize document {document_id}")
+        if document.batch_id is not None and document.status in ("pending", "processing"):
+            # 由批次任务处理
+            return
+    finally:
+        db.close()
+    _run_process_document_job({"document_id": document_id})
+
+
+def _run_process_batch_job(payload: dict):
+    """任务队列处理函数：处理批量上传的一批文档（单个文档失败不影响批次）"""
+    db = SessionLocal()
+    try:
+        DocumentService(db).process_batch(payload["batch_id"])
+    finally:
+        db.close()
+
+
+def _run_vectorize_batch_job(payload: dict):
+    """任务队列处理函数：重新向量化批次中的文档；尚未处理完成的文档（排队中的批次任务被替换）改为完整处理"""
+    db = SessionLocal()
+    try:
+        document_service = DocumentService(db)
+        document_service.reprocess_batch_vectors(payload["batch_id"], payload.get("incremental", True))
+        document_service.process_batch(payload["batch_id"])
+    finally:
+        db.close()
+
+
+job_queue.register_handler(PROCESS_DOCUMENT_JOB, _run_process_document_job)
+job_queue.register_handler(VECTORIZE_DOCUMENT_JOB, _run_vectorize_document_job)
+job_queue.register_handler(PROCESS_BATCH_JOB, _run_process_batch_job)
+job_queue.register_handler(VECTORIZE_BATCH_JOB, _run_vectorize_batch_job)
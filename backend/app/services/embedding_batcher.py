@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_service import embedding_service
+
+logger = logging.getLogger(__name__)
+
+# 批大小直方图的分桶上界
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# 用于计算等待时间分位数的样本数
+_WAIT_SAMPLE_SIZE = 1000
+
+
+class QueryBatcher:
+    """查询嵌入微批处理器
+
+    在一个很短的时间窗口内收集并发到达的查询，合并为一次批量编码，
+    再把各自的向量返回给对应的调用方。
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], Awaitable[np.ndarray]], max_batch_size: int, max_wait_ms: float):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.total_requests = 0
+        self.total_batches = 0
+        self._batch_size_histogram: Dict[int, int] = {bound: 0 for bound in _BATCH_SIZE_BUCKETS}
+        self._batch_size_overflow = 0
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLE_SIZE)
+        self._max_wait_seen = 0.0
+
+    def _ensure_worker(self):
+        """在当前事件循环中启动批处理协程"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def encode(self, query: str) -> np.ndarray:
+        """编码单条查询（与其他并发查询合并批处理）"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((query, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._process(batch)
+
+    async def _process(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        started = time.perf_counter()
+        self._record_batch(len(batch), [started - enqueued for _, _, enqueued in batch])
+
+        try:
+            embeddings = await self.encode_fn([query for query, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to encode query batch of size {len(batch)}: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def _record_batch(self, size: int, waits: List[float]):
+        self.total_requests += size
+        self.total_batches += 1
+        for bound in _BATCH_SIZE_BUCKETS:
+            if size <= bound:
+                self._batch_size_histogram[bound] += 1
+                break
+        else:
+            self._batch_size_overflow += 1
+        self._waits.extend(waits)
+        self._max_wait_seen = max(self._max_wait_seen, max(waits))
+
+    def get_stats(self) -> dict:
+        """获取队列深度、批大小分布与等待时间统计"""
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        histogram = {f"<={bound}": count for bound, count in self._batch_size_histogram.items()}
+        histogram[f">{_BATCH_SIZE_BUCKETS[-1]}"] = self._batch_size_overflow
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "avg_batch_size": self.total_requests / self.total_batches if self.total_batches else 0.0,
+            "batch_size_histogram": histogram,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": self._max_wait_seen * 1000,
+        }
+
+
+# 全局查询批处理器实例
+query_batcher = QueryBatcher(
+    embedding_service.aencode_documents,
+    max_batch_size=settings.QUERY_BATCH_MAX_SIZE,
+    max_wait_ms=settings.QUERY_BATCH_WAIT_MS
+)
+
+
+async def encode_query_async(query: str) -> np.ndarray:
+    """异步编码查询：启用微批处理时合并并发查询，否则在推理执行器中单独编码"""
+    if settings.QUERY_BATCHING_ENABLED:
+        return await query_batcher.encode(query)
+    return await embedding_service.aencode_query(query)
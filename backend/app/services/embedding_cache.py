@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows上没有fcntl，磁盘缓存目录只能由单个进程使用
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 每个内存条目的额外开销估算（键、OrderedDict节点、ndarray对象头）
+_ENTRY_OVERHEAD_BYTES = 200
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：去除首尾空白并合并连续空白"""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class _DiskEmbeddingStore:
+    """基于内存映射数组（float32或float16）的磁盘向量存储
+
+    向量按追加顺序写入 vectors.bin，index.txt 每行为 "缓存键 行号"（旧格式只有缓存键，行号即行序）。
+    写入在文件锁内进行，行号由写入前的文件长度决定，多个进程可以共享同一目录；
+    进程中断留下的未完整向量或没有索引的向量会在下次写入或加载时截断。
+    """
+
+    def __init__(self, directory: Path, dtype: str = "float32"):
+        self.directory = directory
+        self._dtype = np.dtype(dtype)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._meta_path = directory / "meta.json"
+        self._vectors_path = directory / "vectors.bin"
+        self._index_path = directory / "index.txt"
+        self._lock_path = directory / ".lock"
+        self._index: Dict[str, int] = {}
+        self._dimension: Optional[int] = None
+        self._mmap: Optional[np.memmap] = None
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程互斥（不支持 fcntl 的平台上只在进程内互斥）"""
+        with open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _row_bytes(self) -> int:
+        return self._dimension * self._dtype.itemsize
+
+    def _read_meta(self):
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text())
+            self._dimension = meta["dimension"]
+            # 已有存储沿用创建时的精度
+            self._dtype = np.dtype(meta.get("dtype", "float32"))
+
+    def _load(self):
+        """加载索引（调用方需持有文件锁），丢弃未完整写入的记录并截断向量文件"""
+        self._read_meta()
+        if not self._dimension or not self._index_path.exists():
+            return
+
+        stored_rows = self._vectors_path.stat().st_size // self._row_bytes() if self._vectors_path.exists() else 0
+        valid_lines, dropped = [], False
+        with open(self._index_path, "r", encoding="ascii") as f:
+            for line_number, line in enumerate(f):
+                parts = line.split()
+                valid = line.endswith("\n") and (len(parts) == 1 or (len(parts) == 2 and parts[1].isdigit()))
+                row = int(parts[1]) if valid and len(parts) == 2 else line_number
+                if not valid or row >= stored_rows:
+                    dropped = True
+                    break
+                self._index[parts[0]] = row
+                valid_lines.append(line)
+
+        # 截断没有对应向量的索引行，以及没有索引行或未写完的尾部向量
+        used_bytes = (max(self._index.values(), default=-1) + 1) * self._row_bytes()
+        if dropped:
+            self._index_path.write_text("".join(valid_lines), encoding="ascii")
+        if self._vectors_path.exists() and self._vectors_path.stat().st_size > used_bytes:
+            os.truncate(self._vectors_path, used_bytes)
+        logger.info(f"Loaded {len(self._index)} cached embeddings from {self.directory}")
+
+    def _mapped_rows(self) -> int:
+        return 0 if self._mmap is None else self._mmap.shape[0]
+
+    def _remap(self):
+        rows = self._vectors_path.stat().st_size // self._row_bytes() if self._vectors_path.exists() else 0
+        if rows == 0:
+            self._mmap = None
+            return
+        self._mmap = np.memmap(self._vectors_path, dtype=self._dtype, mode="r", shape=(rows, self._dimension))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._index.get(key)
+        if row is None:
+            return None
+        if row >= self._mapped_rows():
+            self._remap()
+        return np.array(self._mmap[row], dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray):
+        if key in self._index:
+            return
+        vector = np.ascontiguousarray(vector, dtype=self._dtype)
+        with self._file_lock():
+            if self._dimension is None:
+                # 其他进程可能已经创建了存储
+                self._read_meta()
+            if self._dimension is None:
+                self._dimension = int(vector.shape[0])
+                self._meta_path.write_text(json.dumps({"dimension": self._dimension, "dtype": self._dtype.name}))
+            if vector.shape[0] != self._dimension:
+                return
+
+            # 行号由对齐后的文件长度决定（截断中断时未写完的向量），先写向量再写索引
+            with open(self._vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                row = size // self._row_bytes()
+                if size != row * self._row_bytes():
+                    f.truncate(row * self._row_bytes())
+                f.write(vector.tobytes())
+            with open(self._index_path, "a", encoding="ascii") as f:
+                f.write(f"{key} {row}\n")
+        self._index[key] = row
+
+    def size_bytes(self) -> int:
+        return self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+
+
+class EmbeddingCache:
+    """两级嵌入向量缓存：进程内LRU（按内存上限淘汰）+ 可选的磁盘存储
+
+    缓存键为 (模型名, 规范化文本) 的SHA-256哈希。向量按storage_dtype存储，
+    读取时统一返回float32。
+    """
+
+    def __init__(self, max_memory_bytes: int, disk_dir: Optional[str] = None, storage_dtype: str = "float32"):
+        self.max_memory_bytes = max_memory_bytes
+        self.storage_dtype = np.dtype(storage_dtype)
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._disk: Optional[_DiskEmbeddingStore] = None
+        if disk_dir:
+            try:
+                self._disk = _DiskEmbeddingStore(Path(disk_dir), storage_dtype)
+            except Exception as e:
+                logger.warning(f"Failed to open embedding disk cache at {disk_dir}: {e}")
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """生成缓存键"""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """写入内存LRU并按内存上限淘汰（调用方需持有锁）"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        entry_bytes = vector.nbytes + _ENTRY_OVERHEAD_BYTES
+        if entry_bytes > self.max_memory_bytes:
+            return
+        self._memory[key] = vector
+        self._memory_bytes += entry_bytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes + _ENTRY_OVERHEAD_BYTES
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """批量查询缓存，未命中的位置为None"""
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                elif self._disk is not None and (vector := self._disk.get(key)) is not None:
+                    self._remember(key, vector.astype(self.storage_dtype))
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+                results.append(vector.astype(np.float32) if vector is not None else None)
+        return results
+
+    def put_many(self, keys: List[str], vectors: List[np.ndarray]):
+        """批量写入缓存"""
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vector = np.ascontiguousarray(vector, dtype=self.storage_dtype)
+                self._remember(key, vector)
+                if self._disk is not None:
+                    try:
+                        self._disk.put(key, vector)
+                    except Exception as e:
+                        logger.warning(f"Failed to write embedding to disk cache: {e}")
+
+    def clear(self):
+        """清空内存缓存（磁盘缓存保留）"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def get_stats(self) -> dict:
+        """获取缓存命中统计"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "storage_dtype": self.storage_dtype.name,
+                "disk_enabled": self._disk is not None,
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+                "disk_bytes": self._disk.size_bytes() if self._disk is not None else 0,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -1,12 +1,29 @@
+import gc
 import logging
-from typing import List, Union
+import time
+from typing import List, Optional, Tuple, Union
 import numpy as np
 from sentence_transformers import SentenceTransformer, CrossEncoder
 from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache
+from app.services.rerank_cache import RerankScoreCache
+from app.services.inference_executor import inference_executor
+from app.utils.vector_math import cosine_similarity, top_k_similar
+from app.utils.text_chunker import ChunkSpan, TokenChunker, chunk_by_chars, chunk_spans_by_chars
+from app.services.onnx_backend import OnnxCrossEncoder, OnnxSentenceEncoder, check_parity
 import torch
 
 logger = logging.getLogger(__name__)
 
+# ONNX后端与torch输出一致性检查使用的样本
+_PARITY_SAMPLES = [
+    "Python是一种高级编程语言，具有简洁的语法和强大的功能。",
+    "机器学习是人工智能的一个重要分支。",
+    "FastAPI is a modern, fast web framework for building APIs.",
+    "Vector databases store and search high-dimensional embeddings efficiently.",
+    "如何在知识库中搜索相关文档？"
+]
+
 class EmbeddingService:
     """文本嵌入服务"""
     
@@ -15,13 +32,28 @@ class EmbeddingService:
         self.rerank_model = None
         self._embedding_model_loaded = False
         self._rerank_model_loaded = False
+        self.backend = "torch"
+        self.parity_result = None
+        self.embedding_cache = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                max_memory_bytes=settings.EMBEDDING_CACHE_MAX_MEMORY_MB * 1024 * 1024,
+                disk_dir=settings.EMBEDDING_CACHE_DIR or None,
+                storage_dtype=settings.EMBEDDING_STORAGE_DTYPE
+            )
+        self.rerank_cache = None
+        if settings.RERANK_CACHE_ENABLED:
+            self.rerank_cache = RerankScoreCache(
+                max_entries=settings.RERANK_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.RERANK_CACHE_TTL_SECONDS
+            )
         
     def load_embedding_model(self) -> bool:
         """加载嵌入模型"""
         try:
             if not self._embedding_model_loaded:
-                logger.info(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
-                self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+                logger.info(f"Loading embedding model: {settings.EMBEDDING_MODEL} (backend: {settings.EMBEDDING_BACKEND})")
+                self.embedding_model = self._load_backend_embedding_model()
                 self._embedding_model_loaded = True
                 logger.info("Embedding model loaded successfully")
             return True
@@ -33,8 +65,8 @@ class EmbeddingService:
         """加载重排序模型"""
         try:
             if not self._rerank_model_loaded:
-                logger.info(f"Loading rerank model: {settings.RERANK_MODEL}")
-                self.rerank_model = CrossEncoder(settings.RERANK_MODEL)
+                logger.info(f"Loading rerank model: {settings.RERANK_MODEL} (backend: {settings.EMBEDDING_BACKEND})")
+                self.rerank_model = self._load_backend_rerank_model()
                 self._rerank_model_loaded = True
                 logger.info("Rerank model loaded successfully")
             return True
@@ -42,41 +74,203 @@ class EmbeddingService:
             logger.error(f"Failed to load rerank model: {e}")
             return False
     
+    def _load_backend_embedding_model(self):
+        """按EMBEDDING_BACKEND加载嵌入模型，ONNX后端未通过一致性检查时回退到torch"""
+        backend = settings.EMBEDDING_BACKEND
+        if backend not in ("onnx", "onnx-int8"):
+            self.backend = "torch"
+            return SentenceTransformer(settings.EMBEDDING_MODEL)
+
+        try:
+            model = OnnxSentenceEncoder(settings.EMBEDDING_MODEL, settings.ONNX_MODEL_DIR,
+                                        quantize=backend == "onnx-int8")
+        except Exception as e:
+            logger.error(f"Failed to load ONNX embedding model, falling back to torch: {e}")
+            self.backend = "torch"
+            return SentenceTransformer(settings.EMBEDDING_MODEL)
+
+        if settings.EMBEDDING_PARITY_CHECK:
+            reference = SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+            min_cosine = check_parity(reference, model, _PARITY_SAMPLES)
+            passed = min_cosine >= settings.EMBEDDING_PARITY_THRESHOLD
+            self.parity_result = {"backend": backend, "min_cosine": min_cosine, "passed": passed}
+            if not passed:
+                logger.error(f"ONNX backend {backend} failed parity check "
+                             f"(min cosine {min_cosine:.4f} < {settings.EMBEDDING_PARITY_THRESHOLD}), falling back to torch")
+                self.backend = "torch"
+                return reference
+            logger.info(f"ONNX backend {backend} passed parity check (min cosine {min_cosine:.4f})")
+            del reference
+            gc.collect()
+
+        self.backend = backend
+        return model
+    
+    def _load_backend_rerank_model(self):
+        """按EMBEDDING_BACKEND加载重排序模型"""
+        backend = settings.EMBEDDING_BACKEND
+        if backend in ("onnx", "onnx-int8"):
+            try:
+                return OnnxCrossEncoder(settings.RERANK_MODEL, settings.ONNX_MODEL_DIR,
+                                        quantize=backend == "onnx-int8")
+            except Exception as e:
+                logger.error(f"Failed to load ONNX rerank model, falling back to torch: {e}")
+        return CrossEncoder(settings.RERANK_MODEL)
+    
+    def check_backend_parity(self, samples: List[str] = None) -> dict:
+        """比较当前推理后端与torch模型的输出（余弦相似度）"""
+        if not self.load_embedding_model():
+            return {"backend": self.backend, "passed": False, "error": "Embedding model not loaded"}
+        if self.backend == "torch":
+            return {"backend": "torch", "min_cosine": 1.0, "passed": True}
+
+        reference = SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+        min_cosine = check_parity(reference, self.embedding_model, samples or _PARITY_SAMPLES)
+        del reference
+        gc.collect()
+        self.parity_result = {
+            "backend": self.backend,
+            "min_cosine": min_cosine,
+            "passed": min_cosine >= settings.EMBEDDING_PARITY_THRESHOLD
+        }
+        return self.parity_result
+    
     def get_embedding_dimension(self) -> int:
         """获取嵌入向量维度"""
         if not self.load_embedding_model():
             return 384  # 默认维度
         return self.embedding_model.get_sentence_embedding_dimension()
     
-    def encode_text(self, text: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
-        """将文本编码为向量"""
+    def encode_text(self, text: Union[str, List[str]]) -> np.ndarray:
+        """将文本编码为向量
+
+        单个文本返回形状为 (dim,) 的float32数组，文本列表返回形状为 (n, dim) 的连续float32矩阵。
+        """
         try:
             if not self.load_embedding_model():
                 raise Exception("Failed to load embedding model")
             
             # 处理单个文本或文本列表
             if isinstance(text, str):
-                embedding = self.embedding_model.encode(text, convert_to_tensor=False)
-                return embedding.tolist()
+                return self._encode_with_cache([text])[0]
             else:
-                embeddings = self.embedding_model.encode(text, convert_to_tensor=False)
-                return embeddings.tolist()
+                return self._encode_with_cache(list(text))
                 
         except Exception as e:
             logger.error(f"Failed to encode text: {e}")
             if isinstance(text, str):
-                return [0.0] * self.get_embedding_dimension()
+                return np.zeros(self.get_embedding_dimension(), dtype=np.float32)
             else:
-                return [[0.0] * self.get_embedding_dimension()] * len(text)
+                return np.zeros((len(text), self.get_embedding_dimension()), dtype=np.float32)
+    
+    def _encode_with_cache(self, texts: List[str]) -> np.ndarray:
+        """编码文本列表，已缓存的文本直接复用向量"""
+        if not texts:
+            return np.zeros((0, self.get_embedding_dimension()), dtype=np.float32)
+        if self.embedding_cache is None:
+            return self._encode_bucketed(texts)
+
+        # 不同推理后端的输出存在细微差异，缓存按 模型@后端 区分
+        model_key = f"{settings.EMBEDDING_MODEL}@{self.backend}"
+        keys = [EmbeddingCache.make_key(model_key, t) for t in texts]
+        cached = self.embedding_cache.get_many(keys)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+
+        if not missing:
+            return np.ascontiguousarray(np.stack(cached), dtype=np.float32)
+
+        # 同一批次中的重复文本只编码一次
+        unique_indices = {}
+        for i in missing:
+            unique_indices.setdefault(keys[i], i)
+        unique_keys = list(unique_indices)
+        encoded = self._encode_bucketed([texts[unique_indices[key]] for key in unique_keys])
+        self.embedding_cache.put_many(unique_keys, encoded)
+
+        embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        row_by_key = {key: row for row, key in enumerate(unique_keys)}
+        for i, embedding in enumerate(cached):
+            embeddings[i] = embedding if embedding is not None else encoded[row_by_key[keys[i]]]
+        return embeddings
+    
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """计算每个文本截断后的token长度（无分词器时退化为字符数）"""
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(t) for t in texts]
+        max_length = getattr(self.embedding_model, "max_seq_length", None)
+        input_ids = tokenizer(texts, truncation=max_length is not None, max_length=max_length)["input_ids"]
+        return [len(ids) for ids in input_ids]
     
-    def encode_query(self, query: str) -> List[float]:
+    def _encode_bucketed(self, texts: List[str]) -> np.ndarray:
+        """按token长度分桶批量编码，结果保持输入顺序
+
+        文本按长度排序后依次装入批次，批大小由token预算（批大小×批内最长序列）决定，
+        使同一批内的文本长度接近，减少padding带来的无效计算。
+        """
+        if len(texts) <= 1:
+            return np.asarray(self.embedding_model.encode(texts, convert_to_tensor=False), dtype=np.float32)
+
+        lengths = self._token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        results = np.empty((len(texts), self.get_embedding_dimension()), dtype=np.float32)
+
+        def encode_batch(indices: List[int]):
+            results[indices] = self.embedding_model.encode(
+                [texts[i] for i in indices],
+                batch_size=len(indices),
+                convert_to_tensor=False
+            )
+
+        batch: List[int] = []
+        for i in order:
+            # 已按长度升序排列，加入后批内最长序列即为当前文本长度
+            if batch and (len(batch) >= settings.EMBEDDING_BATCH_SIZE
+                          or lengths[i] * (len(batch) + 1) > settings.EMBEDDING_TOKEN_BUDGET):
+                encode_batch(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            encode_batch(batch)
+
+        return results
+    
+    def get_cache_stats(self) -> dict:
+        """获取嵌入缓存统计信息"""
+        if self.embedding_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.embedding_cache.get_stats()}
+    
+    def encode_query(self, query: str) -> np.ndarray:
         """编码查询文本"""
         return self.encode_text(query)
     
-    def encode_documents(self, documents: List[str]) -> List[List[float]]:
+    def encode_documents(self, documents: List[str]) -> np.ndarray:
         """批量编码文档"""
         return self.encode_text(documents)
     
+    def encode_document_batches(self, documents: List[List[str]]) -> List[np.ndarray]:
+        """跨多个文档批量编码文本块，按文档拆分返回
+
+        所有文档的文本块合并后统一分桶，重处理任务可以填满每个批次。
+        """
+        flat = [chunk for chunks in documents for chunk in chunks]
+        embeddings = self.encode_documents(flat)
+        results = []
+        offset = 0
+        for chunks in documents:
+            results.append(embeddings[offset:offset + len(chunks)])
+            offset += len(chunks)
+        return results
+    
+    async def aencode_query(self, query: str) -> np.ndarray:
+        """在推理执行器中编码查询文本"""
+        return _from_transport(await inference_executor.run(_encode_text, query))
+    
+    async def aencode_documents(self, documents: List[str]) -> np.ndarray:
+        """在推理执行器中批量编码文档"""
+        return _from_transport(await inference_executor.run(_encode_text, documents))
+    
     def rerank_results(self, query: str, documents: List[str], scores: List[float] = None) -> List[dict]:
         """使用重排序模型对搜索结果重新排序"""
         try:
@@ -113,73 +307,185 @@ class EmbeddingService:
             return [{"text": doc, "score": score or 0.0, "index": i} 
                    for i, (doc, score) in enumerate(zip(documents, scores or [0.0] * len(documents)))]
     
+    async def arerank_results(self, query: str, documents: List[str], scores: List[float] = None) -> List[dict]:
+        """在推理执行器中重排序搜索结果"""
+        return await inference_executor.run(_rerank_results, query, documents, scores)
+    
+    def rerank_with_budget(self,
+                           query: str,
+                           documents: List[str],
+                           document_ids: Optional[List[int]] = None,
+                           top_n: int = None,
+                           batch_size: int = None,
+                           budget_ms: float = None) -> dict:
+        """在候选数量与延迟预算内进行重排序
+
+        只对前top_n个候选按固定批大小调用交叉编码器，超出延迟预算后停止，
+        未打分的候选分数为None，由调用方保持原始顺序。已缓存的 (查询, 文本块) 分数直接复用。
+        """
+        top_n = top_n if top_n is not None else settings.RERANK_TOP_N
+        batch_size = batch_size or settings.RERANK_BATCH_SIZE
+        budget = (budget_ms if budget_ms is not None else settings.RERANK_TIMEOUT_MS) / 1000.0
+        scores: List[Optional[float]] = [None] * len(documents)
+        candidate_count = min(top_n, len(documents))
+        document_ids = document_ids or [None] * len(documents)
+
+        started = time.perf_counter()
+        cache_hits = 0
+        query_key = None
+        chunk_keys: List[str] = []
+        if self.rerank_cache is not None and candidate_count:
+            query_key = RerankScoreCache.query_key(f"{settings.RERANK_MODEL}@{settings.EMBEDDING_BACKEND}", query)
+            chunk_keys = [RerankScoreCache.chunk_key(doc) for doc in documents[:candidate_count]]
+            for i, score in enumerate(self.rerank_cache.get_many(query_key, chunk_keys)):
+                scores[i] = score
+            cache_hits = sum(score is not None for score in scores)
+
+        pending = [i for i in range(candidate_count) if scores[i] is None]
+        try:
+            if pending and not self.load_rerank_model():
+                logger.warning("Rerank model not available, keeping dense order")
+                pending = []
+
+            last_batch_time = 0.0
+            for start in range(0, len(pending), batch_size):
+                elapsed = time.perf_counter() - started
+                # 预计下一批会超出预算时提前停止
+                if elapsed + last_batch_time > budget:
+                    break
+                batch_started = time.perf_counter()
+                batch = pending[start:start + batch_size]
+                batch_scores = [float(score) for score in self.rerank_model.predict(
+                    [(query, documents[i]) for i in batch], batch_size=len(batch)
+                )]
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = score
+                if query_key is not None:
+                    self.rerank_cache.put_many(query_key, [chunk_keys[i] for i in batch], batch_scores,
+                                               [document_ids[i] for i in batch])
+                last_batch_time = time.perf_counter() - batch_started
+
+        except Exception as e:
+            logger.error(f"Failed to rerank results: {e}")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        scored = sum(score is not None for score in scores[:candidate_count])
+        completed = scored == candidate_count
+        if not completed:
+            logger.info(f"Rerank stopped after {scored}/{candidate_count} candidates ({elapsed_ms:.1f} ms)")
+        return {
+            "scores": scores,
+            "completed": completed,
+            "scored": scored,
+            "cache_hits": cache_hits,
+            "elapsed_ms": elapsed_ms
+        }
+    
+    async def arerank_with_budget(self, query: str, documents: List[str], document_ids: Optional[List[int]] = None) -> dict:
+        """在推理执行器中进行有预算的重排序"""
+        return await inference_executor.run(_rerank_with_budget, query, documents, document_ids)
+    
+    def invalidate_document_rerank_scores(self, document_id: int) -> int:
+        """文档删除或重处理时失效其缓存的重排序分数"""
+        if self.rerank_cache is None:
+            return 0
+        return self.rerank_cache.invalidate_document(document_id)
+    
+    def get_rerank_cache_stats(self) -> dict:
+        """获取重排序分数缓存统计信息"""
+        if self.rerank_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.rerank_cache.get_stats()}
+    
+    def get_chunker(self, max_tokens: int = None, overlap_tokens: int = None) -> TokenChunker:
+        """获取基于嵌入模型分词器的分块器（模型不可用时使用近似token计数）"""
+        tokenizer = None
+        model_max_tokens = None
+        if self.load_embedding_model():
+            tokenizer = getattr(self.embedding_model, "tokenizer", None)
+            max_seq_length = getattr(self.embedding_model, "max_seq_length", None)
+            if max_seq_length:
+                # 扣除 [CLS] 与 [SEP]
+                model_max_tokens = max_seq_length - 2
+
+        max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS or model_max_tokens or 254
+        if overlap_tokens is None:
+            overlap_tokens = settings.CHUNK_OVERLAP_TOKENS
+        return TokenChunker(max_tokens, overlap_tokens, tokenizer)
+    
     def chunk_text(self, text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
-        """将长文本分块"""
+        """将长文本分块
+
+        CHUNK_STRATEGY=token 时 chunk_size/overlap 为token数，否则为字符数。
+        """
+        if settings.CHUNK_STRATEGY == "token":
+            return self.get_chunker(chunk_size, overlap).chunk(text)
+
         chunk_size = chunk_size or settings.CHUNK_SIZE
         overlap = overlap or settings.CHUNK_OVERLAP
-        
-        if len(text) <= chunk_size:
-            return [text]
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            
-            # 如果不是最后一块，尝试在句号、换行符或空格处分割
-            if end < len(text):
-                # 向后查找合适的分割点
-                for i in range(end, max(start + chunk_size // 2, end - 100), -1):
-                    if text[i] in '.。\n ':
-                        end = i + 1
-                        break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # 下一块的起始位置考虑重叠
-            start = end - overlap if end < len(text) else end
-            
-            # 避免无限循环
-            if start >= end:
-                break
-        
-        return chunks
+        return chunk_by_chars(text, chunk_size, overlap)
     
-    def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
+    def chunk_text_spans(self, text: str) -> List[ChunkSpan]:
+        """将长文本分块，并返回每块的字符范围与token数"""
+        if settings.CHUNK_STRATEGY == "token":
+            return list(self.get_chunker().iter_spans([text]))
+        return chunk_spans_by_chars(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+    
+    def calculate_similarity(self, embedding1: Union[np.ndarray, List[float]], embedding2: Union[np.ndarray, List[float]]) -> float:
         """计算两个向量的余弦相似度"""
         try:
-            vec1 = np.array(embedding1)
-            vec2 = np.array(embedding2)
-            
-            # 计算余弦相似度
-            dot_product = np.dot(vec1, vec2)
-            norm1 = np.linalg.norm(vec1)
-            norm2 = np.linalg.norm(vec2)
-            
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
-            
-            similarity = dot_product / (norm1 * norm2)
-            return float(similarity)
-            
+            return float(cosine_similarity(np.asarray(embedding1), np.atleast_2d(embedding2))[0])
         except Exception as e:
             logger.error(f"Failed to calculate similarity: {e}")
             return 0.0
     
+    def batch_similarity(self, queries: np.ndarray, matrix: np.ndarray, normalized: bool = False) -> np.ndarray:
+        """批量计算余弦相似度（查询对矩阵或矩阵对矩阵）"""
+        return cosine_similarity(queries, matrix, normalized=normalized,
+                                 max_memory_mb=settings.SIMILARITY_MAX_MEMORY_MB)
+    
+    def top_k_similar(self, queries: np.ndarray, matrix: np.ndarray, k: int,
+                      normalized: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """返回每个查询最相似的k个向量的 (索引, 分数)"""
+        return top_k_similar(queries, matrix, k, normalized=normalized,
+                             max_memory_mb=settings.SIMILARITY_MAX_MEMORY_MB)
+    
     def get_model_info(self) -> dict:
         """获取模型信息"""
         return {
             "embedding_model": settings.EMBEDDING_MODEL,
+            "backend": self.backend,
+            "parity_check": self.parity_result,
             "rerank_model": settings.RERANK_MODEL,
             "embedding_dimension": self.get_embedding_dimension(),
+            "chunk_strategy": settings.CHUNK_STRATEGY,
             "chunk_size": settings.CHUNK_SIZE,
             "chunk_overlap": settings.CHUNK_OVERLAP,
             "embedding_model_loaded": self._embedding_model_loaded,
-            "rerank_model_loaded": self._rerank_model_loaded
+            "rerank_model_loaded": self._rerank_model_loaded,
+            "embedding_cache": self.get_cache_stats()
         }
 
 # 全局嵌入服务实例
 embedding_service = EmbeddingService()
+
+
+# 推理执行器使用的模块级入口（进程池模式下需要可pickle）
+def _encode_text(text: Union[str, List[str]]) -> np.ndarray:
+    # 进程池模式下结果需要跨进程传输，按存储精度压缩
+    embeddings = embedding_service.encode_text(text)
+    if settings.INFERENCE_EXECUTOR == "process":
+        return embeddings.astype(settings.EMBEDDING_STORAGE_DTYPE)
+    return embeddings
+
+
+def _from_transport(embeddings: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def _rerank_results(query: str, documents: List[str], scores: List[float] = None) -> List[dict]:
+    return embedding_service.rerank_results(query, documents, scores)
+
+
+def _rerank_with_budget(query: str, documents: List[str], document_ids: Optional[List[int]] = None) -> dict:
+    return embedding_service.rerank_with_budget(query, documents, document_ids)
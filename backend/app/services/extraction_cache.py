@@ -0,0 +1,206 @@
+import codecs
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from app.core.config import settings
+from app.utils.file_processor import FileProcessor
+
+logger = logging.getLogger(__name__)
+
+# 解压时每次读取的字节数
+_READ_BLOCK_SIZE = 256 * 1024
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ExtractionCache:
+    """按文件内容哈希与提取器版本缓存提取文本的磁盘缓存
+
+    每个条目由两个文件组成：zlib压缩的文本 <key>.txt.z，以及记录每页/每段
+    起始字符偏移的 <key>.json（最后写入，存在即表示条目完整）。
+    键为 "<内容哈希>.<文件类型>.<提取器版本>"，提取器代码变化时旧条目自然失效。
+    总大小超过上限时按最近访问时间淘汰。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, extractor_version: str):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.extractor_version = extractor_version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, content_hash: str, file_type: str) -> str:
+        return f"{content_hash}.{file_type}.{self.extractor_version}"
+
+    def _paths(self, key: str):
+        base = self.directory / key[:2]
+        return base / f"{key}.txt.z", base / f"{key}.json"
+
+    def get_page_offsets(self, key: str) -> Optional[List[int]]:
+        """返回条目的页偏移，未命中时返回None"""
+        _, meta_path = self._paths(key)
+        try:
+            return json.loads(meta_path.read_text())["page_offsets"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def iter_segments(self, key: str) -> Optional[Iterator[str]]:
+        """命中时返回按页/段产生文本的迭代器，未命中时返回None"""
+        text_path, meta_path = self._paths(key)
+        offsets = self.get_page_offsets(key)
+        if offsets is None or not text_path.exists():
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        try:
+            # 更新访问时间，用于按最近访问淘汰
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return self._read_segments(text_path, offsets)
+
+    def _read_segments(self, text_path: Path, offsets: List[int]) -> Iterator[str]:
+        """流式解压并按页偏移切分"""
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        boundaries = iter(offsets[1:])
+        next_boundary = next(boundaries, None)
+        position = 0
+        pending = ""
+        with open(text_path, "rb") as f:
+            while True:
+                block = f.read(_READ_BLOCK_SIZE)
+                text = decoder.decode(decompressor.decompress(block) if block else decompressor.flush(),
+                                      final=not block)
+                pending += text
+                while next_boundary is not None and next_boundary <= position + len(pending):
+                    cut = next_boundary - position
+                    yield pending[:cut]
+                    pending = pending[cut:]
+                    position = next_boundary
+                    next_boundary = next(boundaries, None)
+                if not block:
+                    break
+        if pending:
+            yield pending
+
+    def record(self, key: str, segments: Iterable[str]) -> Iterator[str]:
+        """透传提取出的文本，完整读完后写入缓存（提取中途失败则不写入）"""
+        text_path, meta_path = self._paths(key)
+        text_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = text_path.with_name(f".{uuid.uuid4().hex}.tmp")
+        compressor = zlib.compressobj(6)
+        offsets: List[int] = []
+        length = 0
+        completed = False
+        try:
+            with open(temp_path, "wb") as f:
+                for segment in segments:
+                    offsets.append(length)
+                    length += len(segment)
+                    f.write(compressor.compress(segment.encode("utf-8")))
+                    yield segment
+                f.write(compressor.flush())
+            os.replace(temp_path, text_path)
+            meta_path.write_text(json.dumps({"page_offsets": offsets, "length": length}))
+            completed = True
+        finally:
+            if not completed:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+        self._enforce_limit()
+
+    def _entries(self):
+        """列出完整条目：(key, 大小, 最近访问时间)"""
+        if not self.directory.exists():
+            return []
+        entries = []
+        for meta_path in self.directory.glob("*/*.json"):
+            key = meta_path.name[:-len(".json")]
+            text_path, _ = self._paths(key)
+            try:
+                size = text_path.stat().st_size + meta_path.stat().st_size
+                entries.append((key, size, meta_path.stat().st_mtime))
+            except OSError:
+                continue
+        return entries
+
+    def _remove(self, key: str):
+        text_path, meta_path = self._paths(key)
+        for path in (meta_path, text_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _enforce_limit(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            evicted = 0
+            for key, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                self._remove(key)
+                evicted += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            self.evictions += evicted
+            logger.info(f"Evicted {evicted} extraction cache entries")
+
+    def evict(self, content_hash: Optional[str] = None) -> int:
+        """删除指定内容哈希的全部条目（不指定时清空），返回删除的条目数"""
+        if content_hash is not None and not _HASH_RE.match(content_hash):
+            raise ValueError("Invalid content hash")
+        with self._lock:
+            removed = 0
+            for key, _, _ in self._entries():
+                if content_hash is None or key.startswith(f"{content_hash}."):
+                    self._remove(key)
+                    removed += 1
+            return removed
+
+    def get_stats(self) -> dict:
+        """获取缓存大小与命中统计"""
+        with self._lock:
+            entries = self._entries()
+            lookups = self.hits + self.misses
+            return {
+                "directory": str(self.directory),
+                "extractor_version": self.extractor_version,
+                "entries": len(entries),
+                "size_bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _create_extraction_cache() -> Optional[ExtractionCache]:
+    if not settings.EXTRACTION_CACHE_ENABLED:
+        return None
+    return ExtractionCache(
+        directory=settings.EXTRACTION_CACHE_DIR,
+        max_bytes=settings.EXTRACTION_CACHE_MAX_MB * 1024 * 1024,
+        extractor_version=FileProcessor.EXTRACTOR_VERSION
+    )
+
+
+# 全局提取缓存实例（未启用时为None）
+extraction_cache = _create_extraction_cache()
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """推理执行器
+
+    嵌入编码和重排序等阻塞调用统一在这里的有界线程池/进程池中执行，
+    避免阻塞uvicorn事件循环。进程池模式下提交的函数必须是可pickle的模块级函数。
+    """
+
+    def __init__(self, mode: str = "thread", max_workers: int = 4, max_pending: int = 64):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unsupported inference executor mode: {mode}")
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+                logger.info(f"Started {self.mode} inference executor with {self.max_workers} workers")
+            return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """限制排队与执行中的任务总数（每个事件循环一个信号量）"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在推理执行器中运行阻塞函数并等待结果"""
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            self.submitted += 1
+            self.in_flight += 1
+            try:
+                result = await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+                self.completed += 1
+                return result
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        """关闭执行器"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+                logger.info("Inference executor shut down")
+
+    def get_stats(self) -> dict:
+        """获取执行器统计信息"""
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+# 全局推理执行器实例
+inference_executor = InferenceExecutor(
+    mode=settings.INFERENCE_EXECUTOR,
+    max_workers=settings.INFERENCE_WORKERS,
+    max_pending=settings.INFERENCE_MAX_PENDING
+)
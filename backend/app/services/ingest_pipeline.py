@@ -0,0 +1,224 @@
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from typing import IO, Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_service import embedding_service
+from app.services.vector_service import milvus_service
+from app.utils.text_chunker import ChunkSpan, assign_pages
+
+logger = logging.getLogger(__name__)
+
+# 阶段结束标记
+_DONE = object()
+
+
+@dataclass
+class IngestResult:
+    """流水线运行结果"""
+    chunk_count: int = 0
+    vector_count: int = 0
+    vectorized: bool = False
+    vector_error: Optional[str] = None
+
+
+class IngestPipeline:
+    """流式入库流水线：提取 → 分块 → 编码 → 写入Milvus
+
+    各阶段运行在独立线程中，通过有界队列衔接：文本提取与分块在生产线程中进行，
+    嵌入编码在调用线程中按固定批大小执行，Milvus写入在写入线程中分批进行。
+    内存占用只与队列长度和批大小有关，与文档大小无关。
+    向量化失败时仍会继续消费文本（用于保存文档内容），并删除已写入的部分向量。
+    指定 chunk_sink 时，每批文本块（含字符范围与页码）在调用线程中交给 chunk_sink(首个chunk_id, 文本块)。
+    """
+
+    def __init__(self,
+                 document_id: int,
+                 vectorize: bool = True,
+                 embed_batch_size: int = None,
+                 insert_batch_size: int = None,
+                 queue_size: int = None,
+                 flush: bool = False,
+                 owner_id: Optional[int] = None,
+                 chunk_sink: Optional[Callable[[int, List[ChunkSpan]], None]] = None):
+        self.document_id = document_id
+        self.owner_id = owner_id
+        self.chunk_sink = chunk_sink
+        self.vectorize = vectorize
+        # 默认不flush：写入由Milvus写缓冲跨文档合并，需要立即落盘时传 flush=True
+        self.flush = flush
+        self.embed_batch_size = embed_batch_size or settings.INGEST_EMBED_BATCH_SIZE
+        self.insert_batch_size = insert_batch_size or settings.INGEST_INSERT_BATCH_SIZE
+        queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+        self._chunk_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._insert_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._extract_error: Optional[BaseException] = None
+        self._sink_error: Optional[BaseException] = None
+        self._vector_error: Optional[str] = None
+        # 各页/段在全文中的起始字符偏移（由提取线程追加）
+        self._page_offsets: List[int] = []
+
+    def _put(self, target: "queue.Queue", item) -> bool:
+        """放入有界队列，流水线中止时放弃"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, segments: Iterable[str], text_sink: Optional[IO[str]]):
+        """提取与分块阶段"""
+        def tee() -> Iterator[str]:
+            position = 0
+            for segment in segments:
+                if text_sink is not None:
+                    text_sink.write(segment)
+                self._page_offsets.append(position)
+                position += len(segment)
+                yield segment
+
+        try:
+            if settings.CHUNK_STRATEGY == "token":
+                chunks = embedding_service.get_chunker().iter_spans(tee())
+            else:
+                # 按字符分块的旧策略需要完整文本
+                chunks = iter(embedding_service.chunk_text_spans("".join(tee())))
+            batch: List[ChunkSpan] = []
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= self.embed_batch_size:
+                    if not self._put(self._chunk_queue, batch):
+                        return
+                    batch = []
+            if batch:
+                self._put(self._chunk_queue, batch)
+        except BaseException as e:
+            self._extract_error = e
+            self._stop.set()
+        finally:
+            # 调用线程会一直消费到结束标记，这里可以阻塞等待
+            self._chunk_queue.put(_DONE)
+
+    def _write(self, result: IngestResult):
+        """Milvus写入阶段：合并编码批次后分批插入"""
+        pending_chunks: List[str] = []
+        pending_embeddings: List[np.ndarray] = []
+        pending_count = 0
+
+        def flush_pending():
+            nonlocal pending_chunks, pending_embeddings, pending_count
+            if not pending_count or self._vector_error:
+                return
+            offset = result.vector_count
+            try:
+                success = milvus_service.insert_vectors(
+                    document_id=self.document_id,
+                    chunks=pending_chunks,
+                    embeddings=np.concatenate(pending_embeddings),
+                    metadata=[f"doc_{self.document_id}_chunk_{offset + i}" for i in range(pending_count)],
+                    chunk_id_offset=offset,
+                    flush=False,
+                    owner_id=self.owner_id
+                )
+            except Exception as e:
+                logger.error(f"Failed to insert vectors for document {self.document_id}: {e}")
+                success = False
+            if success:
+                result.vector_count += pending_count
+            else:
+                self._vector_error = "Failed to insert vectors into Milvus"
+            pending_chunks, pending_embeddings, pending_count = [], [], 0
+
+        while True:
+            try:
+                item = self._insert_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                break
+            chunks, embeddings = item
+            pending_chunks.extend(chunks)
+            pending_embeddings.append(embeddings)
+            pending_count += len(chunks)
+            if pending_count >= self.insert_batch_size:
+                flush_pending()
+        flush_pending()
+
+    def run(self, segments: Iterable[str], text_sink: Optional[IO[str]] = None) -> IngestResult:
+        """运行流水线；提取阶段的异常会重新抛出"""
+        result = IngestResult()
+        if self.vectorize:
+            dimension = embedding_service.get_embedding_dimension()
+            if not milvus_service.create_collection(dimension):
+                self._vector_error = "Failed to create Milvus collection"
+
+        producer = threading.Thread(target=self._produce, args=(segments, text_sink),
+                                    name=f"ingest-extract-{self.document_id}", daemon=True)
+        writer = threading.Thread(target=self._write, args=(result,),
+                                  name=f"ingest-write-{self.document_id}", daemon=True)
+        producer.start()
+        writer.start()
+
+        try:
+            while True:
+                spans = self._chunk_queue.get()
+                if spans is _DONE:
+                    break
+                first_chunk_id = result.chunk_count
+                result.chunk_count += len(spans)
+                if self._sink_error is not None:
+                    continue
+                if self.chunk_sink is not None:
+                    # 块的全部文本已提取，对应页的偏移均已记录
+                    assign_pages(spans, self._page_offsets)
+                    try:
+                        self.chunk_sink(first_chunk_id, spans)
+                    except Exception as e:
+                        # 继续消费到结束标记，避免提取线程阻塞
+                        self._sink_error = e
+                        self._stop.set()
+                        continue
+                if not self.vectorize or self._vector_error:
+                    continue
+                batch = [span.text for span in spans]
+                try:
+                    embeddings = embedding_service.encode_documents(batch)
+                except Exception as e:
+                    self._vector_error = f"Failed to generate embeddings: {e}"
+                    continue
+                self._put(self._insert_queue, (batch, embeddings))
+        finally:
+            self._put(self._insert_queue, _DONE)
+            producer.join()
+            writer.join()
+
+        if self._extract_error is not None or self._sink_error is not None:
+            self._discard_vectors(result)
+            raise self._extract_error or self._sink_error
+
+        if self.vectorize:
+            if self._vector_error is None and result.chunk_count == 0:
+                self._vector_error = "No chunks generated"
+            if self._vector_error is None:
+                if self.flush:
+                    milvus_service.flush()
+                result.vectorized = True
+            else:
+                self._discard_vectors(result)
+        result.vector_error = self._vector_error
+        return result
+
+    def _discard_vectors(self, result: IngestResult):
+        """删除失败时已写入的部分向量"""
+        if result.vector_count:
+            milvus_service.delete_document_vectors(self.document_id)
+            result.vector_count = 0
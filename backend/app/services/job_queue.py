@@ -0,0 +1,484 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+RETRYING = "retrying"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+JobHandler = Callable[[Dict[str, Any]], None]
+
+
+class _RedisJobStore:
+    """基于Redis的任务存储
+
+    每个任务是一个哈希 <prefix>job:<key>；待执行任务在有序集合 <prefix>queue 中，
+    分数为可执行时间；执行中的任务在 <prefix>running 中，分数为租约到期时间，
+    租约过期（工作进程崩溃）的任务会被重新放回队列。每次领取生成新的租约令牌，
+    续约与完成只对持有当前令牌的执行生效。状态变更都用Lua脚本原子完成。
+    """
+
+    _ENQUEUE = """
+    local status = redis.call('HGET', KEYS[1], 'status')
+    if status == 'queued' or status == 'retrying' then
+        redis.call('HSET', KEYS[1], 'kind', ARGV[2], 'payload', ARGV[3], 'status', 'queued', 'run_at', ARGV[4],
+                   'updated_at', ARGV[4])
+        redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+        return 0
+    end
+    if status == 'running' then
+        redis.call('HSET', KEYS[1], 'kind', ARGV[2], 'payload', ARGV[3], 'rerun', 1, 'updated_at', ARGV[4])
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], 'key', ARGV[1], 'kind', ARGV[2], 'payload', ARGV[3], 'status', 'queued',
+               'attempts', 0, 'max_attempts', ARGV[5], 'rerun', 0, 'last_error', '',
+               'run_at', ARGV[4], 'created_at', ARGV[4], 'updated_at', ARGV[4])
+    redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+    return 1
+    """
+
+    _CLAIM = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for _, key in ipairs(expired) do
+        redis.call('ZREM', KEYS[2], key)
+        redis.call('ZADD', KEYS[1], ARGV[1], key)
+        redis.call('HSET', ARGV[3] .. key, 'status', 'queued', 'updated_at', ARGV[1])
+    end
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+    if #due == 0 then
+        return false
+    end
+    local key = due[1]
+    redis.call('ZREM', KEYS[1], key)
+    redis.call('ZADD', KEYS[2], ARGV[2], key)
+    redis.call('HSET', ARGV[3] .. key, 'status', 'running', 'rerun', 0, 'lease_until', ARGV[2],
+               'lease_token', ARGV[4], 'updated_at', ARGV[1])
+    redis.call('HINCRBY', ARGV[3] .. key, 'attempts', 1)
+    return key
+    """
+
+    _RENEW = """
+    if redis.call('HGET', KEYS[1], 'status') ~= 'running' or redis.call('HGET', KEYS[1], 'lease_token') ~= ARGV[2] then
+        return 0
+    end
+    redis.call('ZADD', KEYS[2], 'XX', ARGV[3], ARGV[1])
+    redis.call('HSET', KEYS[1], 'lease_until', ARGV[3])
+    return 1
+    """
+
+    _COMPLETE = """
+    if redis.call('HGET', KEYS[1], 'status') ~= 'running' or redis.call('HGET', KEYS[1], 'lease_token') ~= ARGV[6] then
+        return 0
+    end
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    redis.call('HSET', KEYS[1], 'lease_token', '')
+    if redis.call('HGET', KEYS[1], 'rerun') == '1' then
+        redis.call('HSET', KEYS[1], 'status', 'queued', 'attempts', 0, 'rerun', 0, 'last_error', '',
+                   'run_at', ARGV[2], 'updated_at', ARGV[2])
+        redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+        return 1
+    end
+    redis.call('HSET', KEYS[1], 'status', ARGV[3], 'last_error', ARGV[5], 'run_at', ARGV[4], 'updated_at', ARGV[2])
+    if ARGV[3] == 'retrying' then
+        redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+    end
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "kb:jobs:"):
+        self.name = "redis"
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._client.ping()
+        self._prefix = prefix
+        self._queue_key = f"{prefix}queue"
+        self._running_key = f"{prefix}running"
+        self._enqueue = self._client.register_script(self._ENQUEUE)
+        self._claim = self._client.register_script(self._CLAIM)
+        self._renew = self._client.register_script(self._RENEW)
+        self._complete = self._client.register_script(self._COMPLETE)
+
+    def _job_key(self, key: str) -> str:
+        return f"{self._prefix}job:{key}"
+
+    def enqueue(self, key: str, kind: str, payload: str, max_attempts: int) -> bool:
+        now = time.time()
+        return bool(self._enqueue(keys=[self._job_key(key), self._queue_key],
+                                  args=[key, kind, payload, now, max_attempts]))
+
+    def claim(self, lease_seconds: float) -> Optional[dict]:
+        now = time.time()
+        key = self._claim(keys=[self._queue_key, self._running_key],
+                          args=[now, now + lease_seconds, f"{self._prefix}job:", uuid.uuid4().hex])
+        return self.get(key) if key else None
+
+    def renew(self, key: str, lease_token: str, lease_seconds: float) -> bool:
+        return bool(self._renew(keys=[self._job_key(key), self._running_key],
+                                args=[key, lease_token, time.time() + lease_seconds]))
+
+    def complete(self, key: str, lease_token: str, status: str, error: str = "", retry_at: float = 0.0) -> bool:
+        now = time.time()
+        return bool(self._complete(keys=[self._job_key(key), self._queue_key, self._running_key],
+                                   args=[key, now, status, retry_at or now, error, lease_token]))
+
+    def get(self, key: str) -> Optional[dict]:
+        data = self._client.hgetall(self._job_key(key))
+        return data or None
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "queued": self._client.zcard(self._queue_key),
+            "running": self._client.zcard(self._running_key),
+        }
+
+
+class _SqliteJobStore:
+    """基于SQLite的任务存储（本地运行时代替Redis），语义与Redis存储一致"""
+
+    def __init__(self, path: str):
+        self.name = "sqlite"
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    rerun INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT NOT NULL DEFAULT '',
+                    run_at REAL NOT NULL,
+                    lease_until REAL,
+                    lease_token TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)")
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_token" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_token TEXT")
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, key: str, kind: str, payload: str, max_attempts: int) -> bool:
+        now = time.time()
+
+        def run(conn: sqlite3.Connection) -> bool:
+            row = conn.execute("SELECT status FROM jobs WHERE key = ?", (key,)).fetchone()
+            if row is not None and row["status"] in (QUEUED, RETRYING):
+                conn.execute("UPDATE jobs SET kind = ?, payload = ?, status = ?, run_at = ?, updated_at = ? WHERE key = ?",
+                             (kind, payload, QUEUED, now, now, key))
+                return False
+            if row is not None and row["status"] == RUNNING:
+                conn.execute("UPDATE jobs SET kind = ?, payload = ?, rerun = 1, updated_at = ? WHERE key = ?",
+                             (kind, payload, now, key))
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (key, kind, payload, status, attempts, max_attempts, rerun, "
+                "last_error, run_at, lease_until, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, 0, '', ?, NULL, ?, ?)",
+                (key, kind, payload, QUEUED, max_attempts, now, now, now)
+            )
+            return True
+
+        return self._transaction(run)
+
+    def claim(self, lease_seconds: float) -> Optional[dict]:
+        now = time.time()
+
+        def run(conn: sqlite3.Connection) -> Optional[dict]:
+            # 租约过期的任务重新入队
+            conn.execute("UPDATE jobs SET status = ?, run_at = ?, updated_at = ? WHERE status = ? AND lease_until < ?",
+                         (QUEUED, now, now, RUNNING, now))
+            row = conn.execute(
+                "SELECT key FROM jobs WHERE status IN (?, ?) AND run_at <= ? ORDER BY run_at LIMIT 1",
+                (QUEUED, RETRYING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, rerun = 0, attempts = attempts + 1, lease_until = ?, lease_token = ?, "
+                "updated_at = ? WHERE key = ?",
+                (RUNNING, now + lease_seconds, uuid.uuid4().hex, now, row["key"])
+            )
+            return dict(conn.execute("SELECT * FROM jobs WHERE key = ?", (row["key"],)).fetchone())
+
+        return self._transaction(run)
+
+    def renew(self, key: str, lease_token: str, lease_seconds: float) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE key = ? AND status = ? AND lease_token = ?",
+                (time.time() + lease_seconds, key, RUNNING, lease_token)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, key: str, lease_token: str, status: str, error: str = "", retry_at: float = 0.0) -> bool:
+        now = time.time()
+
+        def run(conn: sqlite3.Connection) -> bool:
+            row = conn.execute("SELECT status, rerun, lease_token FROM jobs WHERE key = ?", (key,)).fetchone()
+            if row is None or row["status"] != RUNNING or row["lease_token"] != lease_token:
+                return False
+            if row["rerun"]:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = 0, rerun = 0, last_error = '', run_at = ?, "
+                    "lease_until = NULL, lease_token = NULL, updated_at = ? WHERE key = ?",
+                    (QUEUED, now, now, key)
+                )
+                return True
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, run_at = ?, lease_until = NULL, lease_token = NULL, "
+                "updated_at = ? WHERE key = ?",
+                (status, error, retry_at or now, now, key)
+            )
+            return True
+
+        return self._transaction(run)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {row["status"]: row["n"] for row in rows}
+        return {
+            "queued": counts.get(QUEUED, 0) + counts.get(RETRYING, 0),
+            "running": counts.get(RUNNING, 0),
+            "succeeded": counts.get(SUCCEEDED, 0),
+            "failed": counts.get(FAILED, 0),
+        }
+
+
+def _create_store():
+    """按配置创建任务存储；auto 模式下Redis不可用时回退到SQLite"""
+    backend = settings.JOB_QUEUE_BACKEND
+    if backend in ("redis", "auto"):
+        try:
+            if not REDIS_AVAILABLE:
+                raise RuntimeError("redis package is not installed")
+            return _RedisJobStore(settings.REDIS_URL)
+        except Exception as e:
+            if backend == "redis":
+                raise
+            logger.warning(f"Redis job queue unavailable ({e}), falling back to SQLite")
+    elif backend != "sqlite":
+        raise ValueError(f"Unsupported job queue backend: {backend}")
+    return _SqliteJobStore(settings.JOB_QUEUE_SQLITE_PATH)
+
+
+class JobQueue:
+    """持久化任务队列与工作线程池
+
+    任务以幂等键标识（例如 document:<文档ID>）：同一键已在排队时只更新任务类型与参数，
+    正在执行时标记为完成后按新的类型与参数重新执行，同一键的任务不会并发执行。失败的任务按指数退避重试，
+    超过最大次数后标记为失败。执行中的任务持有租约并定期续约，
+    进程退出后租约过期的任务会被其他工作线程重新领取。租约按每次领取的令牌区分，
+    旧的执行（租约已过期并被重新领取）既不会续约新执行的租约，也不会覆盖其完成状态。
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 max_attempts: int = 3,
+                 retry_backoff_seconds: float = 5.0,
+                 lease_seconds: float = 300.0,
+                 poll_interval_seconds: float = 1.0):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._handlers: Dict[str, JobHandler] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        # 租约令牌 -> 任务键
+        self._active: Dict[str, str] = {}
+        self._active_lock = threading.Lock()
+
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def store(self):
+        with self._store_lock:
+            if self._store is None:
+                self._store = _create_store()
+                logger.info(f"Using {self._store.name} job queue backend")
+            return self._store
+
+    def register_handler(self, kind: str, handler: JobHandler):
+        """注册任务处理函数；处理函数抛出异常表示失败"""
+        self._handlers[kind] = handler
+
+    def enqueue(self, key: str, kind: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+        """提交任务，返回是否新建了任务（同一键已在排队或执行中时返回False）"""
+        created = self.store.enqueue(key, kind, json.dumps(payload or {}), self.max_attempts)
+        logger.info(f"{'Enqueued' if created else 'Updated'} job {key}")
+        return created
+
+    def get_job(self, key: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态"""
+        job = self.store.get(key)
+        if job is None:
+            return None
+        return {
+            "key": job["key"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "payload": json.loads(job["payload"]),
+            "attempts": int(job["attempts"]),
+            "max_attempts": int(job["max_attempts"]),
+            "last_error": job["last_error"] or None,
+            "run_at": float(job["run_at"]),
+            "created_at": float(job["created_at"]),
+            "updated_at": float(job["updated_at"]),
+        }
+
+    def _retry_delay(self, attempts: int) -> float:
+        """指数退避并加入随机抖动"""
+        delay = self.retry_backoff_seconds * (2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _complete(self, key: str, lease_token: str, status: str, error: str = "", retry_at: float = 0.0) -> bool:
+        if self.store.complete(key, lease_token, status, error, retry_at):
+            return True
+        logger.warning(f"Lease of job {key} was lost, ignoring its {status} result")
+        return False
+
+    def _execute(self, job: dict):
+        key, attempts, lease_token = job["key"], int(job["attempts"]), job["lease_token"]
+        handler = self._handlers.get(job["kind"])
+        with self._active_lock:
+            self._active[lease_token] = key
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind {job['kind']}")
+            handler(json.loads(job["payload"]))
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            if attempts < int(job["max_attempts"]):
+                retry_at = time.time() + self._retry_delay(attempts)
+                if self._complete(key, lease_token, RETRYING, error, retry_at):
+                    self.retried += 1
+                    logger.warning(f"Job {key} failed (attempt {attempts}), retrying: {error}")
+            else:
+                if self._complete(key, lease_token, FAILED, error):
+                    self.failed += 1
+                    logger.error(f"Job {key} failed after {attempts} attempts: {error}")
+        else:
+            if self._complete(key, lease_token, SUCCEEDED):
+                self.succeeded += 1
+        finally:
+            with self._active_lock:
+                self._active.pop(lease_token, None)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval_seconds)
+                continue
+            self._execute(job)
+
+    def _heartbeat(self):
+        """为执行中的任务续约"""
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._active_lock:
+                leases = list(self._active.items())
+            for lease_token, key in leases:
+                try:
+                    if not self.store.renew(key, lease_token, self.lease_seconds):
+                        logger.warning(f"Lease of job {key} was lost, another worker may run it again")
+                except Exception as e:
+                    logger.warning(f"Failed to renew lease for job {key}: {e}")
+
+    def start(self):
+        """启动工作线程"""
+        if self._threads:
+            return
+        self._stop.clear()
+        # 提前创建任务存储，使配置错误在启动阶段暴露
+        store = self.store
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"Started {self.workers} job workers on {store.name} backend")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止领取新任务；执行中的任务在租约过期后会被重新领取"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Job workers stopped")
+
+    def get_stats(self) -> dict:
+        """获取队列统计信息"""
+        with self._active_lock:
+            active = len(self._active)
+        return {
+            "backend": self.store.name,
+            "workers": self.workers,
+            "active": active,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            **self.store.counts(),
+        }
+
+
+# 全局任务队列实例
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_backoff_seconds=settings.JOB_RETRY_BACKOFF_SECONDS,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    poll_interval_seconds=settings.JOB_POLL_INTERVAL_SECONDS
+)
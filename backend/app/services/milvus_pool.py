@@ -0,0 +1,251 @@
+import asyncio
+import functools
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 每个连接允许同时在异步执行器中等待的调用数
+_WORKERS_PER_CHANNEL = 4
+
+_pool_ids = itertools.count()
+
+
+class MilvusCallTimeout(TimeoutError):
+    """调用在截止时间内没有完成"""
+
+
+class _Channel:
+    """连接池中的一个连接（独立的alias，对应独立的gRPC通道）"""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+        self.connected = False
+        self.collections: Dict[str, Any] = {}
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.last_error: Optional[str] = None
+        self.latency_ms = 0.0  # 成功调用延迟的指数移动平均
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def get_stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "alias": self.alias,
+            "connected": self.connected,
+            "healthy": self.is_healthy(now),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "latency_ms": round(self.latency_ms, 2),
+        }
+
+
+class MilvusConnectionPool:
+    """Milvus连接池
+
+    维护多个连接alias（每个alias一条gRPC通道），每次调用选择当前健康且执行中调用最少的连接，
+    使并发检索不再排队在同一条通道上。每次调用都有截止时间（作为gRPC deadline传给客户端），
+    可重试的错误在截止时间内按带抖动的指数退避重试；失败的连接在冷却期内不再被选中，
+    冷却结束后重新建立连接。
+
+    连接与集合句柄通过 connect(alias, timeout)、disconnect(alias)、open_collection(name, alias) 创建，
+    non_retryable 中的异常（参数或schema错误）直接抛出，也不计入连接失败。
+    """
+
+    def __init__(self,
+                 connect: Callable[[str, float], None],
+                 disconnect: Callable[[str], None],
+                 open_collection: Callable[[str, str], Any],
+                 size: int = 4,
+                 max_retries: int = 2,
+                 retry_backoff_seconds: float = 0.2,
+                 unhealthy_cooldown_seconds: float = 10.0,
+                 non_retryable: Tuple[type, ...] = (ValueError, TypeError, KeyError)):
+        self._connect = connect
+        self._disconnect = disconnect
+        self._open_collection = open_collection
+        self.non_retryable = non_retryable
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.unhealthy_cooldown_seconds = unhealthy_cooldown_seconds
+        pool_id = next(_pool_ids)
+        self._channels: List[_Channel] = [_Channel(f"kb-pool{pool_id}-{i}") for i in range(max(1, size))]
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.retries = 0
+        self.timeouts = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._channels)
+
+    def _acquire(self, exclude: Optional[_Channel] = None) -> _Channel:
+        """选择连接：优先健康连接中执行中调用最少的；全部不健康时选冷却最早结束的"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [channel for channel in self._channels if channel is not exclude] or self._channels
+            healthy = [channel for channel in candidates if channel.is_healthy(now)]
+            if healthy:
+                channel = min(healthy, key=lambda channel: channel.in_flight)
+            else:
+                channel = min(candidates, key=lambda channel: channel.unhealthy_until)
+            channel.in_flight += 1
+            channel.calls += 1
+            return channel
+
+    def _collection(self, channel: _Channel, collection_name: str, timeout: float):
+        """获取连接上的集合句柄，连接断开过时重新连接"""
+        if not channel.connected:
+            self._connect(channel.alias, timeout)
+            channel.connected = True
+            channel.collections = {}
+        collection = channel.collections.get(collection_name)
+        if collection is None:
+            collection = self._open_collection(collection_name, channel.alias)
+            channel.collections[collection_name] = collection
+        return collection
+
+    def _release(self, channel: _Channel, started: float, error: Optional[Exception] = None):
+        now = time.monotonic()
+        reconnect = False
+        with self._lock:
+            channel.in_flight -= 1
+            if error is None:
+                channel.consecutive_failures = 0
+                channel.unhealthy_until = 0.0
+                elapsed_ms = (now - started) * 1000
+                channel.latency_ms = elapsed_ms if channel.latency_ms == 0 else channel.latency_ms * 0.9 + elapsed_ms * 0.1
+            else:
+                channel.failures += 1
+                channel.consecutive_failures += 1
+                channel.last_error = str(error)
+                # 冷却期内不再选中该连接，冷却结束后重新建立连接
+                channel.unhealthy_until = now + self.unhealthy_cooldown_seconds
+                reconnect = channel.connected
+                channel.connected = False
+                channel.collections = {}
+        if reconnect:
+            try:
+                self._disconnect(channel.alias)
+            except Exception as e:
+                logger.debug(f"Failed to disconnect Milvus alias {channel.alias}: {e}")
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def call(self, collection_name: str, operation: str,
+             func: Callable[[Any, float], T], timeout: float,
+             max_retries: Optional[int] = None) -> T:
+        """在连接池上执行集合操作
+
+        func(collection, timeout) 必须把剩余时间作为 timeout 传给pymilvus调用。
+        全部尝试共享同一个截止时间，超时抛出 MilvusCallTimeout，其他错误重试耗尽后原样抛出。
+        非幂等的操作（如插入）应传 max_retries=0，避免超时但实际已写入时重复写入。
+        """
+        retries = self.max_retries if max_retries is None else max_retries
+        deadline = time.monotonic() + timeout
+        channel = None
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timeouts += 1
+                raise MilvusCallTimeout(f"Milvus {operation} did not complete within {timeout:.1f}s")
+            channel = self._acquire(exclude=channel)
+            started = time.monotonic()
+            try:
+                result = func(self._collection(channel, collection_name, remaining), remaining)
+            except self.non_retryable:
+                # 调用本身的错误，不影响连接健康状态
+                self._release(channel, started)
+                raise
+            except Exception as e:
+                self._release(channel, started, e)
+                if attempt >= retries:
+                    raise
+                delay = min(self._backoff(attempt), max(0.0, deadline - time.monotonic()))
+                logger.warning(f"Milvus {operation} failed on {channel.alias} (attempt {attempt + 1}), "
+                               f"retrying in {delay:.2f}s: {e}")
+                attempt += 1
+                self.retries += 1
+                time.sleep(delay)
+                continue
+            self._release(channel, started)
+            return result
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.size * _WORKERS_PER_CHANNEL,
+                    thread_name_prefix="milvus"
+                )
+            return self._executor
+
+    async def run(self, func: Callable[..., T], *args, timeout: float, **kwargs) -> T:
+        """在连接池的I/O线程中运行阻塞调用，超过 timeout 时不再等待并抛出 MilvusCallTimeout
+
+        线程中的gRPC调用带有同样的截止时间，超时后会自行结束，不会长期占用线程。
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise MilvusCallTimeout(f"Milvus call did not complete within {timeout:.1f}s")
+
+    def reset(self):
+        """丢弃缓存的集合句柄（集合新建、删除或重命名后调用）"""
+        with self._lock:
+            for channel in self._channels:
+                channel.collections = {}
+
+    def close(self):
+        """断开全部连接并关闭I/O线程池"""
+        with self._lock:
+            channels = [channel for channel in self._channels if channel.connected]
+            for channel in channels:
+                channel.connected = False
+                channel.collections = {}
+            executor, self._executor = self._executor, None
+        for channel in channels:
+            try:
+                self._disconnect(channel.alias)
+            except Exception as e:
+                logger.error(f"Error disconnecting Milvus alias {channel.alias}: {e}")
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def is_healthy(self) -> bool:
+        """至少有一个连接可用"""
+        now = time.monotonic()
+        with self._lock:
+            return any(channel.is_healthy(now) for channel in self._channels)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池与各连接的健康统计"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "size": self.size,
+                "healthy": sum(1 for channel in self._channels if channel.is_healthy(now)),
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "channels": [channel.get_stats(now) for channel in self._channels],
+            }
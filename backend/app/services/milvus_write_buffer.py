@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from app.utils.vector_math import cosine_similarity
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class InsertBatch:
+    """一次 insert_vectors 调用写入的同一文档的文本块"""
+    document_id: int
+    chunk_ids: List[int]
+    chunks: List[str]
+    embeddings: np.ndarray
+    metadata: List[str]
+    owner_id: Optional[int] = None
+    # 已发送过但未确认成功（如超时），重发前需先删除可能已写入的行
+    attempted: bool = False
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+@dataclass
+class PendingWrites:
+    """一次发送给Milvus的写操作：先删除，后插入"""
+    delete_document_ids: Set[int]
+    delete_ids: List[int]
+    inserts: List[InsertBatch]
+
+    @property
+    def row_count(self) -> int:
+        return sum(len(batch) for batch in self.inserts)
+
+    def is_empty(self) -> bool:
+        return not (self.delete_document_ids or self.delete_ids or self.inserts)
+
+
+def _empty_writes() -> PendingWrites:
+    return PendingWrites(set(), [], [])
+
+
+class MilvusWriteBuffer:
+    """Milvus写缓冲
+
+    跨文档累积插入与删除，累计行数达到 max_rows、最早的写入超过 max_delay_seconds
+    或显式调用 drain() 时合并成大批次发送。删除文档时直接丢弃该文档尚未发送的插入，
+    因此每次发送时先执行删除再执行插入，顺序与调用顺序一致。
+    发送中的写入在完成前仍对 search() 可见，刚写入的文档在发送前也能被检索到。
+    检索在主进程连接池的I/O线程中执行（进程池推理模式也是如此），始终能看到缓冲中的写入。
+    缓冲只在内存中，调用方需要在把数据标记为已持久化前调用 drain() 并检查结果；
+    发送失败时未发送的行数超过 max_pending_rows 后拒绝新的插入。
+    """
+
+    def __init__(self,
+                 send: Callable[[PendingWrites], None],
+                 max_rows: int = 2048,
+                 max_delay_seconds: float = 2.0,
+                 max_pending_rows: int = 16384):
+        self._send = send
+        self.max_rows = max(1, max_rows)
+        self.max_pending_rows = max(self.max_rows, max_pending_rows)
+        self.max_delay_seconds = max_delay_seconds
+        self._pending = _empty_writes()
+        self._inflight: Optional[PendingWrites] = None
+        self._oldest_write: Optional[float] = None
+        self._lock = threading.Lock()
+        # 同一时间只有一个线程发送，保证写入顺序
+        self._send_lock = threading.Lock()
+        self._timer: Optional[threading.Thread] = None
+
+        self.sent_batches = 0
+        self.sent_rows = 0
+        self.failed_sends = 0
+        self.rejected_inserts = 0
+
+    def _touch(self):
+        """记录最早的未发送写入时间（调用方需持有锁）"""
+        if self._oldest_write is None:
+            self._oldest_write = time.monotonic()
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run_timer, name="milvus-write-buffer", daemon=True)
+            self._timer.start()
+
+    def add_insert(self, batch: InsertBatch) -> bool:
+        """缓冲插入，累计行数达到上限时在调用线程中发送
+
+        发送失败且未发送的行数超过 max_pending_rows 时撤回本次插入并返回False，
+        Milvus不可用期间缓冲不会无限增长。
+        """
+        with self._lock:
+            self._pending.inserts.append(batch)
+            self._touch()
+            full = self._pending.row_count >= self.max_rows
+        if not full or self.drain():
+            return True
+        with self._lock:
+            if self._pending.row_count <= self.max_pending_rows:
+                return True
+            self._pending.inserts = [pending for pending in self._pending.inserts if pending is not batch]
+            self.rejected_inserts += 1
+        logger.error(f"Milvus write buffer is full, rejected {len(batch)} vectors of document {batch.document_id}")
+        return False
+
+    def delete_document(self, document_id: int):
+        """缓冲删除文档的全部向量，并丢弃该文档尚未发送的插入"""
+        with self._lock:
+            self._pending.inserts = [batch for batch in self._pending.inserts if batch.document_id != document_id]
+            self._pending.delete_document_ids.add(document_id)
+            self._touch()
+
+    def delete_ids(self, ids: List[int]):
+        """缓冲按主键删除"""
+        with self._lock:
+            self._pending.delete_ids.extend(ids)
+            self._touch()
+
+    def drain(self) -> bool:
+        """发送全部缓冲的写入，失败时把未发送的部分放回缓冲"""
+        with self._send_lock:
+            with self._lock:
+                if self._pending.is_empty():
+                    return True
+                writes, self._pending = self._pending, _empty_writes()
+                self._inflight = writes
+                self._oldest_write = None
+            try:
+                self._send(writes)
+                self.sent_batches += 1
+                self.sent_rows += writes.row_count
+                return True
+            except Exception as e:
+                self.failed_sends += 1
+                logger.error(f"Failed to send buffered Milvus writes: {e}")
+                self._restore(writes)
+                return False
+            finally:
+                with self._lock:
+                    self._inflight = None
+
+    def _restore(self, writes: PendingWrites):
+        """把发送失败的写入放回缓冲头部（删除可以重复执行）"""
+        with self._lock:
+            later = self._pending
+            inserts = [batch for batch in writes.inserts if batch.document_id not in later.delete_document_ids]
+            self._pending = PendingWrites(
+                writes.delete_document_ids | later.delete_document_ids,
+                writes.delete_ids + later.delete_ids,
+                inserts + later.inserts
+            )
+            self._touch()
+
+    def _run_timer(self):
+        """按时间发送：最早的写入超过 max_delay_seconds 后发送"""
+        interval = max(0.05, self.max_delay_seconds / 4)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                due = (self._oldest_write is not None
+                       and time.monotonic() - self._oldest_write >= self.max_delay_seconds)
+            if due:
+                self.drain()
+
+    def _visible_writes(self) -> List[PendingWrites]:
+        with self._lock:
+            return [writes for writes in (self._inflight, self._pending) if writes is not None]
+
+    def is_deleted(self, document_id: int, row_id: Optional[int]) -> bool:
+        """Milvus中的行是否已被缓冲中的删除覆盖"""
+        for writes in self._visible_writes():
+            if document_id in writes.delete_document_ids or (row_id is not None and row_id in writes.delete_ids):
+                return True
+        return False
+
+    def search(self,
+               query_embedding: np.ndarray,
+               limit: int,
+               score_threshold: float,
+               owner_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """在缓冲的插入中检索，返回格式与 MilvusService.search_similar 一致（id为None）
+
+        指定 owner_id 时只检索该用户的文档。
+        """
+        with self._lock:
+            inflight, pending = self._inflight, self._pending
+            # 发送中的插入若其文档已在之后被删除，则不再可见
+            batches = [batch for batch in (inflight.inserts if inflight is not None else [])
+                       if batch.document_id not in pending.delete_document_ids] + list(pending.inserts)
+        batches = [batch for batch in batches if owner_id is None or batch.owner_id == owner_id]
+        if not batches:
+            return []
+
+        matrix = np.concatenate([batch.embeddings for batch in batches])
+        scores = cosine_similarity(np.asarray(query_embedding, dtype=np.float32), matrix)
+        rows = [(batch, i) for batch in batches for i in range(len(batch))]
+        results = []
+        for index in np.argsort(-scores)[:limit]:
+            score = float(scores[index])
+            if score < score_threshold:
+                break
+            batch, i = rows[index]
+            results.append({
+                "id": None,
+                "document_id": batch.document_id,
+                "chunk_id": batch.chunk_ids[i],
+                "content": batch.chunks[i],
+                "metadata": batch.metadata[i],
+                "score": score
+            })
+        return results
+
+    def get_stats(self) -> dict:
+        """获取缓冲统计信息"""
+        with self._lock:
+            pending_rows = self._pending.row_count
+            pending_deletes = len(self._pending.delete_document_ids) + len(self._pending.delete_ids)
+        return {
+            "pending_rows": pending_rows,
+            "pending_deletes": pending_deletes,
+            "max_rows": self.max_rows,
+            "max_pending_rows": self.max_pending_rows,
+            "max_delay_seconds": self.max_delay_seconds,
+            "sent_batches": self.sent_batches,
+            "sent_rows": self.sent_rows,
+            "failed_sends": self.failed_sends,
+            "rejected_inserts": self.rejected_inserts,
+        }
@@ -0,0 +1,200 @@
+import inspect
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# ONNX导出使用的opset版本
+_OPSET_VERSION = 14
+
+
+def _model_dir(base_dir: str, model_name: str) -> Path:
+    return Path(base_dir) / model_name.replace("/", "__")
+
+
+def _create_session(model_path: Path) -> "ort.InferenceSession":
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _export_and_quantize(torch_model, dummy_inputs: dict, output_axes: Dict[str, Dict[int, str]],
+                         model_dir: Path, quantize: bool) -> Path:
+    """导出ONNX模型，并按需进行int8动态量化"""
+    import torch
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = model_dir / "model.onnx"
+    int8_path = model_dir / "model.int8.onnx"
+
+    if not fp32_path.exists():
+        # 输入名按forward签名顺序排列，与导出图的输入顺序一致
+        signature = inspect.signature(torch_model.forward).parameters
+        input_names = [name for name in signature if name in dummy_inputs]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes.update(output_axes)
+        torch_model.eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                torch_model,
+                ({name: dummy_inputs[name] for name in input_names},),
+                str(fp32_path),
+                input_names=input_names,
+                output_names=list(output_axes),
+                dynamic_axes=dynamic_axes,
+                opset_version=_OPSET_VERSION
+            )
+        logger.info(f"Exported ONNX model to {fp32_path}")
+
+    if not quantize:
+        return fp32_path
+
+    if not int8_path.exists():
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        logger.info(f"Quantized ONNX model to {int8_path}")
+    return int8_path
+
+
+class OnnxSentenceEncoder:
+    """基于ONNX Runtime的句向量编码器，接口与SentenceTransformer保持一致"""
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = False):
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime is not installed")
+        from transformers import AutoTokenizer
+
+        model_dir = _model_dir(cache_dir, model_name)
+        config_path = model_dir / "sentence_config.json"
+        model_path = model_dir / ("model.int8.onnx" if quantize else "model.onnx")
+
+        if not config_path.exists() or not model_path.exists():
+            self._export(model_name, model_dir, quantize)
+
+        config = json.loads(config_path.read_text())
+        self.pooling_mode = config["pooling_mode"]
+        self.normalize = config["normalize"]
+        self.dimension = config["dimension"]
+        self.max_seq_length = config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.session = _create_session(model_path)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _export(model_name: str, model_dir: Path, quantize: bool):
+        """从sentence-transformers模型导出Transformer主干与池化配置"""
+        from sentence_transformers import SentenceTransformer
+        from sentence_transformers.models import Normalize, Pooling
+
+        st_model = SentenceTransformer(model_name, device="cpu")
+        transformer = st_model[0]
+        pooling = next((m for m in st_model if isinstance(m, Pooling)), None)
+        pooling_mode = "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean"
+
+        dummy = transformer.tokenizer(["export"], return_tensors="pt")
+        _export_and_quantize(transformer.auto_model, dict(dummy),
+                             {"last_hidden_state": {0: "batch", 1: "sequence"}}, model_dir, quantize)
+
+        transformer.tokenizer.save_pretrained(str(model_dir))
+        (model_dir / "sentence_config.json").write_text(json.dumps({
+            "pooling_mode": pooling_mode,
+            "normalize": any(isinstance(m, Normalize) for m in st_model),
+            "dimension": st_model.get_sentence_embedding_dimension(),
+            "max_seq_length": st_model.max_seq_length
+        }))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_tensor: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            encoded = self.tokenizer(batch, padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+
+            if self.pooling_mode == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            outputs.append(pooled.astype(np.float32))
+
+        embeddings = np.concatenate(outputs) if outputs else np.zeros((0, self.dimension), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+class OnnxCrossEncoder:
+    """基于ONNX Runtime的交叉编码器，接口与CrossEncoder.predict保持一致"""
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = False, max_length: int = 512):
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime is not installed")
+        from transformers import AutoTokenizer
+
+        model_dir = _model_dir(cache_dir, model_name)
+        config_path = model_dir / "cross_encoder_config.json"
+        model_path = model_dir / ("model.int8.onnx" if quantize else "model.onnx")
+
+        if not config_path.exists() or not model_path.exists():
+            self._export(model_name, model_dir, quantize)
+
+        config = json.loads(config_path.read_text())
+        self.num_labels = config["num_labels"]
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.session = _create_session(model_path)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _export(model_name: str, model_dir: Path, quantize: bool):
+        from sentence_transformers import CrossEncoder
+
+        cross_encoder = CrossEncoder(model_name, device="cpu")
+        dummy = cross_encoder.tokenizer([["query", "passage"]], return_tensors="pt")
+        _export_and_quantize(cross_encoder.model, dict(dummy), {"logits": {0: "batch"}}, model_dir, quantize)
+
+        cross_encoder.tokenizer.save_pretrained(str(model_dir))
+        (model_dir / "cross_encoder_config.json").write_text(json.dumps({
+            "num_labels": cross_encoder.config.num_labels
+        }))
+
+    def predict(self, sentence_pairs: List[Tuple[str, str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(sentence_pairs), batch_size):
+            batch = sentence_pairs[start:start + batch_size]
+            encoded = self.tokenizer([q for q, _ in batch], [d for _, d in batch], padding=True,
+                                     truncation="longest_first", max_length=self.max_length, return_tensors="np")
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            logits = self.session.run(None, feeds)[0]
+            # 与CrossEncoder默认行为一致：单标签模型输出经过sigmoid
+            scores.append(1.0 / (1.0 + np.exp(-logits[:, 0])) if self.num_labels == 1 else logits)
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+def check_parity(reference_model, candidate_model, samples: List[str]) -> float:
+    """比较候选后端与torch参考模型输出的余弦相似度，返回最小值"""
+    reference = np.asarray(reference_model.encode(samples, convert_to_tensor=False), dtype=np.float32)
+    candidate = np.asarray(candidate_model.encode(samples, convert_to_tensor=False), dtype=np.float32)
+    reference /= np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+    candidate /= np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    return float(np.min(np.sum(reference * candidate, axis=1)))
@@ -0,0 +1,134 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 查询末尾可忽略的标点
+_TRAILING_PUNCTUATION = "?？!！。.,，;；~～ "
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：小写、合并空白并去掉末尾标点，使轻微改写的问题命中同一缓存"""
+    return _WHITESPACE_RE.sub(" ", query.lower()).strip().rstrip(_TRAILING_PUNCTUATION)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+CacheKey = Tuple[str, str]
+
+
+class RerankScoreCache:
+    """交叉编码器分数缓存
+
+    键为 (规范化查询哈希, 文本块内容哈希)，支持TTL过期与LRU淘汰，
+    并维护 文档ID -> 缓存键 的索引，用于文档删除或重处理时失效。
+    进程池模式下每个工作进程各自持有一份缓存。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, float, Optional[int]]]" = OrderedDict()
+        self._document_keys: Dict[int, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def query_key(namespace: str, query: str) -> str:
+        """生成查询哈希（namespace区分模型与推理后端）"""
+        return _sha256(f"{namespace}\x00{normalize_query(query)}")
+
+    @staticmethod
+    def chunk_key(content: str) -> str:
+        """生成文本块内容哈希"""
+        return _sha256(content)
+
+    def _forget(self, key: CacheKey, document_id: Optional[int]):
+        """从文档索引中移除键（调用方需持有锁）"""
+        if document_id is None:
+            return
+        keys = self._document_keys.get(document_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._document_keys[document_id]
+
+    def get_many(self, query_key: str, chunk_keys: List[str]) -> List[Optional[float]]:
+        """批量查询分数，未命中或已过期的位置为None"""
+        now = time.monotonic()
+        results: List[Optional[float]] = []
+        with self._lock:
+            for chunk_key in chunk_keys:
+                key = (query_key, chunk_key)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self._forget(key, entry[2])
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results.append(entry[0])
+        return results
+
+    def put_many(self, query_key: str, chunk_keys: List[str], scores: List[float],
+                 document_ids: Optional[List[Optional[int]]] = None):
+        """批量写入分数"""
+        expires_at = time.monotonic() + self.ttl_seconds
+        document_ids = document_ids or [None] * len(chunk_keys)
+        with self._lock:
+            for chunk_key, score, document_id in zip(chunk_keys, scores, document_ids):
+                key = (query_key, chunk_key)
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._forget(key, previous[2])
+                self._entries[key] = (score, expires_at, document_id)
+                if document_id is not None:
+                    self._document_keys.setdefault(document_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                key, (_, _, document_id) = self._entries.popitem(last=False)
+                self._forget(key, document_id)
+
+    def invalidate_document(self, document_id: int) -> int:
+        """失效指定文档的全部缓存分数，返回失效条目数"""
+        with self._lock:
+            keys = self._document_keys.pop(document_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidated += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._document_keys.clear()
+
+    def get_stats(self) -> dict:
+        """获取缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
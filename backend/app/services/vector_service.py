@@ -1,5 +1,8 @@
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple, Union
 import numpy as np
 try:
     from pymilvus import (
@@ -11,6 +14,20 @@ try:
         utility
     )
     MILVUS_AVAILABLE = True
+    try:
+        from pymilvus.exceptions import (
+            ParamError,
+            CollectionNotExistException,
+            DataTypeNotMatchException,
+            SchemaNotReadyException
+        )
+        # 参数或schema错误重试也不会成功，也不说明连接有问题
+        _NON_RETRYABLE_ERRORS = (
+            ValueError, TypeError, KeyError,
+            ParamError, CollectionNotExistException, DataTypeNotMatchException, SchemaNotReadyException
+        )
+    except ImportError:
+        _NON_RETRYABLE_ERRORS = (ValueError, TypeError, KeyError)
 except ImportError as e:
     print(f"Milvus import failed: {e}")
     MILVUS_AVAILABLE = False
@@ -28,12 +45,16 @@ except ImportError as e:
             pass
         def insert(self, *args, **kwargs):
             return None
-        def flush(self):
+        def flush(self, *args, **kwargs):
             pass
-        def load(self):
+        def load(self, *args, **kwargs):
+            pass
+        def release(self, *args, **kwargs):
             pass
         def search(self, *args, **kwargs):
             return []
+        def query(self, *args, **kwargs):
+            return []
         def delete(self, *args, **kwargs):
             pass
         def create_index(self, *args, **kwargs):
@@ -60,10 +81,43 @@ except ImportError as e:
         def has_collection(*args, **kwargs):
             return False
 
+    _NON_RETRYABLE_ERRORS = (ValueError, TypeError, KeyError)
+
 from app.core.config import settings
+from app.services.milvus_pool import MilvusCallTimeout, MilvusConnectionPool
+from app.services.milvus_write_buffer import InsertBatch, MilvusWriteBuffer, PendingWrites
 
 logger = logging.getLogger(__name__)
 
+# 向量在服务内部以float32 NumPy数组传递，仅在调用Milvus客户端时转换
+VectorArray = Union[np.ndarray, List[List[float]]]
+
+
+# 单次query能返回的最大行数（Milvus的查询结果窗口上限）
+MAX_QUERY_RESULTS = 16384
+
+# 无法读取集合schema时按最早版本的字段顺序插入
+_LEGACY_INSERT_FIELDS = ["document_id", "chunk_id", "content", "embedding", "metadata"]
+
+
+def _to_milvus_vectors(embeddings: VectorArray) -> List[List[float]]:
+    """转换为Milvus客户端接受的float列表"""
+    return np.asarray(embeddings, dtype=np.float32).tolist()
+
+
+def chunk_hash(content: str) -> str:
+    """文本块内容哈希，用于增量重新向量化"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _connect_alias(alias: str, timeout: float):
+    connections.connect(alias=alias, host=settings.MILVUS_HOST, port=settings.MILVUS_PORT, timeout=timeout)
+
+
+def _open_collection(name: str, alias: str):
+    return Collection(name, using=alias)
+
+
 class MilvusService:
     """Milvus向量数据库服务"""
     
@@ -71,7 +125,39 @@ class MilvusService:
         self.collection_name = settings.MILVUS_COLLECTION_NAME
         self.collection = None
         self._connected = False
-        
+        # 集合字段缓存：(全部字段名, 按schema顺序需要插入的字段)，整体赋值，避免并发读到不一致的两部分
+        self._fields: Optional[Tuple[set, List[str]]] = None
+        self._fields_lock = threading.Lock()
+        # 集合加载状态：只在首次使用、新建集合/索引后或空闲释放后加载
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._last_used = time.monotonic()
+        self._startup_load_done = not settings.MILVUS_LOAD_ON_STARTUP
+        self._stop = threading.Event()
+        self._idle_thread: Optional[threading.Thread] = None
+        self.load_count = 0
+        self.release_count = 0
+        # 写缓冲：跨文档合并插入与删除
+        self.write_buffer: Optional[MilvusWriteBuffer] = None
+        if settings.MILVUS_WRITE_BUFFER_ENABLED:
+            self.write_buffer = MilvusWriteBuffer(
+                self._send_writes,
+                max_rows=settings.MILVUS_WRITE_BUFFER_MAX_ROWS,
+                max_delay_seconds=settings.MILVUS_WRITE_BUFFER_MAX_DELAY_SECONDS,
+                max_pending_rows=settings.MILVUS_WRITE_BUFFER_MAX_PENDING_ROWS
+            )
+        # 数据操作（加载、检索、查询、写入）使用的连接池，"default" 连接只用于建表等管理操作
+        self.pool = MilvusConnectionPool(
+            connect=_connect_alias,
+            disconnect=connections.disconnect,
+            open_collection=_open_collection,
+            size=settings.MILVUS_POOL_SIZE,
+            max_retries=settings.MILVUS_MAX_RETRIES,
+            retry_backoff_seconds=settings.MILVUS_RETRY_BACKOFF_SECONDS,
+            unhealthy_cooldown_seconds=settings.MILVUS_UNHEALTHY_COOLDOWN_SECONDS,
+            non_retryable=_NON_RETRYABLE_ERRORS
+        )
+
     def connect(self) -> bool:
         """连接到Milvus数据库"""
         try:
@@ -88,8 +174,13 @@ class MilvusService:
             logger.error(f"Failed to connect to Milvus: {e}")
             return False
     
+    def _call(self, operation: str, func, timeout: float, max_retries: Optional[int] = None):
+        """在连接池上执行集合操作，func(collection, timeout) 须把 timeout 传给pymilvus调用"""
+        return self.pool.call(self.collection_name, operation, func, timeout, max_retries)
+
     def disconnect(self):
         """断开Milvus连接"""
+        self.pool.close()
         try:
             if self._connected:
                 connections.disconnect("default")
@@ -110,14 +201,15 @@ class MilvusService:
                 self.collection = Collection(self.collection_name)
                 return True
             
-            # 定义字段
+            # 定义字段（文本块内容保存在数据库 document_chunks 表中，集合只保存ID与向量）
             fields = [
                 FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
                 FieldSchema(name="document_id", dtype=DataType.INT64),
                 FieldSchema(name="chunk_id", dtype=DataType.INT64),
-                FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=2000),
                 FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dimension),
-                FieldSchema(name="metadata", dtype=DataType.VARCHAR, max_length=1000)
+                FieldSchema(name="chunk_hash", dtype=DataType.VARCHAR, max_length=64),
+                # 按所有者分区，检索时按 owner_id 过滤只扫描对应分区
+                FieldSchema(name="owner_id", dtype=DataType.INT64, is_partition_key=True)
             ]
             
             # 创建集合schema
@@ -129,7 +221,8 @@ class MilvusService:
             # 创建集合
             self.collection = Collection(
                 name=self.collection_name,
-                schema=schema
+                schema=schema,
+                num_partitions=settings.MILVUS_NUM_PARTITIONS
             )
             
             # 创建索引
@@ -143,6 +236,9 @@ class MilvusService:
                 field_name="embedding",
                 index_params=index_params
             )
+            # 新集合与索引需要重新加载，连接池与字段缓存中的旧集合信息失效
+            self.mark_unloaded()
+            self._reset_collection_cache()
             
             logger.info(f"Created collection {self.collection_name} with dimension {dimension}")
             return True
@@ -151,32 +247,146 @@ class MilvusService:
             logger.error(f"Failed to create collection: {e}")
             return False
     
+    def ensure_loaded(self) -> bool:
+        """确保集合已加载到查询节点，已加载时不发起RPC"""
+        self._last_used = time.monotonic()
+        if self._loaded:
+            return True
+        with self._load_lock:
+            if self._loaded:
+                return True
+            try:
+                if not self.connect():
+                    return False
+                started = time.monotonic()
+                self._call("load", lambda collection, timeout: collection.load(timeout=timeout),
+                           settings.MILVUS_LOAD_TIMEOUT_SECONDS)
+                self._loaded = True
+                self.load_count += 1
+                logger.info(f"Loaded collection {self.collection_name} in {time.monotonic() - started:.2f}s")
+                return True
+            except Exception as e:
+                logger.error(f"Failed to load collection {self.collection_name}: {e}")
+                return False
+
+    def mark_unloaded(self):
+        """集合schema或索引变化（或被外部释放）后调用，下次使用时重新加载"""
+        with self._load_lock:
+            self._loaded = False
+
+    def release_if_idle(self, idle_seconds: float) -> bool:
+        """集合空闲超过 idle_seconds 时释放，返回是否已释放"""
+        with self._load_lock:
+            if not self._loaded or time.monotonic() - self._last_used < idle_seconds:
+                return False
+            try:
+                self._call("release", lambda collection, timeout: collection.release(timeout=timeout),
+                           settings.MILVUS_WRITE_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.error(f"Failed to release collection {self.collection_name}: {e}")
+                return False
+            self._loaded = False
+            self.release_count += 1
+            logger.info(f"Released idle collection {self.collection_name}")
+            return True
+
+    def _run_idle_release(self, idle_seconds: float):
+        while not self._stop.wait(max(1.0, idle_seconds / 4)):
+            self.release_if_idle(idle_seconds)
+
+    def start(self):
+        """应用启动时在后台加载集合，并按配置启动空闲释放线程"""
+        self._stop.clear()
+        if settings.MILVUS_LOAD_ON_STARTUP:
+            threading.Thread(target=self._startup_load, name="milvus-startup-load", daemon=True).start()
+        if settings.MILVUS_IDLE_RELEASE_SECONDS > 0 and self._idle_thread is None:
+            self._idle_thread = threading.Thread(
+                target=self._run_idle_release,
+                args=(settings.MILVUS_IDLE_RELEASE_SECONDS,),
+                name="milvus-idle-release",
+                daemon=True
+            )
+            self._idle_thread.start()
+
+    def _startup_load(self):
+        """启动加载：加载成功（或集合尚不存在，首次写入时创建）后才就绪，失败时按退避间隔重试"""
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                if self.connect() and (not utility.has_collection(self.collection_name) or self.ensure_loaded()):
+                    self._startup_load_done = True
+                    return
+            except Exception as e:
+                logger.error(f"Failed to load collection on startup: {e}")
+            logger.warning(f"Collection {self.collection_name} is not loaded, retrying in {delay:.0f}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, 60.0)
+
+    def stop(self):
+        """停止空闲释放线程并关闭连接池"""
+        self._stop.set()
+        if self._idle_thread is not None:
+            self._idle_thread.join(timeout=5)
+            self._idle_thread = None
+        self.pool.close()
+
+    def is_ready(self) -> bool:
+        """就绪检查：启动加载已成功（集合尚不存在时也视为就绪）"""
+        return self._startup_load_done
+
+    def get_load_state(self) -> Dict[str, Any]:
+        """获取集合加载状态"""
+        return {
+            "loaded": self._loaded,
+            "ready": self.is_ready(),
+            "idle_seconds": time.monotonic() - self._last_used,
+            "idle_release_seconds": settings.MILVUS_IDLE_RELEASE_SECONDS,
+            "load_count": self.load_count,
+            "release_count": self.release_count,
+            "pool": self.pool.get_stats(),
+        }
+
     def insert_vectors(self, 
                       document_id: int,
                       chunks: List[str], 
-                      embeddings: List[List[float]],
-                      metadata: Optional[List[str]] = None) -> bool:
-        """插入向量数据"""
+                      embeddings: VectorArray,
+                      metadata: Optional[List[str]] = None,
+                      chunk_id_offset: int = 0,
+                      flush: bool = True,
+                      chunk_ids: Optional[List[int]] = None,
+                      owner_id: Optional[int] = None) -> bool:
+        """插入向量数据
+
+        分批插入同一文档时用 chunk_id_offset 指定本批第一个块的编号，
+        也可以用 chunk_ids 直接指定每个块的编号。owner_id 为文档所有者，用于检索时过滤。
+        启用写缓冲时数据先进入缓冲，按大小或时间合并发送；flush=True 时立即发送并落盘。
+        """
         try:
+            chunk_count = len(chunks)
+            batch = InsertBatch(
+                document_id=document_id,
+                chunk_ids=chunk_ids or list(range(chunk_id_offset, chunk_id_offset + chunk_count)),
+                chunks=chunks,
+                embeddings=np.asarray(embeddings, dtype=np.float32),
+                metadata=metadata or [""] * chunk_count,
+                owner_id=owner_id
+            )
+
+            if self.write_buffer is not None:
+                if not self.write_buffer.add_insert(batch):
+                    return False
+                return self.flush() if flush else True
+
             if not self.connect():
                 return False
             
-            if not self.collection:
-                self.collection = Collection(self.collection_name)
-            
-            # 准备数据
-            chunk_count = len(chunks)
-            data = [
-                [document_id] * chunk_count,  # document_id
-                list(range(chunk_count)),     # chunk_id
-                chunks,                       # content
-                embeddings,                   # embedding
-                metadata or [""] * chunk_count  # metadata
-            ]
-            
-            # 插入数据
-            mr = self.collection.insert(data)
-            self.collection.flush()
+            # 插入数据（不重试：超时时可能已经写入）
+            columns = self._insert_columns([batch])
+            self._call("insert", lambda collection, timeout: collection.insert(columns, timeout=timeout),
+                       settings.MILVUS_WRITE_TIMEOUT_SECONDS, max_retries=0)
+            if flush:
+                self._call("flush", lambda collection, timeout: collection.flush(timeout=timeout),
+                           settings.MILVUS_WRITE_TIMEOUT_SECONDS)
             
             logger.info(f"Inserted {chunk_count} vectors for document {document_id}")
             return True
@@ -184,21 +394,86 @@ class MilvusService:
         except Exception as e:
             logger.error(f"Failed to insert vectors: {e}")
             return False
+
+    def _insert_columns(self, batches: List[InsertBatch]) -> List[list]:
+        """按集合字段顺序组装插入数据（不同版本创建的集合字段不同）"""
+        contents = [chunk for batch in batches for chunk in batch.chunks]
+        columns = {
+            "document_id": lambda: [batch.document_id for batch in batches for _ in range(len(batch))],
+            "chunk_id": lambda: [chunk_id for batch in batches for chunk_id in batch.chunk_ids],
+            "content": lambda: contents,
+            "embedding": lambda: _to_milvus_vectors(np.concatenate([batch.embeddings for batch in batches])),
+            "metadata": lambda: [item for batch in batches for item in batch.metadata],
+            "chunk_hash": lambda: [chunk_hash(chunk) for chunk in contents],
+            "owner_id": lambda: [batch.owner_id or 0 for batch in batches for _ in range(len(batch))],
+        }
+        return [columns[name]() for name in self._insert_field_names()]
+
+    def _search_expr(self, owner_id: Optional[int] = None) -> Optional[str]:
+        """检索过滤表达式：指定 owner_id 时只检索该用户的文档（只扫描对应分区）
+
+        未指定 owner_id 或旧版本创建的集合没有该字段时返回None（由调用方在数据库中校验权限）。
+        """
+        if owner_id is None or not self.has_field("owner_id"):
+            return None
+        return f"owner_id == {owner_id}"
+
+    def _send_writes(self, writes: PendingWrites):
+        """发送写缓冲中的写入：先删除后插入，已发送的部分从 writes 中移除，失败时抛出异常"""
+        if not self.connect():
+            raise RuntimeError("Milvus is not connected")
+
+        if writes.delete_document_ids:
+            self._delete(f"document_id in {sorted(writes.delete_document_ids)}")
+            writes.delete_document_ids = set()
+        for start in range(0, len(writes.delete_ids), MAX_QUERY_RESULTS):
+            self._delete(f"id in {writes.delete_ids[start:start + MAX_QUERY_RESULTS]}")
+        writes.delete_ids = []
+
+        max_rows = self.write_buffer.max_rows if self.write_buffer is not None else MAX_QUERY_RESULTS
+        while writes.inserts:
+            count, rows = 0, 0
+            while count < len(writes.inserts) and (count == 0 or rows + len(writes.inserts[count]) <= max_rows):
+                rows += len(writes.inserts[count])
+                count += 1
+            batches = writes.inserts[:count]
+            # 超时的插入可能已经写入：重发前按 (document_id, chunk_id) 删除，重发不会产生重复行
+            for batch in batches:
+                if batch.attempted:
+                    self._delete(f"document_id == {batch.document_id} and chunk_id in {list(batch.chunk_ids)}")
+            columns = self._insert_columns(batches)
+            for batch in batches:
+                batch.attempted = True
+            # 不在连接池中重试，失败的批次留在缓冲中由写缓冲稍后重发
+            self._call("insert", lambda collection, timeout: collection.insert(columns, timeout=timeout),
+                       settings.MILVUS_WRITE_TIMEOUT_SECONDS, max_retries=0)
+            del writes.inserts[:count]
+            logger.info(f"Inserted {rows} buffered vectors")
+
+    def _delete(self, expr: str):
+        """按表达式删除（删除是幂等的，失败时可以重试）"""
+        self._call("delete", lambda collection, timeout: collection.delete(expr, timeout=timeout),
+                   settings.MILVUS_WRITE_TIMEOUT_SECONDS)
+
+    def drain_writes(self) -> bool:
+        """立即发送写缓冲中的全部写入（不落盘）"""
+        if self.write_buffer is None:
+            return True
+        return self.write_buffer.drain()
     
     def search_similar(self, 
-                      query_embedding: List[float], 
+                      query_embedding: Union[np.ndarray, List[float]], 
                       limit: int = 10,
-                      score_threshold: float = 0.7) -> List[Dict[str, Any]]:
-        """搜索相似向量"""
+                      score_threshold: float = 0.7,
+                      owner_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """搜索相似向量，指定 owner_id 时只返回该用户文档的文本块"""
         try:
             if not self.connect():
                 return []
             
-            if not self.collection:
-                self.collection = Collection(self.collection_name)
-            
-            # 加载集合到内存
-            self.collection.load()
+            # 集合未加载时才加载（加载状态由服务跟踪，检索不再每次发起load请求）
+            if not self.ensure_loaded():
+                return []
             
             # 搜索参数
             search_params = {
@@ -206,49 +481,125 @@ class MilvusService:
                 "params": {"nprobe": 10}
             }
             
-            # 执行搜索
-            results = self.collection.search(
-                data=[query_embedding],
+            # 执行搜索（Session一致性：能读到本客户端已发送的写入）
+            # 新版本集合不保存文本，命中结果的 content 为None，由调用方从数据库补全
+            data = _to_milvus_vectors([query_embedding])
+            expr = self._search_expr(owner_id)
+            output_fields = [name for name in ("document_id", "chunk_id", "content", "metadata")
+                             if name in self._insert_field_names()]
+            results = self._call("search", lambda collection, timeout: collection.search(
+                data=data,
                 anns_field="embedding",
                 param=search_params,
                 limit=limit,
-                output_fields=["document_id", "chunk_id", "content", "metadata"]
-            )
+                expr=expr,
+                output_fields=output_fields,
+                consistency_level="Session",
+                timeout=timeout
+            ), settings.MILVUS_SEARCH_TIMEOUT_SECONDS)
             
             # 处理结果
             similar_docs = []
             for hits in results:
                 for hit in hits:
+                    document_id = hit.entity.get("document_id")
+                    if self.write_buffer is not None and self.write_buffer.is_deleted(document_id, hit.id):
+                        continue
                     if hit.score >= score_threshold:
                         similar_docs.append({
                             "id": hit.id,
-                            "document_id": hit.entity.get("document_id"),
+                            "document_id": document_id,
                             "chunk_id": hit.entity.get("chunk_id"),
                             "content": hit.entity.get("content"),
                             "metadata": hit.entity.get("metadata"),
                             "score": hit.score
                         })
             
+            # 合并写缓冲中尚未发送的向量
+            if self.write_buffer is not None:
+                similar_docs = self._merge_buffered_hits(
+                    similar_docs,
+                    self.write_buffer.search(np.asarray(query_embedding), limit, score_threshold, owner_id),
+                    limit
+                )
+
             logger.info(f"Found {len(similar_docs)} similar documents")
             return similar_docs
             
+        except MilvusCallTimeout as e:
+            logger.error(f"Failed to search similar vectors: {e}")
+            return []
         except Exception as e:
+            # 集合可能已被外部释放或重建，下次检索时重新加载
+            self.mark_unloaded()
+            logger.error(f"Failed to search similar vectors: {e}")
+            return []
+    
+    @staticmethod
+    def _merge_buffered_hits(milvus_hits: List[Dict[str, Any]],
+                             buffered_hits: List[Dict[str, Any]],
+                             limit: int) -> List[Dict[str, Any]]:
+        """合并Milvus与写缓冲的检索结果，按 (document_id, chunk_id) 去重"""
+        if not buffered_hits:
+            return milvus_hits
+        merged, seen = [], set()
+        for hit in sorted(milvus_hits + buffered_hits, key=lambda hit: hit["score"], reverse=True):
+            key = (hit["document_id"], hit["chunk_id"])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(hit)
+        return merged[:limit]
+
+    def flush(self) -> bool:
+        """发送写缓冲中的全部写入并落盘（显式屏障）"""
+        try:
+            if not self.drain_writes():
+                return False
+
+            if not self.connect():
+                return False
+
+            self._call("flush", lambda collection, timeout: collection.flush(timeout=timeout),
+                       settings.MILVUS_WRITE_TIMEOUT_SECONDS)
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to flush collection: {e}")
+            return False
+
+    async def asearch_similar(self,
+                             query_embedding: Union[np.ndarray, List[float]],
+                             limit: int = 10,
+                             score_threshold: float = 0.7,
+                             owner_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """在连接池的I/O线程中搜索相似向量，超过检索超时时返回空结果而不是一直等待
+
+        检索是等待Milvus响应的I/O，不再占用推理执行器的线程/进程。
+        """
+        try:
+            return await self.pool.run(
+                self.search_similar, query_embedding, limit, score_threshold, owner_id,
+                timeout=settings.MILVUS_SEARCH_TIMEOUT_SECONDS
+            )
+        except MilvusCallTimeout as e:
             logger.error(f"Failed to search similar vectors: {e}")
             return []
     
     def delete_document_vectors(self, document_id: int) -> bool:
-        """删除指定文档的所有向量"""
+        """删除指定文档的所有向量（启用写缓冲时合并发送）"""
         try:
+            if self.write_buffer is not None:
+                self.write_buffer.delete_document(document_id)
+                return True
+
             if not self.connect():
                 return False
             
-            if not self.collection:
-                self.collection = Collection(self.collection_name)
-            
             # 删除条件
-            expr = f"document_id == {document_id}"
-            self.collection.delete(expr)
-            self.collection.flush()
+            self._delete(f"document_id == {document_id}")
+            self._call("flush", lambda collection, timeout: collection.flush(timeout=timeout),
+                       settings.MILVUS_WRITE_TIMEOUT_SECONDS)
             
             logger.info(f"Deleted vectors for document {document_id}")
             return True
@@ -257,6 +608,148 @@ class MilvusService:
             logger.error(f"Failed to delete document vectors: {e}")
             return False
     
+    def copy_document_vectors(self, source_document_id: int, target_document_id: int,
+                              chunk_count: int, batch_size: int = None, flush: bool = True,
+                              owner_id: Optional[int] = None,
+                              chunk_texts: Optional[Dict[int, str]] = None) -> int:
+        """将一个文档的全部向量复制到另一个文档（内容相同时无需重新编码）
+
+        集合不保存文本时由 chunk_texts（chunk_id -> 文本）提供文本块内容。
+        返回复制的向量数；失败、缺少文本或行数超过单次查询上限时返回-1。
+        """
+        try:
+            # 源文档可能还有未发送的写入
+            if not self.drain_writes() or not self.connect():
+                return -1
+
+            if not self.ensure_loaded():
+                return -1
+            rows = self._query(
+                f"document_id == {source_document_id}",
+                [name for name in ("chunk_id", "content", "embedding", "metadata") if name in self._insert_field_names()]
+            )
+            if len(rows) >= MAX_QUERY_RESULTS:
+                return -1
+            rows.sort(key=lambda row: row["chunk_id"])
+            for row in rows:
+                if "content" not in row:
+                    row["content"] = (chunk_texts or {}).get(row["chunk_id"])
+                    if row["content"] is None:
+                        return -1
+
+            batch_size = batch_size or settings.INGEST_INSERT_BATCH_SIZE
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                if not self.insert_vectors(
+                    document_id=target_document_id,
+                    chunks=[row["content"] for row in batch],
+                    embeddings=np.asarray([row["embedding"] for row in batch], dtype=np.float32),
+                    metadata=[row.get("metadata", "").replace(f"doc_{source_document_id}_", f"doc_{target_document_id}_", 1)
+                              for row in batch],
+                    chunk_ids=[row["chunk_id"] for row in batch],
+                    flush=False,
+                    owner_id=owner_id
+                ):
+                    return -1
+            if flush and not self.flush():
+                return -1
+
+            logger.info(f"Copied {len(rows)} vectors from document {source_document_id} to {target_document_id}")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"Failed to copy document vectors: {e}")
+            return -1
+
+    def _reset_collection_cache(self):
+        """集合新建后丢弃连接池中的集合句柄与字段缓存"""
+        with self._fields_lock:
+            self._fields = None
+        self.pool.reset()
+
+    def _load_fields(self) -> Optional[Tuple[set, List[str]]]:
+        """读取集合字段（按schema顺序缓存需要插入的字段），无法读取schema时返回None"""
+        fields = self._fields
+        if fields is not None:
+            return fields
+        with self._fields_lock:
+            if self._fields is None:
+                if not self.collection:
+                    self.collection = Collection(self.collection_name)
+                schema = getattr(self.collection, "schema", None)
+                if schema is None:
+                    return None
+                self._fields = (
+                    {field.name for field in schema.fields},
+                    [field.name for field in schema.fields if not getattr(field, "auto_id", False)]
+                )
+            return self._fields
+
+    def _insert_field_names(self) -> List[str]:
+        """需要插入的字段（不含自增主键），按集合schema顺序"""
+        fields = self._load_fields()
+        return fields[1] if fields is not None else _LEGACY_INSERT_FIELDS
+
+    def has_field(self, field_name: str) -> bool:
+        """集合是否包含指定字段（不同版本创建的集合字段不同，如 chunk_hash、owner_id、content）"""
+        fields = self._load_fields()
+        return fields is not None and field_name in fields[0]
+
+    def _query(self, expr: str, output_fields: List[str]) -> List[Dict[str, Any]]:
+        """强一致查询（最多 MAX_QUERY_RESULTS 行）"""
+        return self._call("query", lambda collection, timeout: collection.query(
+            expr=expr,
+            output_fields=output_fields,
+            limit=MAX_QUERY_RESULTS,
+            consistency_level="Strong",
+            timeout=timeout
+        ), settings.MILVUS_SEARCH_TIMEOUT_SECONDS)
+
+    def get_document_chunks(self, document_id: int) -> Optional[List[Dict[str, Any]]]:
+        """获取文档全部向量行的 id、chunk_id 与 chunk_hash
+
+        集合没有 chunk_hash 字段、查询失败或行数超过单次查询上限时返回None，
+        调用方应回退到全量重新向量化。
+        """
+        try:
+            if not self.connect():
+                return None
+
+            if not self.has_field("chunk_hash") or not self.drain_writes() or not self.ensure_loaded():
+                return None
+
+            rows = self._query(f"document_id == {document_id}", ["id", "chunk_id", "chunk_hash"])
+            if len(rows) >= MAX_QUERY_RESULTS:
+                return None
+            return rows
+
+        except Exception as e:
+            logger.error(f"Failed to query document chunks: {e}")
+            return None
+
+    def delete_vectors_by_ids(self, ids: List[int], flush: bool = True) -> bool:
+        """按主键删除向量"""
+        try:
+            if self.write_buffer is not None:
+                self.write_buffer.delete_ids(ids)
+                return self.flush() if flush else True
+
+            if not self.connect():
+                return False
+
+            for start in range(0, len(ids), MAX_QUERY_RESULTS):
+                self._delete(f"id in {list(ids[start:start + MAX_QUERY_RESULTS])}")
+            if flush:
+                self._call("flush", lambda collection, timeout: collection.flush(timeout=timeout),
+                           settings.MILVUS_WRITE_TIMEOUT_SECONDS)
+
+            logger.info(f"Deleted {len(ids)} vectors")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to delete vectors: {e}")
+            return False
+
     def get_collection_stats(self) -> Dict[str, Any]:
         """获取集合统计信息"""
         try:
@@ -269,7 +762,9 @@ class MilvusService:
             stats = self.collection.num_entities
             return {
                 "total_vectors": stats,
-                "collection_name": self.collection_name
+                "collection_name": self.collection_name,
+                "load_state": self.get_load_state(),
+                "write_buffer": self.write_buffer.get_stats() if self.write_buffer is not None else None
             }
             
         except Exception as e:
@@ -0,0 +1,52 @@
+import threading
+import zlib
+from typing import Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# 压缩算法标识，随数据一起保存
+ZSTD = "zstd"
+ZLIB = "zlib"
+
+_ZSTD_LEVEL = 3
+_ZLIB_LEVEL = 6
+
+# zstd的压缩/解压对象不能被多个线程同时使用，每个线程各持有一份
+_local = threading.local()
+
+
+def _zstd_compressor():
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        compressor = _local.compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+    return compressor
+
+
+def _zstd_decompressor():
+    decompressor = getattr(_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+def compress_text(text: str) -> Tuple[bytes, str]:
+    """压缩文本，返回 (压缩数据, 压缩算法)；未安装 zstandard 时使用zlib"""
+    data = text.encode("utf-8")
+    if ZSTD_AVAILABLE:
+        return _zstd_compressor().compress(data), ZSTD
+    return zlib.compress(data, _ZLIB_LEVEL), ZLIB
+
+
+def decompress_text(data: bytes, codec: str) -> str:
+    """按压缩算法解压文本"""
+    if codec == ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to read zstd-compressed text")
+        return _zstd_decompressor().decompress(data).decode("utf-8")
+    if codec == ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown compression codec: {codec}")
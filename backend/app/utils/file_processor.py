@@ -1,13 +1,56 @@
+import codecs
 import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 import PyPDF2
 import docx
 import markdown
 from bs4 import BeautifulSoup
+from app.core.config import settings
+from app.utils.text_chunker import chunk_by_chars
+
+# 流式读取文本文件时每次读取的字节数
+_TEXT_BLOCK_SIZE = 1024 * 1024
+# 流式读取Word文档时每段文本合并的段落数
+_DOCX_PARAGRAPHS_PER_SEGMENT = 200
+
+# PDF并行提取使用的进程池（首次使用时创建）
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+_pdf_executor_lock = threading.Lock()
+
+
+def _extract_pdf_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """提取PDF第 [start, end) 页的文本（进程池任务，需要是模块级函数）"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(max_workers=min(settings.PDF_EXTRACT_WORKERS, os.cpu_count() or 1))
+        return _pdf_executor
+
+
+def shutdown_pdf_executor(wait: bool = True):
+    """关闭PDF提取进程池"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is not None:
+            _pdf_executor.shutdown(wait=wait, cancel_futures=True)
+            _pdf_executor = None
+
 
 class FileProcessor:
     """文件处理器"""
+
+    # 提取逻辑变化时递增，使提取缓存中的旧结果失效
+    EXTRACTOR_VERSION = "2"
     
     def extract_text(self, file_path: str) -> str:
         """从文件中提取文本内容"""
@@ -29,18 +72,123 @@ class FileProcessor:
         else:
             raise ValueError(f"Unsupported file type: {file_extension}")
     
-    def _extract_from_pdf(self, file_path: Path) -> str:
-        """从PDF文件提取文本"""
-        text = ""
+    def iter_pages(self, file_path: str) -> Iterator[str]:
+        """逐页/逐段流式提取文本，拼接结果与 extract_text 一致（首尾空白除外）"""
+        file_path = Path(file_path)
+
+        if not file_path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        file_extension = file_path.suffix.lower()
+
+        if file_extension == '.pdf':
+            return self._iter_pdf_pages(file_path)
+        elif file_extension in ['.doc', '.docx']:
+            return self._iter_docx_paragraphs(file_path)
+        elif file_extension == '.txt':
+            return self._iter_txt_blocks(file_path)
+        elif file_extension == '.md':
+            # Markdown需要整体转换为HTML，按单个片段返回
+            return iter([self._extract_from_markdown(file_path)])
+        else:
+            raise ValueError(f"Unsupported file type: {file_extension}")
+
+    def iter_pdf_pages(self, file_path: str) -> Iterator[Tuple[int, str]]:
+        """按顺序产生PDF每页的 (页码, 文本)，页码从1开始
+
+        页数达到 PDF_PARALLEL_MIN_PAGES 时按页区间分发到进程池并行提取，
+        按区间顺序合并；同时在途的区间数不超过进程数+1。
+        """
+        file_path = Path(file_path)
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+                page_count = len(pdf_reader.pages)
+                # 进程数超过CPU核数只会增加重复解析页树的开销
+                workers = min(settings.PDF_EXTRACT_WORKERS, os.cpu_count() or 1)
+                if workers <= 1 or page_count < settings.PDF_PARALLEL_MIN_PAGES:
+                    for page_number, page in enumerate(pdf_reader.pages, start=1):
+                        yield page_number, page.extract_text()
+                    return
+
+            # 每个任务都要重新解析页树，默认按进程数切成少量较大的区间
+            pages_per_task = settings.PDF_PAGES_PER_TASK or -(-page_count // (workers * 2))
+            ranges = iter([(start, min(start + pages_per_task, page_count))
+                           for start in range(0, page_count, pages_per_task)])
+            executor = _get_pdf_executor()
+            pending = deque()
+
+            def submit_next():
+                page_range = next(ranges, None)
+                if page_range is not None:
+                    future = executor.submit(_extract_pdf_page_range, str(file_path), *page_range)
+                    pending.append((page_range[0], future))
+
+            try:
+                for _ in range(workers + 1):
+                    submit_next()
+                while pending:
+                    start, future = pending.popleft()
+                    texts = future.result()
+                    submit_next()
+                    for offset, text in enumerate(texts):
+                        yield start + offset + 1, text
+            finally:
+                for _, future in pending:
+                    future.cancel()
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
-        
-        return text.strip()
+
+    def _iter_pdf_pages(self, file_path: Path) -> Iterator[str]:
+        """逐页提取PDF文本"""
+        for _, text in self.iter_pdf_pages(file_path):
+            yield text + "\n"
+
+    def _iter_docx_paragraphs(self, file_path: Path) -> Iterator[str]:
+        """按段落组提取Word文档文本"""
+        try:
+            doc = docx.Document(file_path)
+            lines = []
+            for paragraph in doc.paragraphs:
+                lines.append(paragraph.text + "\n")
+                if len(lines) >= _DOCX_PARAGRAPHS_PER_SEGMENT:
+                    yield "".join(lines)
+                    lines = []
+            if lines:
+                yield "".join(lines)
+        except Exception as e:
+            raise Exception(f"Error extracting text from DOCX: {str(e)}")
+
+    def _detect_text_encoding(self, file_path: Path) -> str:
+        """流式校验UTF-8，失败时回退到GBK"""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            with open(file_path, 'rb') as file:
+                while True:
+                    block = file.read(_TEXT_BLOCK_SIZE)
+                    if not block:
+                        decoder.decode(b"", final=True)
+                        return 'utf-8'
+                    decoder.decode(block)
+        except UnicodeDecodeError:
+            return 'gbk'
+
+    def _iter_txt_blocks(self, file_path: Path) -> Iterator[str]:
+        """按块读取文本文件"""
+        encoding = self._detect_text_encoding(file_path)
+        try:
+            with open(file_path, 'r', encoding=encoding) as file:
+                while True:
+                    block = file.read(_TEXT_BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+        except Exception as e:
+            raise Exception(f"Error reading text file: {str(e)}")
+
+    def _extract_from_pdf(self, file_path: Path) -> str:
+        """从PDF文件提取文本"""
+        return "".join(self._iter_pdf_pages(file_path)).strip()
     
     def _extract_from_docx(self, file_path: Path) -> str:
         """从Word文档提取文本"""
@@ -82,30 +230,5 @@ class FileProcessor:
             raise Exception(f"Error extracting text from Markdown: {str(e)}")
     
     def chunk_text(self, text: str, chunk_size: int = 512, overlap: int = 50) -> list:
-        """将文本分块"""
-        if len(text) <= chunk_size:
-            return [text]
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            
-            # 如果不是最后一块，尝试在句号或换行符处分割
-            if end < len(text):
-                # 向后查找句号或换行符
-                for i in range(end, max(start + chunk_size // 2, end - 100), -1):
-                    if text[i] in '.。\n':
-                        end = i + 1
-                        break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            start = end - overlap
-            if start >= len(text):
-                break
-        
-        return chunks
+        """将文本分块（按字符数）"""
+        return chunk_by_chars(text, chunk_size, overlap, separators=".。\n")
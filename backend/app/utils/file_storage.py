@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tarfile
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, Iterator, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+
+# 每次从上传流读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 支持批量导入的归档格式
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class FileTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"File exceeds maximum size of {max_size} bytes")
+
+
+@dataclass
+class StoredFile:
+    """已保存的上传文件"""
+    path: Path
+    size: int
+    sha256: str
+
+
+async def save_upload_file(file: UploadFile,
+                           directory: str,
+                           filename: str,
+                           max_size: int,
+                           chunk_size: int = UPLOAD_CHUNK_SIZE) -> StoredFile:
+    """流式保存上传文件
+
+    按固定大小分块写入同目录下的临时文件，同时计算SHA-256与字节数；
+    超过 max_size 时立即中止并删除临时文件，完成后原子地重命名为目标文件。
+    """
+    directory = Path(directory)
+    target_path = directory / filename
+    temp_path = directory / f".upload-{uuid.uuid4().hex}.part"
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                await out.write(chunk)
+        await aiofiles.os.replace(temp_path, target_path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    return StoredFile(path=target_path, size=size, sha256=digest.hexdigest())
+
+
+def save_stream(stream: IO[bytes],
+                directory: str,
+                filename: str,
+                max_size: int,
+                chunk_size: int = UPLOAD_CHUNK_SIZE) -> StoredFile:
+    """流式保存同步文件流（例如归档中的条目），行为与 save_upload_file 一致"""
+    directory = Path(directory)
+    target_path = directory / filename
+    temp_path = directory / f".upload-{uuid.uuid4().hex}.part"
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                out.write(chunk)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    return StoredFile(path=target_path, size=size, sha256=digest.hexdigest())
+
+
+def is_archive(filename: str) -> bool:
+    """判断文件名是否为支持的归档格式"""
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_archive_entries(archive_path: Path) -> Iterator[Tuple[str, Callable[[], IO[bytes]]]]:
+    """按顺序产生归档中的普通文件条目：(条目路径, 打开条目的函数)
+
+    tar归档以流模式读取，打开函数必须在迭代到下一个条目前调用。
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: archive.open(info)
+        return
+
+    with tarfile.open(archive_path, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, lambda member=member: archive.extractfile(member)
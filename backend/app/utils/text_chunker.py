@@ -0,0 +1,197 @@
+import re
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+# 句子边界：中英文句末标点（含后续引号/括号）或换行
+_SENTENCE_END_RE = re.compile(r"[^。！？!?.\n]*(?:[。！？!?.]+[”’\"')）]*|\n+|$)")
+# 无分词器时的近似token计数：每个CJK字符计1个token，其余按单词/标点计数
+_APPROX_TOKEN_RE = re.compile(r"[぀-ヿ㐀-鿿가-힯]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+@dataclass
+class ChunkSpan:
+    """文本块及其在全文中的字符范围 [char_start, char_end)"""
+    text: str
+    char_start: int
+    char_end: int
+    token_count: int
+    page_start: Optional[int] = None  # 所在页/段（从1开始）
+    page_end: Optional[int] = None
+
+
+def assign_pages(spans: Iterable[ChunkSpan], page_offsets: List[int]):
+    """按各页/段的起始字符偏移为文本块标注页码"""
+    for span in spans:
+        span.page_start = bisect_right(page_offsets, span.char_start)
+        span.page_end = bisect_right(page_offsets, max(span.char_start, span.char_end - 1))
+
+
+def _strip_span(text: str, start: int) -> Tuple[str, int, int]:
+    """去掉首尾空白，返回 (文本, 起始偏移, 结束偏移)"""
+    stripped = text.strip()
+    if not stripped:
+        return "", start, start
+    leading = len(text) - len(text.lstrip())
+    return stripped, start + leading, start + leading + len(stripped)
+
+
+def split_sentences(text: str) -> Iterator[str]:
+    """按句子边界线性切分文本，保留原有标点与空白"""
+    for match in _SENTENCE_END_RE.finditer(text):
+        sentence = match.group(0)
+        if sentence:
+            yield sentence
+
+
+def approximate_token_count(text: str) -> int:
+    """近似token数（未加载分词器时使用）"""
+    return len(_APPROX_TOKEN_RE.findall(text))
+
+
+class TokenChunker:
+    """基于分词器token数的文本分块器
+
+    优先在句子边界（包括 。！？）处切分，每块不超过 max_tokens 个token，
+    相邻块之间保留约 overlap_tokens 个token的重叠。每个句子只分词一次，
+    整体为线性时间。
+    """
+
+    def __init__(self,
+                 max_tokens: int,
+                 overlap_tokens: int = 0,
+                 tokenizer=None):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+        self.tokenizer = tokenizer
+        self._count: Callable[[str], int] = self._tokenizer_count if tokenizer is not None else approximate_token_count
+
+    def _tokenizer_count(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _split_long_sentence(self, sentence: str) -> Iterator[Tuple[str, int, int]]:
+        """把超过 max_tokens 的句子按token边界切开，返回 (片段, token数, 片段在句中的偏移)"""
+        if self.tokenizer is not None and getattr(self.tokenizer, "is_fast", False):
+            offsets = self.tokenizer(sentence, add_special_tokens=False,
+                                     return_offsets_mapping=True)["offset_mapping"]
+            for start in range(0, len(offsets), self.max_tokens):
+                window = offsets[start:start + self.max_tokens]
+                end = offsets[start + self.max_tokens][0] if start + self.max_tokens < len(offsets) else len(sentence)
+                # 首个片段从句首开始，保证片段首尾相接
+                begin = window[0][0] if start else 0
+                yield sentence[begin:end], len(window), begin
+            return
+
+        # 慢速分词器或近似计数：按近似token的字符位置切分
+        matches = list(_APPROX_TOKEN_RE.finditer(sentence))
+        for start in range(0, len(matches), self.max_tokens):
+            end = matches[start + self.max_tokens].start() if start + self.max_tokens < len(matches) else len(sentence)
+            begin = matches[start].start() if start else 0
+            piece = sentence[begin:end]
+            yield piece, self._count(piece), begin
+
+    def _units(self, segments: Iterable[str]) -> Iterator[Tuple[str, int, int]]:
+        """把输入切分为 (句子, token数, 全文字符偏移)，超长句子进一步切开"""
+        position = 0
+        for segment in segments:
+            sentence_start = position
+            for sentence in split_sentences(segment):
+                start, sentence_start = sentence_start, sentence_start + len(sentence)
+                if not sentence.strip():
+                    if sentence:
+                        yield sentence, 0, start
+                    continue
+                tokens = self._count(sentence)
+                if tokens <= self.max_tokens:
+                    yield sentence, tokens, start
+                else:
+                    for piece, piece_tokens, offset in self._split_long_sentence(sentence):
+                        yield piece, piece_tokens, start + offset
+            position += len(segment)
+
+    @staticmethod
+    def _window_span(window: Deque[Tuple[str, int, int]], tokens: int) -> Optional[ChunkSpan]:
+        text, start, end = _strip_span("".join(s for s, _, _ in window), window[0][2])
+        return ChunkSpan(text, start, end, tokens) if text else None
+
+    def iter_spans(self, segments: Iterable[str]) -> Iterator[ChunkSpan]:
+        """流式分块并返回每块在全文（各段首尾相接）中的字符范围与token数"""
+        window: Deque[Tuple[str, int, int]] = deque()
+        window_tokens = 0
+        # 当前窗口中尚未输出过的句子数（只含重叠部分时不再输出）
+        fresh = 0
+
+        for sentence, tokens, start in self._units(segments):
+            if window_tokens + tokens > self.max_tokens and fresh:
+                span = self._window_span(window, window_tokens)
+                if span:
+                    yield span
+                # 从窗口尾部保留不超过 overlap_tokens 的句子作为下一块的开头
+                kept_tokens = 0
+                kept: Deque[Tuple[str, int, int]] = deque()
+                while window and kept_tokens + window[-1][1] <= self.overlap_tokens:
+                    item = window.pop()
+                    kept.appendleft(item)
+                    kept_tokens += item[1]
+                window, window_tokens, fresh = kept, kept_tokens, 0
+                # 重叠部分加上新句子仍超限时丢弃重叠
+                while window and window_tokens + tokens > self.max_tokens:
+                    window_tokens -= window.popleft()[1]
+
+            window.append((sentence, tokens, start))
+            window_tokens += tokens
+            fresh += 1
+
+        if fresh:
+            span = self._window_span(window, window_tokens)
+            if span:
+                yield span
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        """流式分块：输入可以是逐页/逐段产生的文本"""
+        for span in self.iter_spans(segments):
+            yield span.text
+
+    def chunk(self, text: str) -> List[str]:
+        """将文本分块"""
+        return list(self.iter_chunks([text]))
+
+
+def chunk_by_chars(text: str, chunk_size: int, overlap: int, separators: str = ".。\n ") -> List[str]:
+    """按字符数分块（旧策略），在块尾部最多回看100个字符寻找分隔符"""
+    return [span.text for span in chunk_spans_by_chars(text, chunk_size, overlap, separators)]
+
+
+def chunk_spans_by_chars(text: str, chunk_size: int, overlap: int,
+                         separators: str = ".。\n ") -> List[ChunkSpan]:
+    """按字符数分块并返回字符范围，token数为近似值"""
+    if len(text) <= chunk_size:
+        return [ChunkSpan(text, 0, len(text), approximate_token_count(text))]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+
+        # 如果不是最后一块，尝试在分隔符处分割
+        if end < len(text):
+            for i in range(end, max(start + chunk_size // 2, end - 100), -1):
+                if text[i] in separators:
+                    end = i + 1
+                    break
+
+        chunk, chunk_start, chunk_end = _strip_span(text[start:end], start)
+        if chunk:
+            chunks.append(ChunkSpan(chunk, chunk_start, chunk_end, approximate_token_count(chunk)))
+
+        # 下一块的起始位置考虑重叠
+        start = end - overlap if end < len(text) else end
+
+        # 避免无限循环
+        if start >= end:
+            break
+
+    return chunks
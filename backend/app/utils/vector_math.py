@@ -0,0 +1,117 @@
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# 默认的分块计算内存上限
+DEFAULT_MAX_MEMORY_MB = 256
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行L2归一化为float32矩阵，零向量保持为零"""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _block_rows(row_width: int, max_memory_mb: Optional[float]) -> int:
+    """计算在内存上限内每块可以处理的行数（每行占 row_width 个float32）"""
+    max_bytes = (max_memory_mb or DEFAULT_MAX_MEMORY_MB) * 1024 * 1024
+    return max(1, int(max_bytes // (max(row_width, 1) * 4)))
+
+
+def _prepare_queries(queries: np.ndarray, normalized: bool) -> np.ndarray:
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    return queries if normalized else normalize_rows(queries)
+
+
+def _prepare_block(block: np.ndarray, normalized: bool) -> np.ndarray:
+    """转换并归一化矩阵的一块（已是float32且已归一化时不复制）"""
+    block = np.asarray(block, dtype=np.float32)
+    return block if normalized else normalize_rows(block)
+
+
+def iter_cosine_similarity(queries: np.ndarray,
+                           matrix: np.ndarray,
+                           normalized: bool = False,
+                           max_memory_mb: Optional[float] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """按矩阵行分块计算余弦相似度，依次返回 (块起始行, 形状为 (q, 块行数) 的相似度)
+
+    矩阵在计算到对应块时才转换并归一化，不复制整个矩阵；
+    每块的中间结果（归一化后的块与相似度块）不超过 max_memory_mb。
+    """
+    queries = _prepare_queries(queries, normalized)
+    matrix = np.atleast_2d(np.asarray(matrix))
+    step = _block_rows(queries.shape[0] + matrix.shape[1], max_memory_mb)
+    for start in range(0, matrix.shape[0], step):
+        yield start, queries @ _prepare_block(matrix[start:start + step], normalized).T
+
+
+def cosine_similarity(queries: np.ndarray,
+                      matrix: np.ndarray,
+                      normalized: bool = False,
+                      max_memory_mb: Optional[float] = None) -> np.ndarray:
+    """计算查询向量与矩阵各行的余弦相似度
+
+    queries 为 (dim,) 时返回 (n,)，为 (q, dim) 时返回 (q, n)。
+    normalized=True 表示输入已经按行归一化，可以跳过归一化步骤。
+    max_memory_mb 只限制计算过程的中间结果（见 iter_cosine_similarity），
+    返回的 (q, n) 矩阵本身不受限制；只需要部分结果时使用 iter_cosine_similarity 或 top_k_similar。
+    """
+    single = np.asarray(queries).ndim == 1
+    matrix = np.atleast_2d(np.asarray(matrix))
+    result = np.empty((1 if single else len(queries), matrix.shape[0]), dtype=np.float32)
+    for start, scores in iter_cosine_similarity(queries, matrix, normalized, max_memory_mb):
+        result[:, start:start + scores.shape[1]] = scores
+    return result[0] if single else result
+
+
+def top_k_similar(queries: np.ndarray,
+                  matrix: np.ndarray,
+                  k: int,
+                  normalized: bool = False,
+                  max_memory_mb: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """返回每个查询最相似的k行的 (索引, 分数)，按分数降序排列
+
+    使用argpartition选取top-k，并对矩阵按行分块（块在计算时才归一化，不复制整个矩阵），
+    逐块合并候选，整个过程的中间结果不超过 max_memory_mb。
+    """
+    single = np.asarray(queries).ndim == 1
+    queries = _prepare_queries(queries, normalized)
+    matrix = np.atleast_2d(np.asarray(matrix))
+
+    query_count, row_count = queries.shape[0], matrix.shape[0]
+    k = min(k, row_count)
+    if k <= 0:
+        empty_indices = np.empty((query_count, 0), dtype=np.int64)
+        empty_scores = np.empty((query_count, 0), dtype=np.float32)
+        return (empty_indices[0], empty_scores[0]) if single else (empty_indices, empty_scores)
+
+    query_step = min(query_count, 1024)
+    column_step = max(k, _block_rows(query_step + matrix.shape[1], max_memory_mb))
+    all_indices = np.empty((query_count, k), dtype=np.int64)
+    all_scores = np.empty((query_count, k), dtype=np.float32)
+
+    for q_start in range(0, query_count, query_step):
+        query_block = queries[q_start:q_start + query_step]
+        best_scores = np.full((query_block.shape[0], 0), -np.inf, dtype=np.float32)
+        best_indices = np.empty((query_block.shape[0], 0), dtype=np.int64)
+
+        for c_start in range(0, row_count, column_step):
+            block_scores = query_block @ _prepare_block(matrix[c_start:c_start + column_step], normalized).T
+            block_indices = np.arange(c_start, c_start + block_scores.shape[1], dtype=np.int64)
+            candidate_scores = np.concatenate([best_scores, block_scores], axis=1)
+            candidate_indices = np.concatenate(
+                [best_indices, np.broadcast_to(block_indices, block_scores.shape)], axis=1
+            )
+            if candidate_scores.shape[1] > k:
+                keep = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+                candidate_scores = np.take_along_axis(candidate_scores, keep, axis=1)
+                candidate_indices = np.take_along_axis(candidate_indices, keep, axis=1)
+            best_scores, best_indices = candidate_scores, candidate_indices
+
+        order = np.argsort(-best_scores, axis=1)
+        all_scores[q_start:q_start + query_step] = np.take_along_axis(best_scores, order, axis=1)
+        all_indices[q_start:q_start + query_step] = np.take_along_axis(best_indices, order, axis=1)
+
+    return (all_indices[0], all_scores[0]) if single else (all_indices, all_scores)
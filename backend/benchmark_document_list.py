@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+文档列表基准：比较列表接口返回完整文档（含正文与摘要）与精简列表项（延迟加载正文与摘要）时的
+查询+序列化延迟与响应体大小
+
+在临时SQLite数据库中为一个用户生成指定数量的文档，分别测量单页与一次列出全部文档。
+用法: python benchmark_document_list.py [文档数量] [每篇正文KB] [每页数量]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Document, User
+from app.schemas.document import Document as DocumentSchema, DocumentListItem
+from app.services.document_service import DocumentService
+
+REPEATS = 5
+
+
+def populate(session_factory, document_count: int, content_kb: int) -> int:
+    """生成测试用户与文档，返回用户ID"""
+    db = session_factory()
+    user = User(username="benchmark", email="benchmark@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    content = ("知识库文档正文 benchmark content. " * (content_kb * 1024 // 40 + 1))[:content_kb * 1024]
+    for start in range(0, document_count, 1000):
+        db.bulk_save_objects([
+            Document(
+                title=f"文档 {i}",
+                filename=f"document_{i}.pdf",
+                file_path=f"./uploads/document_{i}.pdf",
+                file_size=content_kb * 1024,
+                file_type="pdf",
+                status="completed",
+                is_vectorized=True,
+                vector_count=content_kb,
+                content=content,
+                summary=content[:500],
+                owner_id=user.id
+            )
+            for i in range(start, min(start + 1000, document_count))
+        ])
+        db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+
+def list_full(db, user_id: int, limit: int) -> List[Document]:
+    """旧实现：加载完整文档行"""
+    return db.query(Document).filter(Document.owner_id == user_id).offset(0).limit(limit).all()
+
+
+def list_slim(db, user_id: int, limit: int) -> List[Document]:
+    """新实现：延迟加载正文与摘要"""
+    return DocumentService(db).get_documents_by_user(user_id, skip=0, limit=limit)
+
+
+def measure(session_factory, user_id: int, limit: int, query, schema):
+    """返回 (中位延迟毫秒, 响应体字节数)"""
+    adapter = TypeAdapter(List[schema])
+    timings, size = [], 0
+    for _ in range(REPEATS):
+        db = session_factory()
+        started = time.perf_counter()
+        documents = query(db, user_id, limit)
+        body = adapter.dump_json(adapter.validate_python(documents, from_attributes=True))
+        timings.append((time.perf_counter() - started) * 1000)
+        size = len(body)
+        db.close()
+    return statistics.median(timings), size
+
+
+def main():
+    document_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    content_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    page_size = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        user_id = populate(session_factory, document_count, content_kb)
+
+        print(f"📊 文档列表基准: {document_count} 篇文档, 每篇正文 {content_kb} KB")
+        for limit, label in ((page_size, f"单页 {page_size} 篇"), (document_count, f"全部 {document_count} 篇")):
+            print(f"  {label}:")
+            for query, schema, name in ((list_full, DocumentSchema, "完整文档（旧）"),
+                                        (list_slim, DocumentListItem, "精简列表项（新）")):
+                latency, size = measure(session_factory, user_id, limit, query, schema)
+                print(f"    {name}: {latency:.1f} ms, 响应体 {size / 1024:.1f} KB")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+大文档入库内存基准：比较嵌入向量以Python float列表与float32 NumPy数组传递时的峰值RSS
+
+每种模式在独立子进程中运行，模拟一次入库。新实现直接调用 embedding_service.encode_documents
+与 milvus_service.insert_vectors（含写缓冲、插入列组装与客户端边界的转换），
+只把嵌入模型和Milvus集合替换为桩：模型返回随机float32向量，集合丢弃插入的数据。
+旧实现按原来的方式对每个向量调用 .tolist()，把整篇文档的向量以嵌套列表一次插入同一个桩集合。
+结果受批大小与写缓冲配置影响，以实际运行输出为准。
+用法: python benchmark_ingest_memory.py [chunk数量] [向量维度]
+"""
+import resource
+import subprocess
+import sys
+
+import numpy as np
+
+
+class _RandomModel:
+    """嵌入模型桩：返回随机float32向量，不含分词器（按字符数分桶）"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.rng = np.random.default_rng(0)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, batch_size=None, convert_to_tensor=False):
+        return self.rng.standard_normal((len(texts), self.dimension), dtype=np.float32)
+
+
+class _NullCollection:
+    """Milvus集合桩：接收插入数据后丢弃"""
+
+    schema = None
+
+    def __init__(self):
+        self.inserted_rows = 0
+
+    def insert(self, data, timeout=None):
+        self.inserted_rows += len(data[0])
+
+    def flush(self, timeout=None):
+        pass
+
+    def delete(self, expr, timeout=None):
+        pass
+
+
+def _stub_services(dimension: int):
+    """替换嵌入模型与Milvus客户端，返回集合桩"""
+    from app.services.embedding_service import embedding_service
+    from app.services.milvus_pool import MilvusConnectionPool
+    from app.services.vector_service import milvus_service
+
+    embedding_service.embedding_model = _RandomModel(dimension)
+    embedding_service._embedding_model_loaded = True
+    # 缓存命中会跳过编码，基准只测量编码与写入路径
+    embedding_service.embedding_cache = None
+
+    collection = _NullCollection()
+    milvus_service.collection = collection
+    milvus_service._connected = True
+    milvus_service.pool = MilvusConnectionPool(
+        connect=lambda alias, timeout: None,
+        disconnect=lambda alias: None,
+        open_collection=lambda name, alias: collection
+    )
+    return embedding_service, milvus_service, collection
+
+
+def _chunk_texts(start: int, size: int):
+    return [f"文本块 {i}：知识库入库内存基准的示例内容。" for i in range(start, start + size)]
+
+
+def run_ingest(mode: str, chunk_count: int, dimension: int) -> int:
+    """运行一次入库流程，返回写入集合的行数"""
+    from app.core.config import settings
+
+    embedding_service, milvus_service, collection = _stub_services(dimension)
+    embed_batch_size = settings.INGEST_EMBED_BATCH_SIZE
+    insert_batch_size = settings.INGEST_INSERT_BATCH_SIZE
+
+    if mode == "list":
+        # 旧实现: encode_text 对每个向量调用 .tolist()，整篇文档的向量以嵌套列表传给Milvus
+        chunks, embeddings = [], []
+        for start in range(0, chunk_count, embed_batch_size):
+            batch = _chunk_texts(start, min(embed_batch_size, chunk_count - start))
+            chunks.extend(batch)
+            embeddings.extend(vector.tolist() for vector in embedding_service.embedding_model.encode(batch))
+        columns = [[1] * len(chunks), list(range(len(chunks))), chunks, embeddings, [""] * len(chunks)]
+        milvus_service._call("insert", lambda target, timeout: target.insert(columns, timeout=timeout),
+                             settings.MILVUS_WRITE_TIMEOUT_SECONDS, max_retries=0)
+    else:
+        # 新实现: 与入库流水线相同，按编码批次生成float32矩阵，攒够插入批次后写入
+        pending_chunks, pending_embeddings = [], []
+        inserted = 0
+
+        def insert_pending():
+            nonlocal pending_chunks, pending_embeddings, inserted
+            if not pending_chunks:
+                return
+            if not milvus_service.insert_vectors(
+                document_id=1,
+                chunks=pending_chunks,
+                embeddings=np.concatenate(pending_embeddings),
+                chunk_id_offset=inserted,
+                flush=False
+            ):
+                raise RuntimeError("Failed to insert vectors")
+            inserted += len(pending_chunks)
+            pending_chunks, pending_embeddings = [], []
+
+        for start in range(0, chunk_count, embed_batch_size):
+            batch = _chunk_texts(start, min(embed_batch_size, chunk_count - start))
+            pending_chunks.extend(batch)
+            pending_embeddings.append(embedding_service.encode_documents(batch))
+            if len(pending_chunks) >= insert_batch_size:
+                insert_pending()
+        insert_pending()
+        if not milvus_service.flush():
+            raise RuntimeError("Failed to flush vectors")
+
+    return collection.inserted_rows
+
+
+def peak_rss_mb() -> float:
+    # Linux上ru_maxrss单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    chunk_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dimension = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+
+    if len(sys.argv) > 3:
+        mode = sys.argv[3]
+        # 服务模块的导入开销计入基线
+        import app.services.embedding_service  # noqa: F401
+        import app.services.vector_service  # noqa: F401
+        baseline = peak_rss_mb()
+        rows = run_ingest(mode, chunk_count, dimension)
+        if rows != chunk_count:
+            raise SystemExit(f"inserted {rows} rows, expected {chunk_count}")
+        print(f"{baseline:.1f} {peak_rss_mb():.1f}")
+        return
+
+    print(f"📊 入库内存基准: {chunk_count} 个文本块, 维度 {dimension}")
+    for mode, label in (("list", "Python float列表（旧）"), ("array", "float32 NumPy数组（新）")):
+        # 子进程的日志也可能写到stdout，结果在最后一行
+        output = subprocess.run(
+            [sys.executable, __file__, str(chunk_count), str(dimension), mode],
+            capture_output=True, text=True, check=True
+        ).stdout.splitlines()[-1].split()
+        baseline, peak = float(output[0]), float(output[1])
+        print(f"  {label}: 峰值RSS {peak:.1f} MB（增量 {peak - baseline:.1f} MB）")
+
+
+if __name__ == "__main__":
+    main()
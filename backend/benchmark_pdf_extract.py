@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+PDF提取基准：比较逐页串行提取（旧实现）与按页区间并行提取的耗时
+
+默认生成一个1000页的纯文本PDF，依次用旧实现与不同进程数的并行提取器处理，
+并校验结果一致。
+用法: python benchmark_pdf_extract.py [页数] [进程数,...]
+"""
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import PyPDF2
+
+from app.core.config import settings
+from app.utils.file_processor import FileProcessor, shutdown_pdf_executor
+
+LINES_PER_PAGE = 45
+LINE_TEXT = "Knowledge base page {page} line {line}: vector search, chunking and embeddings."
+
+
+def build_pdf(path: str, page_count: int):
+    """手工生成纯文本PDF（不依赖额外的PDF生成库）"""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    for page in range(page_count):
+        page_id, content_id = 4 + page * 2, 5 + page * 2
+        lines = [f"({LINE_TEXT.format(page=page + 1, line=line + 1)}) Tj T*" for line in range(LINES_PER_PAGE)]
+        stream = ("BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(lines) + " ET").encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(page_id)
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[2] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % page_count
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = {}
+        for object_id in sorted(objects):
+            offsets[object_id] = f.tell()
+            f.write(b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n")
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for object_id in sorted(objects):
+            f.write(b"%010d 00000 n \n" % offsets[object_id])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+
+
+def extract_serial_legacy(path: str) -> str:
+    """旧实现：逐页串行提取并用字符串拼接"""
+    text = ""
+    with open(path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+    return text.strip()
+
+
+def main():
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    worker_counts = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [2, 4, os.cpu_count() or 4]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "benchmark.pdf")
+        build_pdf(path, page_count)
+        print(f"📊 PDF提取基准: {page_count} 页, {os.path.getsize(path) / 1024 / 1024:.1f} MB, CPU {os.cpu_count()} 核")
+
+        started = time.perf_counter()
+        expected = extract_serial_legacy(path)
+        baseline = time.perf_counter() - started
+        print(f"  串行（旧实现）: {baseline:.2f}s")
+
+        processor = FileProcessor()
+        settings.PDF_PARALLEL_MIN_PAGES = 1
+        for workers in sorted(set(worker_counts)):
+            settings.PDF_EXTRACT_WORKERS = workers
+            shutdown_pdf_executor()
+            started = time.perf_counter()
+            text = processor.extract_text(path)
+            elapsed = time.perf_counter() - started
+            status = "一致" if text == expected else "不一致"
+            effective = min(workers, os.cpu_count() or 1)
+            print(f"  并行 {workers} 进程（实际 {effective}）: {elapsed:.2f}s, 加速 {baseline / elapsed:.2f}x, 结果{status}")
+
+        pages = list(processor.iter_pdf_pages(path))
+        in_order = [number for number, _ in pages] == list(range(1, page_count + 1))
+        print(f"  页码顺序: {'正确' if in_order else '错误'}")
+        shutdown_pdf_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+向量集合迁移脚本
+
+把旧版本创建的集合（没有 owner_id / chunk_hash 字段）复制到按 owner_id
+分区的新集合：逐个文档读出旧集合中的向量，补齐所有者与文本块哈希后写入新集合。
+新集合不保存文本，尚未写入文本块表的文档会用旧集合中的文本回填 document_chunks。
+数据库中已不存在的文档的向量不会被迁移。使用 --swap 时迁移完成后把旧集合重命名
+为备份、新集合重命名为配置中的集合名；不使用时可先检查新集合再手动切换。
+最终落盘失败时不会切换集合。正在运行的服务进程缓存了旧集合的字段结构，
+切换后必须重启服务，否则写入与检索仍按旧结构进行。
+
+用法:
+    python migrate_vector_collection.py [--target documents_v2] [--swap]
+"""
+import argparse
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import Document, DocumentChunk
+from app.services.vector_service import MilvusService, Collection, utility, MAX_QUERY_RESULTS
+from app.services.document_service import _chunk_mapping
+from app.utils.compression import decompress_text
+from app.utils.text_chunker import ChunkSpan, approximate_token_count
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_dimension(collection) -> int:
+    """读取旧集合的向量维度"""
+    for field in collection.schema.fields:
+        if field.name == "embedding":
+            return field.params["dim"]
+    raise ValueError("Collection has no embedding field")
+
+
+def iter_document_rows(collection, document_id: int, max_chunk_id: int, output_fields):
+    """按 chunk_id 区间分页读出文档的全部向量行（单次查询结果有上限）
+
+    max_chunk_id 为已知的最大文本块编号（vector_count 可能与集合中的实际行数不符），
+    扫描过该编号后遇到第一个空区间即结束。
+    """
+    start = 0
+    while True:
+        rows = collection.query(
+            expr=f"document_id == {document_id} and chunk_id >= {start} and chunk_id < {start + MAX_QUERY_RESULTS}",
+            output_fields=output_fields,
+            limit=MAX_QUERY_RESULTS,
+            consistency_level="Strong"
+        )
+        if not rows:
+            if start > max_chunk_id:
+                return
+        else:
+            rows.sort(key=lambda row: row["chunk_id"])
+            yield rows
+        start += MAX_QUERY_RESULTS
+
+
+def load_chunk_texts(db, document_id: int):
+    """读取文本块表中文档的全部文本：chunk_id -> 文本"""
+    rows = (
+        db.query(DocumentChunk.chunk_id, DocumentChunk.compression, DocumentChunk.content)
+        .filter(DocumentChunk.document_id == document_id)
+    )
+    return {row.chunk_id: decompress_text(row.content, row.compression) for row in rows}
+
+
+def backfill_chunks(db, document_id: int, rows, ordinal_start: int, content: str):
+    """用旧集合中的文本回填文本块表，字符位置在文档全文中查找（找不到时为空）"""
+    mappings, cursor = [], 0
+    for ordinal, row in enumerate(rows, start=ordinal_start):
+        start = content.find(row["content"], cursor)
+        if start < 0:
+            start = content.find(row["content"])
+        if start >= 0:
+            cursor = start + 1
+            span = ChunkSpan(row["content"], start, start + len(row["content"]), approximate_token_count(row["content"]))
+        else:
+            span = ChunkSpan(row["content"], None, None, approximate_token_count(row["content"]))
+        mappings.append(_chunk_mapping(document_id, row["chunk_id"], ordinal, span))
+    db.bulk_insert_mappings(DocumentChunk, mappings)
+
+
+def migrate(target_name: str, batch_size: int, swap: bool) -> bool:
+    """迁移全部文档的向量到新集合"""
+    source_name = settings.MILVUS_COLLECTION_NAME
+    target = MilvusService()
+    target.collection_name = target_name
+    # 迁移脚本直接写入，不经过写缓冲
+    target.write_buffer = None
+
+    if not target.connect():
+        logger.error("无法连接到Milvus数据库")
+        return False
+    if not utility.has_collection(source_name):
+        logger.error(f"集合 {source_name} 不存在")
+        return False
+    if utility.has_collection(target_name):
+        logger.error(f"目标集合 {target_name} 已存在，请先删除或指定其他名称")
+        return False
+
+    source = Collection(source_name)
+    source.load()
+    if not target.create_collection(get_dimension(source)):
+        logger.error("创建目标集合失败")
+        return False
+
+    source_fields = {field.name for field in source.schema.fields}
+    output_fields = [name for name in ("chunk_id", "content", "embedding", "metadata") if name in source_fields]
+
+    db = SessionLocal()
+    try:
+        documents = db.query(Document.id, Document.owner_id, Document.vector_count).order_by(Document.id).all()
+        total = 0
+        for index, (document_id, owner_id, vector_count) in enumerate(documents, start=1):
+            chunk_texts = load_chunk_texts(db, document_id)
+            needs_backfill = not chunk_texts and "content" in source_fields
+            if needs_backfill:
+                content = db.query(Document.content).filter(Document.id == document_id).scalar() or ""
+            ordinal = 0
+            max_chunk_id = max(max(chunk_texts, default=-1), (vector_count or 0) - 1)
+            for rows in iter_document_rows(source, document_id, max_chunk_id, output_fields):
+                if "content" not in source_fields:
+                    missing = [row["chunk_id"] for row in rows if row["chunk_id"] not in chunk_texts]
+                    if missing:
+                        logger.warning(f"文档 {document_id} 的 {len(missing)} 个向量在文本块表中没有文本，已跳过")
+                        rows = [row for row in rows if row["chunk_id"] in chunk_texts]
+                    for row in rows:
+                        row["content"] = chunk_texts[row["chunk_id"]]
+                if needs_backfill:
+                    backfill_chunks(db, document_id, rows, ordinal, content)
+                    ordinal += len(rows)
+                for offset in range(0, len(rows), batch_size):
+                    batch = rows[offset:offset + batch_size]
+                    if not target.insert_vectors(
+                        document_id=document_id,
+                        chunks=[row["content"] for row in batch],
+                        embeddings=np.asarray([row["embedding"] for row in batch], dtype=np.float32),
+                        metadata=[row.get("metadata", "") for row in batch],
+                        chunk_ids=[row["chunk_id"] for row in batch],
+                        flush=False,
+                        owner_id=owner_id
+                    ):
+                        logger.error(f"写入文档 {document_id} 的向量失败")
+                        return False
+                    total += len(batch)
+            db.commit()
+            if index % 100 == 0:
+                logger.info(f"已迁移 {index}/{len(documents)} 个文档，{total} 个向量")
+        if not target.flush():
+            logger.error("新集合落盘失败，未切换集合")
+            return False
+        logger.info(f"迁移完成：{len(documents)} 个文档，{total} 个向量")
+    finally:
+        db.close()
+
+    if swap:
+        backup_name = f"{source_name}_backup_{int(time.time())}"
+        source.release()
+        utility.rename_collection(source_name, backup_name)
+        utility.rename_collection(target_name, source_name)
+        logger.info(f"已将 {source_name} 重命名为 {backup_name}，{target_name} 重命名为 {source_name}")
+        logger.warning("正在运行的服务仍缓存旧集合的字段结构，请重启服务后再写入或检索")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="迁移向量集合到按 owner_id 分区的新结构")
+    parser.add_argument("--target", default=f"{settings.MILVUS_COLLECTION_NAME}_v2", help="新集合名称")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_INSERT_BATCH_SIZE, help="每次写入的向量数")
+    parser.add_argument("--swap", action="store_true", help="迁移完成后用新集合替换旧集合")
+    args = parser.parse_args()
+
+    try:
+        success = migrate(args.target, args.batch_size, args.swap)
+    except Exception as e:
+        logger.error(f"迁移向量集合失败: {e}")
+        success = False
+
+    if success:
+        print("✅ 向量集合迁移成功")
+    else:
+        print("❌ 向量集合迁移失败")
+        sys.exit(1)
@@ -9,11 +9,33 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app.services.vector_service import milvus_service
 from app.services.embedding_service import embedding_service
 from app.schemas.document import DocumentSearchRequest
+from app.core.database import SessionLocal
+from app.models.document_chunk import DocumentChunk
+from app.utils.compression import decompress_text
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+TEST_DOCUMENT_ID = 999
+
+def chunk_content(result, test_documents):
+    """检索命中的文本；新集合不保存文本（content为None），从测试数据或 document_chunks 表获取"""
+    if result.get("content") is not None:
+        return result["content"]
+    if result["document_id"] == TEST_DOCUMENT_ID:
+        return test_documents[result["chunk_id"]]
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(DocumentChunk.compression, DocumentChunk.content)
+            .filter(DocumentChunk.document_id == result["document_id"], DocumentChunk.chunk_id == result["chunk_id"])
+            .first()
+        )
+        return decompress_text(row.content, row.compression) if row else ""
+    finally:
+        db.close()
+
 def test_vector_search():
     """测试向量搜索功能"""
     try:
@@ -40,7 +62,7 @@ def test_vector_search():
         # 插入测试数据
         logger.info("插入测试数据到Milvus...")
         success = milvus_service.insert_vectors(
-            document_id=999,  # 测试文档ID
+            document_id=TEST_DOCUMENT_ID,
             chunks=test_documents,
             embeddings=embeddings,
             metadata=[f"test_chunk_{i}" for i in range(len(test_documents))]
@@ -73,7 +95,7 @@ def test_vector_search():
             
             logger.info(f"找到 {len(results)} 个相关结果:")
             for i, result in enumerate(results, 1):
-                logger.info(f"  {i}. 分数: {result['score']:.3f} - {result['content'][:50]}...")
+                logger.info(f"  {i}. 分数: {result['score']:.3f} - {chunk_content(result, test_documents)[:50]}...")
         
         # 测试重排序
         logger.info("\n测试重排序功能...")
@@ -90,7 +112,7 @@ def test_vector_search():
         
         # 清理测试数据
         logger.info("\n清理测试数据...")
-        milvus_service.delete_document_vectors(999)
+        milvus_service.delete_document_vectors(TEST_DOCUMENT_ID)
         
         logger.info("向量搜索功能测试完成！")
         return True